@@ -0,0 +1,145 @@
+"""
+Document download memory benchmark
+Compares peak memory of parsing a PDF via a NamedTemporaryFile path with parsing it from a spooled download stream
+
+Each mode runs in a fresh process so its peak RSS is its own. The temp
+file is reported separately: on Cloud Functions /tmp is an in-memory
+filesystem, so it counts against the instance's memory limit even though
+it is not part of the process's RSS.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_blob_download
+    python -m backend.benchmarks.bench_blob_download --pages 50 --dpi 150 --json
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+from typing import Any, Dict
+
+DEFAULT_SPOOL_MAX_MB = 32
+CHUNK_SIZE = 1024 * 1024
+
+class LocalBlob:
+    """Stands in for a storage Blob, streaming a local file in chunks like the client does"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def download_to_file(self, file_obj):
+        with open(self.path, 'rb') as source:
+            shutil.copyfileobj(source, file_obj, CHUNK_SIZE)
+
+    def download_to_filename(self, filename: str):
+        with open(filename, 'wb') as file_obj:
+            self.download_to_file(file_obj)
+
+def make_scanned_pdf(path: str, pages: int, dpi: int):
+    """A ``pages`` page PDF of letter-size noise images, which compress about as badly as real scans"""
+    from PIL import Image
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    pdf = canvas.Canvas(path, pagesize=letter)
+    rng = random.Random(0)
+    for number in range(pages):
+        image = Image.frombytes('L', (width, height), rng.randbytes(width * height))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=60)
+        buffer.seek(0)
+        pdf.drawImage(ImageReader(buffer), 0, 0, *letter)
+        pdf.drawString(72, 72, f"Page {number + 1}")
+        pdf.showPage()
+    pdf.save()
+
+def _peak_rss_bytes() -> int:
+    # ru_maxrss survives fork and exec, so a spawned child would report the parent's peak;
+    # VmHWM belongs to the child's own address space
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def _extract(reader) -> int:
+    return sum(len(page.extract_text() or '') for page in reader.pages)
+
+def _run_mode(mode: str, pdf_path: str, spool_max_bytes: int, results):
+    from PyPDF2 import PdfReader
+
+    blob = LocalBlob(pdf_path)
+    baseline = _peak_rss_bytes()
+    temp_bytes = 0
+    if mode == 'tempfile':
+        # The previous path: download to a named temp file, then parse it by name
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+            blob.download_to_filename(temp_file.name)
+            temp_bytes = os.path.getsize(temp_file.name)
+            characters = _extract(PdfReader(temp_file.name))
+            os.unlink(temp_file.name)
+    else:
+        with tempfile.SpooledTemporaryFile(max_size=spool_max_bytes) as buffer:
+            blob.download_to_file(buffer)
+            if buffer._rolled:
+                temp_bytes = buffer.tell()
+            buffer.seek(0)
+            characters = _extract(PdfReader(buffer))
+    results.put({
+        'mode': mode,
+        'baseline_rss_mb': baseline / 2 ** 20,
+        'peak_rss_mb': _peak_rss_bytes() / 2 ** 20,
+        'temp_file_mb': temp_bytes / 2 ** 20,
+        'characters': characters
+    })
+
+def run(pages: int, dpi: int, spool_max_bytes: int) -> Dict[str, Any]:
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = os.path.join(workdir, 'scan.pdf')
+        make_scanned_pdf(pdf_path, pages, dpi)
+        report: Dict[str, Any] = {'pages': pages, 'pdf_mb': os.path.getsize(pdf_path) / 2 ** 20, 'modes': []}
+        for mode in ('tempfile', 'spooled'):
+            results = context.Queue()
+            process = context.Process(target=_run_mode, args=(mode, pdf_path, spool_max_bytes, results))
+            process.start()
+            report['modes'].append(results.get())
+            process.join()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=50, help='Pages in the synthetic scan')
+    parser.add_argument('--dpi', type=int, default=150, help='Scan resolution')
+    parser.add_argument('--spool-max-mb', type=int, default=DEFAULT_SPOOL_MAX_MB, help='In-memory download limit')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    report = run(args.pages, args.dpi, args.spool_max_mb * 2 ** 20)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['pages']} pages, {report['pdf_mb']:.1f} MB")
+    print(f"{'mode':>10} {'peak RSS MB':>12} {'+ temp MB':>10} {'footprint MB':>13}")
+    for row in report['modes']:
+        print(
+            f"{row['mode']:>10} {row['peak_rss_mb']:>12.1f} {row['temp_file_mb']:>10.1f} "
+            f"{row['peak_rss_mb'] + row['temp_file_mb']:>13.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
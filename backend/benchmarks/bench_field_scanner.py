@@ -0,0 +1,115 @@
+"""
+Field extraction micro-benchmark
+Compares TaxDocumentParser's single-pass FieldScanner with one re.search per pattern
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_field_scanner
+    python -m backend.benchmarks.bench_field_scanner --size-mb 1 --number 5 --json
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import timeit
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# The Cloud Functions source imports its modules as top-level siblings
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'parser', 'functions'))
+
+from parser import TaxDocumentParser  # noqa: E402
+
+FILLER = [
+    'Proceeds from broker and barter exchange transactions 1,204.33 ',
+    'Cost basis reported to the IRS 980.10 Wash sale loss disallowed 0.00 ',
+    'Federal income tax withheld 0.00 State tax withheld 0.00 ',
+    'Ordinary dividends 14.27 Qualified dividends 12.90 ',
+    '\n'
+]
+
+LABELS = [
+    'Taxpayer Name: Jane Q Public ', 'SSN: 123-45-6789 ', 'Total Income: $61,250.75 ',
+    'Total Tax: $7,100.00 ', 'Tax Year: 2023 ', 'Filing Status: Single '
+]
+
+def make_corpus(size_bytes: int, labels_at: str) -> str:
+    """Statement-like filler with the field labels at the top, the bottom or nowhere"""
+    rng = random.Random(0)
+    parts: List[str] = []
+    length = 0
+    while length < size_bytes:
+        part = rng.choice(FILLER)
+        parts.append(part)
+        length += len(part)
+    body = ''.join(parts)
+    labels = ''.join(LABELS)
+    if labels_at == 'top':
+        return labels + body
+    if labels_at == 'bottom':
+        return body + labels
+    return body
+
+def pick_best(parser: TaxDocumentParser, matches: Iterable[Optional[re.Match]]) -> Tuple[Optional[re.Match], float]:
+    """The previous parse_data choice: highest-confidence match, the earliest pattern winning ties"""
+    best_match = None
+    best_confidence = 0
+    for match in matches:
+        if match:
+            confidence = parser._calculate_confidence(match)
+            if confidence > best_confidence:
+                best_match = match
+                best_confidence = confidence
+    return best_match, best_confidence
+
+def legacy_fields(parser: TaxDocumentParser, text: str) -> Dict[str, Any]:
+    """The previous parse_data loop: one re.search over the whole text per pattern"""
+    return {
+        field: pick_best(parser, (re.search(pattern, text) for pattern in patterns))
+        for field, patterns in parser.PATTERNS.items()
+    }
+
+def scanner_fields(parser: TaxDocumentParser, text: str) -> Dict[str, Any]:
+    matches = parser.field_scanner().first_matches(text)
+    return {field: pick_best(parser, field_matches) for field, field_matches in matches.items()}
+
+def _summary(fields: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: (match.span(), confidence) if match else None for field, (match, confidence) in fields.items()}
+
+def run(size_bytes: int, number: int) -> List[Dict[str, Any]]:
+    parser = TaxDocumentParser('unused.pdf')
+    rows = []
+    for labels_at in ('top', 'bottom', 'absent'):
+        text = make_corpus(size_bytes, labels_at)
+        if _summary(legacy_fields(parser, text)) != _summary(scanner_fields(parser, text)):
+            raise AssertionError(f"Scanner and per-pattern results differ with labels {labels_at}")
+        rows.append({
+            'labels': labels_at,
+            'text_bytes': len(text),
+            'legacy_ms': timeit.timeit(lambda: legacy_fields(parser, text), number=number) / number * 1e3,
+            'scanner_ms': timeit.timeit(lambda: scanner_fields(parser, text), number=number) / number * 1e3
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=1.0, help='Corpus size in MB')
+    parser.add_argument('--number', type=int, default=5, help='Calls per measurement')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    rows = run(int(args.size_mb * 2 ** 20), args.number)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'labels':>8} {'text B':>9} {'search ms':>10} {'scanner ms':>11} {'speedup':>8}")
+    for row in rows:
+        print(
+            f"{row['labels']:>8} {row['text_bytes']:>9} {row['legacy_ms']:>10.2f} "
+            f"{row['scanner_ms']:>11.2f} {row['legacy_ms'] / row['scanner_ms']:>7.1f}x"
+        )
+
+if __name__ == "__main__":
+    main()
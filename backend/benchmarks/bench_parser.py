@@ -0,0 +1,249 @@
+"""
+Parser throughput benchmark
+Runs TaxDocumentParser and DocumentProcessingProcessor._process_pdf over a synthetic W-2/1099/1040 corpus
+
+Each target runs in a fresh process so its peak RSS is its own. The report
+gives docs/sec, pages/sec, p50/p95 latency per document and peak RSS; save
+it with --output and compare against the previous run in review.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_parser
+    python -m backend.benchmarks.bench_parser --documents 200 --pages 1 3 10 40 --json
+    python -m backend.benchmarks.bench_parser --targets parser --output parser-bench.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from backend.benchmarks.bench_blob_download import _peak_rss_bytes
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(__file__), '..', 'parser', 'functions')
+
+DEFAULT_PAGE_COUNTS = [1, 2, 5, 20]
+TARGETS = ('parser', 'processor')
+KINDS = ('W-2', '1099-INT', '1099-NEC', '1040')
+
+INSTRUCTIONS = (
+    'Instructions for Recipient. This information is being furnished to the IRS. If you are required to file a '
+    'return, a negligence penalty or other sanction may be imposed on you if this income is taxable and the IRS '
+    'determines that it has not been reported. Keep this copy for your records.'
+)
+
+def _money(rng: random.Random, low: int, high: int) -> str:
+    return f"{rng.randint(low, high) + rng.randint(0, 99) / 100:,.2f}"
+
+def _ssn(rng: random.Random) -> str:
+    return f"{rng.randint(100, 899)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}"
+
+def _ein(rng: random.Random) -> str:
+    return f"{rng.randint(10, 99)}-{rng.randint(1000000, 9999999)}"
+
+def _boxes(kind: str, rng: random.Random) -> List[tuple]:
+    """Rows of (left label, left value, right label, right value) for an information return"""
+    wages = _money(rng, 20000, 250000)
+    if kind == 'W-2':
+        return [
+            ("a Employee's social security number", _ssn(rng),
+             'b Employer identification number (EIN)', _ein(rng)),
+            ('1 Wages, tips, other compensation', wages, '2 Federal income tax withheld', _money(rng, 1000, 40000)),
+            ('3 Social security wages', wages, '4 Social security tax withheld', _money(rng, 1000, 10000)),
+            ('5 Medicare wages and tips', wages, '6 Medicare tax withheld', _money(rng, 300, 4000)),
+            ('15 State', rng.choice(['CA', 'NY', 'MA', 'WA']), '16 State wages, tips, etc.', wages),
+            ('17 State income tax', _money(rng, 500, 15000), '20 Locality name', 'SPRINGFIELD'),
+        ]
+    tins = ("PAYER'S TIN", _ein(rng), "RECIPIENT'S TIN", f"XXX-XX-{rng.randint(1000, 9999)}")
+    if kind == '1099-INT':
+        return [
+            tins,
+            ('1 Interest income', _money(rng, 10, 9000), '2 Early withdrawal penalty', '0.00'),
+            ('3 Interest on U.S. Savings Bonds and Treasury obligations', _money(rng, 0, 500),
+             '4 Federal income tax withheld', _money(rng, 0, 900)),
+        ]
+    return [
+        tins,
+        ('1 Nonemployee compensation', _money(rng, 600, 90000), '4 Federal income tax withheld', _money(rng, 0, 9000)),
+    ]
+
+def make_document(path: str, kind: str, pages: int, seed: int):
+    """A ``pages`` page PDF of ``kind``: the form or return on page 1, then text pages"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(seed)
+    pdf = canvas.Canvas(path, pagesize=letter)
+    if kind == '1040':
+        lines = [
+            'Form 1040 U.S. Individual Income Tax Return',
+            f"Taxpayer Name: Jane {rng.choice('ABCDEFG')} Public",
+            f"SSN: {rng.randint(100, 899)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}",
+            f"Total Income: ${_money(rng, 20000, 250000)}",
+            f"Balance Due: ${_money(rng, 0, 5000)}",
+            'Tax Year: 2023',
+            'Filing Status: Single',
+        ]
+        for row, line in enumerate(lines):
+            pdf.drawString(72, 720 - 16 * row, line)
+    else:
+        pdf.setFont('Helvetica-Bold', 12)
+        title = {'W-2': 'Form W-2 Wage and Tax Statement 2023', '1099-INT': 'Form 1099-INT Interest Income',
+                 '1099-NEC': 'Form 1099-NEC Nonemployee Compensation'}[kind]
+        pdf.drawString(40, 750, title)
+        for row, (left_label, left_value, right_label, right_value) in enumerate(_boxes(kind, rng)):
+            y = 720 - row * 36
+            for x, label, value in ((40, left_label, left_value), (300, right_label, right_value)):
+                pdf.setFont('Helvetica', 7)
+                pdf.drawString(x, y, label)
+                pdf.setFont('Helvetica', 10)
+                pdf.drawString(x + 6, y - 14, value)
+    pdf.showPage()
+
+    for number in range(2, pages + 1):
+        pdf.setFont('Helvetica', 9)
+        for row in range(45):
+            pdf.drawString(54, 740 - 15 * row, f"{INSTRUCTIONS[(row * 37) % len(INSTRUCTIONS):][:100]} ({number})")
+        pdf.showPage()
+    pdf.save()
+
+def make_corpus(directory: str, documents: int, page_counts: List[int], seed: int = 0) -> List[Dict[str, Any]]:
+    """``documents`` PDFs cycling through every form kind and page count"""
+    corpus = []
+    for index in range(documents):
+        kind = KINDS[index % len(KINDS)]
+        pages = page_counts[(index // len(KINDS)) % len(page_counts)]
+        path = os.path.join(directory, f"{index:05d}-{kind}-{pages}p.pdf")
+        make_document(path, kind, pages, seed + index)
+        corpus.append({'path': path, 'kind': kind, 'pages': pages})
+    return corpus
+
+def _percentile(samples: List[float], p: int) -> float:
+    # Nearest rank, as WaitTimeTracker.percentiles reports queue waits
+    ordered = sorted(samples)
+    rank = max(1, -(-p * len(ordered) // 100))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def _parse_with_parser(path: str) -> Dict[str, Any]:
+    # What parse_document does on a cache miss
+    from parser import TaxDocumentParser
+
+    parser = TaxDocumentParser(path)
+    result = parser.parse_incremental()
+    result.update(parser.parse_form())
+    return result
+
+def _parse_with_processor(path: str) -> Dict[str, Any]:
+    from backend.queue.task_processors import DocumentProcessingProcessor
+
+    class LocalProcessor(DocumentProcessingProcessor):
+        # Only _process_pdf is exercised, which needs neither Firestore nor Storage
+        def __init__(self):
+            pass
+
+    with open(path, 'rb') as stream:
+        metadata, _ = LocalProcessor()._process_pdf(stream)
+    return metadata
+
+def _pages_extracted(result: Dict[str, Any]) -> int:
+    """Pages a parse actually read; an incremental parse stops once every field is found"""
+    # The parser nests its page stats under 'metadata'; the processor returns the metadata itself
+    return len(result.get('metadata', result).get('pages', []))
+
+def _run_target(target: str, corpus: List[Dict[str, Any]], results):
+    import logging
+
+    sys.path.insert(0, FUNCTIONS_DIR)
+    # The parser sets up INFO logging on import and logs every field it looks for
+    import parser  # noqa: F401
+    logging.getLogger().setLevel(logging.ERROR)
+    parse = _parse_with_parser if target == 'parser' else _parse_with_processor
+    # Warm up, so imports and first-call setup are not timed
+    parse(corpus[0]['path'])
+
+    latencies = []
+    failures = 0
+    pages = 0
+    started = time.perf_counter()
+    for document in corpus:
+        document_started = time.perf_counter()
+        result = parse(document['path'])
+        latencies.append(time.perf_counter() - document_started)
+        if not result:
+            failures += 1
+        pages += _pages_extracted(result)
+    seconds = time.perf_counter() - started
+
+    results.put({
+        'target': target,
+        'documents': len(corpus),
+        'failures': failures,
+        'seconds': seconds,
+        'docs_per_second': len(corpus) / seconds,
+        'pages_extracted': pages,
+        'pages_per_second': pages / seconds,
+        'p50_ms': _percentile(latencies, 50) * 1e3,
+        'p95_ms': _percentile(latencies, 95) * 1e3,
+        'peak_rss_mb': _peak_rss_bytes() / 2 ** 20
+    })
+
+def run(documents: int, page_counts: List[int], targets: List[str], seed: int = 0) -> Dict[str, Any]:
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus = make_corpus(workdir, documents, page_counts, seed)
+        report: Dict[str, Any] = {
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'corpus': {
+                'documents': len(corpus),
+                'pages': sum(document['pages'] for document in corpus),
+                'page_counts': page_counts,
+                'mb': sum(os.path.getsize(document['path']) for document in corpus) / 2 ** 20,
+                'seed': seed
+            },
+            'targets': []
+        }
+        for target in targets:
+            results = context.Queue()
+            process = context.Process(target=_run_target, args=(target, corpus, results))
+            process.start()
+            report['targets'].append(results.get())
+            process.join()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=80, help='Documents in the synthetic corpus')
+    parser.add_argument(
+        '--pages', type=int, nargs='+', default=DEFAULT_PAGE_COUNTS, help='Page counts to cycle through'
+    )
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS), help='What to run')
+    parser.add_argument('--seed', type=int, default=0, help='Corpus seed')
+    parser.add_argument('--output', default=None, help='Also write the JSON report to this file')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    report = run(args.documents, args.pages, args.targets, args.seed)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    corpus = report['corpus']
+    print(f"{corpus['documents']} documents, {corpus['pages']} pages, {corpus['mb']:.1f} MB")
+    print(f"{'target':>10} {'docs/sec':>9} {'pages/sec':>10} {'p50 ms':>8} {'p95 ms':>8} {'peak RSS MB':>12}")
+    for row in report['targets']:
+        print(
+            f"{row['target']:>10} {row['docs_per_second']:>9.1f} {row['pages_per_second']:>10.1f} "
+            f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['peak_rss_mb']:>12.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Task serialization micro-benchmark
+Compares the generated Task codec with the previous asdict-based to_dict/from_dict
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_task_codec
+    python -m backend.benchmarks.bench_task_codec --sizes 1024 65536 --number 200
+"""
+
+import argparse
+import json
+import timeit
+from dataclasses import asdict
+from datetime import datetime
+from typing import Any, Dict, List
+
+from backend.queue.task_manager import DATETIME_FIELDS, Task, TaskPriority, TaskStatus, TaskType
+
+DEFAULT_SIZES = [1024, 16 * 1024, 128 * 1024, 1024 * 1024]
+
+def legacy_to_dict(task: Task) -> Dict[str, Any]:
+    """The previous Task.to_dict: asdict deep copy, then field-by-field rewrites"""
+    data = asdict(task)
+    data['type'] = task.type.value
+    data['status'] = task.status.value
+    data['priority'] = task.priority.value
+    for field in DATETIME_FIELDS:
+        if data[field]:
+            data[field] = data[field].isoformat()
+    return data
+
+def legacy_from_dict(data: Dict[str, Any]) -> Task:
+    """The previous Task.from_dict, which converted ``data`` in place"""
+    data['type'] = TaskType(data['type'])
+    data['status'] = TaskStatus(data['status'])
+    data['priority'] = TaskPriority(data['priority'])
+    for field in DATETIME_FIELDS:
+        if data.get(field):
+            data[field] = datetime.fromisoformat(data[field])
+    return Task(**data)
+
+def make_payload(size_bytes: int) -> Dict[str, Any]:
+    """A document-processing style payload of roughly ``size_bytes`` of JSON"""
+    payload: Dict[str, Any] = {'document_id': 'doc_1', 'user_id': 'user_123', 'pages': []}
+    page = {'number': 0, 'text': 'Wages, tips, other compensation 52,000.00 ' * 4, 'boxes': list(range(20))}
+    page_size = len(json.dumps(page))
+    for number in range(max(1, size_bytes // page_size)):
+        payload['pages'].append(dict(page, number=number))
+    return payload
+
+def make_task(payload: Dict[str, Any]) -> Task:
+    now = datetime.now()
+    return Task(
+        id='task_1',
+        type=TaskType.DOCUMENT_PROCESSING,
+        status=TaskStatus.IN_PROGRESS,
+        priority=TaskPriority.HIGH,
+        user_id='user_123',
+        payload=payload,
+        created_at=now,
+        updated_at=now,
+        scheduled_at=now,
+        started_at=now,
+        worker_id='worker-a',
+        lease_expires_at=now
+    )
+
+def run(sizes: List[int], number: int) -> List[Dict[str, Any]]:
+    rows = []
+    for size in sizes:
+        task = make_task(make_payload(size))
+        encoded = task.to_dict()
+        # The legacy decoder mutates its input, so it gets a fresh shallow copy each call
+        timings = {
+            'legacy_to_dict': timeit.timeit(lambda: legacy_to_dict(task), number=number),
+            'codec_to_dict': timeit.timeit(lambda: task.to_dict(), number=number),
+            'legacy_from_dict': timeit.timeit(lambda: legacy_from_dict(dict(encoded)), number=number),
+            'codec_from_dict': timeit.timeit(lambda: Task.from_dict(encoded), number=number)
+        }
+        row = {'payload_bytes': len(json.dumps(task.payload))}
+        row.update({name: seconds / number * 1e6 for name, seconds in timings.items()})
+        rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Payload sizes in bytes')
+    parser.add_argument('--number', type=int, default=100, help='Calls per measurement')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    rows = run(args.sizes, args.number)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(
+        f"{'payload B':>10} {'to_dict µs':>12} {'codec':>8} {'speedup':>8} "
+        f"{'from_dict µs':>13} {'codec':>8} {'speedup':>8}"
+    )
+    for row in rows:
+        print(
+            f"{row['payload_bytes']:>10} "
+            f"{row['legacy_to_dict']:>12.1f} {row['codec_to_dict']:>8.1f} "
+            f"{row['legacy_to_dict'] / row['codec_to_dict']:>7.1f}x "
+            f"{row['legacy_from_dict']:>13.1f} {row['codec_from_dict']:>8.1f} "
+            f"{row['legacy_from_dict'] / row['codec_from_dict']:>7.1f}x"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Batch parsing for backfills
+Parses a directory or JSONL manifest of PDFs on a process pool, writing JSONL or Parquet with resumable checkpoints
+
+Run from this directory:
+    python batch.py /data/pdfs --output parsed.jsonl
+    python batch.py manifest.jsonl --output parsed --format parquet --workers 8
+
+A manifest line is {"path": "...", "id": "..."}; ``id`` defaults to the path.
+Re-running the same command after a crash skips documents already written.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Results held in memory before they are written out and checkpointed
+DEFAULT_FLUSH_EVERY = 500
+
+@dataclass
+class BatchStats:
+    parsed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def docs_per_second(self) -> float:
+        done = self.parsed + self.failed
+        return done / self.seconds if self.seconds else 0.0
+
+def iter_documents(input_path: str) -> Iterator[Dict[str, str]]:
+    """Documents to parse, as {'id', 'path'}, from a directory tree of PDFs or a JSONL manifest"""
+    if os.path.isdir(input_path):
+        for root, dirs, files in os.walk(input_path):
+            # Sorted so every run, including a resumed one, sees the same order
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith('.pdf'):
+                    path = os.path.join(root, name)
+                    yield {'id': os.path.relpath(path, input_path), 'path': path}
+        return
+
+    with open(input_path) as manifest:
+        for line_number, line in enumerate(manifest, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if 'path' not in entry:
+                raise ValueError(f"Manifest line {line_number} has no path")
+            yield {'id': str(entry.get('id', entry['path'])), 'path': entry['path']}
+
+def parse_file(document: Dict[str, str]) -> Dict[str, Any]:
+    """Parse one document; failures are returned as an ``error`` instead of raised"""
+    from parser import TaxDocumentParser
+
+    started = time.perf_counter()
+    result: Dict[str, Any] = {'id': document['id'], 'path': document['path']}
+    try:
+        parser = TaxDocumentParser(document['path'])
+        result['result'] = parser.parse_incremental()
+        result['result'].update(parser.parse_form())
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+class Checkpoint:
+    """Append-only log of flushed chunks, written after each chunk's results are durable.
+
+    Each line records the ids in a chunk and where the output stood once
+    it was written: the JSONL byte offset or the Parquet part count. On
+    resume the output is cut back to the last recorded position, so a
+    crash mid-chunk neither loses nor repeats results.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        self.position = 0
+        if os.path.exists(path):
+            with open(path) as log:
+                for line in log:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line was cut off by the crash; its chunk is redone
+                        break
+                    self.done.update(entry['ids'])
+                    self.position = entry['position']
+
+    def record(self, ids: List[str], position: int):
+        with open(self.path, 'a') as log:
+            log.write(json.dumps({'ids': ids, 'position': position}) + '\n')
+            log.flush()
+            os.fsync(log.fileno())
+        self.done.update(ids)
+        self.position = position
+
+class JsonlWriter:
+    """Results appended to one JSONL file; the position is its size in bytes"""
+
+    def __init__(self, path: str, position: int):
+        self.path = path
+        self._file = open(path, 'r+b' if os.path.exists(path) else 'wb')
+        self._file.truncate(position)
+        self._file.seek(position)
+
+    def write(self, results: List[Dict[str, Any]]) -> int:
+        self._file.write(''.join(json.dumps(result, default=str) + '\n' for result in results).encode())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+class ParquetWriter:
+    """Results written as numbered part files in a directory; the position is the part count.
+
+    Parsed fields vary by document, so each result's fields are stored as
+    one JSON string column rather than a column per field.
+    """
+
+    def __init__(self, directory: str, position: int):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow; install it or use --format jsonl")
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self.directory = directory
+        self.parts = position
+        os.makedirs(directory, exist_ok=True)
+        # Parts written after the last checkpoint belong to a chunk that is redone
+        for name in os.listdir(directory):
+            if name.startswith('part-') and int(name[len('part-'):].split('.')[0]) >= position:
+                os.unlink(os.path.join(directory, name))
+
+    def write(self, results: List[Dict[str, Any]]) -> int:
+        table = self._pyarrow.table({
+            'id': [result['id'] for result in results],
+            'path': [result['path'] for result in results],
+            'seconds': [result['seconds'] for result in results],
+            'error': [result.get('error') for result in results],
+            'result': [json.dumps(result['result'], default=str) if 'result' in result else None for result in results]
+        })
+        path = os.path.join(self.directory, f"part-{self.parts:05d}.parquet")
+        self._parquet.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        self.parts += 1
+        return self.parts
+
+    def close(self):
+        pass
+
+def _init_batch_worker():
+    # The parser configures INFO logging on import, and warns for every field a document lacks;
+    # across a backfill that drowns the output, and failures are in the results anyway
+    import parser  # noqa: F401
+    logging.getLogger().setLevel(logging.ERROR)
+
+def run_batch(
+    documents: Iterable[Dict[str, str]],
+    output: str,
+    output_format: str = 'jsonl',
+    workers: Optional[int] = None,
+    flush_every: int = DEFAULT_FLUSH_EVERY,
+    checkpoint_path: Optional[str] = None
+) -> BatchStats:
+    """Parse ``documents`` on a pool of ``workers`` processes into ``output``.
+
+    At most ``workers * 2`` documents are in flight and ``flush_every``
+    results buffered, so memory stays flat however long the input is.
+    Results are written in completion order. Documents recorded in the
+    checkpoint (``output + '.checkpoint'`` by default) are skipped.
+
+    A document that kills its worker process (a crash in a native
+    library, an out-of-memory kill) breaks the pool and every document in
+    flight with it. Those documents are parsed again one at a time on a
+    fresh pool, so only the one that crashes it again is recorded as
+    failed, and a resumed run does not retry it.
+    """
+    workers = workers or os.cpu_count() or 1
+    checkpoint = Checkpoint(checkpoint_path or f"{output}.checkpoint")
+    if output_format == 'parquet':
+        writer = ParquetWriter(output, checkpoint.position)
+    else:
+        writer = JsonlWriter(output, checkpoint.position)
+
+    stats = BatchStats()
+    started = time.perf_counter()
+    buffered: List[Dict[str, Any]] = []
+
+    def flush():
+        if buffered:
+            checkpoint.record([result['id'] for result in buffered], writer.write(buffered))
+            buffered.clear()
+
+    context = multiprocessing.get_context('spawn')
+    pool = _new_pool(workers, context)
+    pending: Dict[Future, Dict[str, str]] = {}
+
+    def settle(finished: Iterable[Future]):
+        nonlocal pool
+        crashed = []
+        for future in finished:
+            document = pending.pop(future)
+            try:
+                _collect(future.result(), buffered, stats)
+            except BrokenProcessPool:
+                crashed.append(document)
+        if not crashed:
+            return
+
+        # Once broken, the pool fails everything still in flight too
+        for future in wait(list(pending)).done:
+            document = pending.pop(future)
+            try:
+                _collect(future.result(), buffered, stats)
+            except BrokenProcessPool:
+                crashed.append(document)
+        pool.shutdown(wait=True)
+        pool = _new_pool(workers, context)
+        for document in crashed:
+            try:
+                result = pool.submit(parse_file, document).result()
+            except BrokenProcessPool:
+                logger.error(f"Parsing {document['path']} crashed its worker process")
+                result = {
+                    'id': document['id'], 'path': document['path'],
+                    'error': 'BrokenProcessPool: the parser process crashed', 'seconds': 0.0
+                }
+                pool.shutdown(wait=True)
+                pool = _new_pool(workers, context)
+            _collect(result, buffered, stats)
+
+    try:
+        for document in documents:
+            if document['id'] in checkpoint.done:
+                stats.skipped += 1
+                continue
+            if len(pending) >= workers * 2:
+                settle(wait(list(pending), return_when=FIRST_COMPLETED).done)
+                if len(buffered) >= flush_every:
+                    flush()
+            pending[pool.submit(parse_file, document)] = document
+
+        settle(wait(list(pending)).done)
+        flush()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+def _new_pool(workers: int, context) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_batch_worker)
+
+def _collect(result: Dict[str, Any], buffered: List[Dict[str, Any]], stats: BatchStats):
+    buffered.append(result)
+    if 'error' in result:
+        stats.failed += 1
+        logger.warning(f"Failed to parse {result['path']}: {result['error']}")
+    else:
+        stats.parsed += 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help='Directory of PDFs or JSONL manifest')
+    parser.add_argument('--output', required=True, help='JSONL file, or directory of Parquet parts')
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl', help='Output format')
+    parser.add_argument('--workers', type=int, default=None, help='Parser processes (default: CPU count)')
+    parser.add_argument('--flush-every', type=int, default=DEFAULT_FLUSH_EVERY, help='Results per write and checkpoint')
+    parser.add_argument('--checkpoint', default=None, help='Checkpoint file (default: OUTPUT.checkpoint)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    stats = run_batch(
+        iter_documents(args.input), args.output, args.format, args.workers, args.flush_every, args.checkpoint
+    )
+    print(
+        f"Parsed {stats.parsed} documents ({stats.failed} failed, {stats.skipped} already done) "
+        f"in {stats.seconds:.1f}s: {stats.docs_per_second:.1f} docs/sec"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Storage downloads for the parsers
+Shared by the Cloud Functions in main.py and the queue's document processor
+"""
+
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator
+
+# Downloads up to this size stay in memory; larger ones spill to a temp file
+DOWNLOAD_SPOOL_MAX_BYTES = 32 * 1024 * 1024
+
+@contextmanager
+def open_blob(blob, max_size: int = DOWNLOAD_SPOOL_MAX_BYTES) -> Iterator[BinaryIO]:
+    """Stream a blob into a spooled buffer and yield it rewound to the start.
+
+    The buffer stays in memory up to ``max_size`` bytes and spills to a
+    temp file past that. Either way the upload exists once: PdfReader reads
+    from the stream instead of loading a copy of a /tmp file, which on Cloud
+    Functions is itself memory. The buffer is closed, and any spill file
+    removed, when the block exits, including on errors.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=max_size) as buffer:
+        blob.download_to_file(buffer)
+        buffer.seek(0)
+        yield buffer
@@ -0,0 +1,97 @@
+"""
+Single-pass field scanning for TaxDocumentParser
+Every field pattern compiled into one alternation and found in a single left-to-right scan
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+class FieldScanner:
+    """Finds the first match of every field pattern in one pass over the text.
+
+    The patterns are joined into one alternation and the text is searched
+    for it from left to right. Each search stops at the next offset where
+    some pattern matches, and the following search starts one character
+    later, so offsets inside another pattern's match (``Status:`` inside
+    ``Filing Status:``) are still visited. At each offset the patterns
+    still missing are tried with ``match``, and the first success for a
+    pattern is exactly the match ``re.search`` would have returned for it.
+    The scan stops once every pattern has matched.
+
+    Every branch of the alternation starts with a literal label, so the
+    regex engine skips offsets whose first character cannot start any
+    label without trying the branches; a lookahead alternation would lose
+    that and try every branch at every offset.
+
+    Patterns must not use backreferences or inline global flags, which
+    change meaning once the patterns share one expression.
+    """
+
+    def __init__(self, patterns: Dict[str, List[str]]):
+        self.patterns = patterns
+        self._compiled: List[Tuple[str, re.Pattern]] = [
+            (field, re.compile(pattern)) for field, field_patterns in patterns.items() for pattern in field_patterns
+        ]
+        self._combined = re.compile('|'.join(f'(?:{pattern.pattern})' for _, pattern in self._compiled))
+        # Position of each compiled pattern within its field's list
+        self._pattern_index = [index for field_patterns in patterns.values() for index in range(len(field_patterns))]
+
+    def first_matches(
+        self,
+        text: str,
+        start: int = 0,
+        previous: Optional[Dict[str, List[Optional[re.Match]]]] = None
+    ) -> Dict[str, List[Optional[re.Match]]]:
+        """Per field, the first match of each of its patterns in pattern order, None where a pattern has none.
+
+        ``previous`` is an earlier result to carry on from: its matches are
+        kept, and only the patterns it has None for are searched for, from
+        ``start`` on. The caller picks ``start`` so that no match of those
+        patterns can begin before it.
+        """
+
+        if previous is None:
+            found: List[Optional[re.Match]] = [None] * len(self._compiled)
+        else:
+            found = [match for field in self.patterns for match in previous[field]]
+        missing = [index for index, match in enumerate(found) if match is None]
+        hit = self._combined.search(text, start)
+        while hit and missing:
+            position = hit.start()
+            still_missing = []
+            for index in missing:
+                match = self._compiled[index][1].match(text, position)
+                if match:
+                    found[index] = match
+                else:
+                    still_missing.append(index)
+            missing = still_missing
+            hit = self._combined.search(text, position + 1)
+
+        matches: Dict[str, List[Optional[re.Match]]] = {field: [] for field in self.patterns}
+        for (field, _), match in zip(self._compiled, found):
+            matches[field].append(match)
+        return matches
+
+    def all_matches(self, text: str) -> Dict[str, List[Tuple[int, re.Match]]]:
+        """Per field, every match of its patterns as (pattern index, match), in text order.
+
+        The same single scan as first_matches, run to the end of the text.
+        A pattern is not tried again until its last match has ended, so its
+        matches are the ones ``re.finditer`` would give.
+        """
+
+        matches: Dict[str, List[Tuple[int, re.Match]]] = {field: [] for field in self.patterns}
+        resume = [0] * len(self._compiled)
+        hit = self._combined.search(text)
+        while hit:
+            position = hit.start()
+            for index, (field, pattern) in enumerate(self._compiled):
+                if position < resume[index]:
+                    continue
+                match = pattern.match(text, position)
+                if match:
+                    matches[field].append((self._pattern_index[index], match))
+                    resume[index] = max(match.end(), position + 1)
+            hit = self._combined.search(text, position + 1)
+        return matches
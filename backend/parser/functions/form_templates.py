@@ -0,0 +1,256 @@
+"""
+Layout-aware box extraction for information returns
+Maps the positioned text of W-2, 1099-NEC, 1099-INT, 1099-DIV and 1098 forms to typed fields
+"""
+
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+import logging
+
+from PyPDF2 import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# A value sits in its box below the label, within this many points down and across
+BOX_HEIGHT = 26.0
+BOX_WIDTH = 170.0
+# Slack for values indented left of their label or set on the label's own line
+LEFT_SLACK = 12.0
+SAME_LINE_TOLERANCE = 4.0
+# Line pitch, as a multiple of the font size, for the lines of a text run that holds line breaks
+LINE_SPACING = 1.2
+
+VALUE_PATTERNS = {
+    'money': r"\$?\s*(-?\d{1,3}(?:,\d{3})*(?:\.\d{2})?|-?\d+(?:\.\d{2})?)",
+    'ein': r"(\d{2}-\d{7})",
+    'tin': r"(\d{2}-\d{7}|\d{3}-\d{2}-\d{4}|[X*]{3}-[X*]{2}-\d{4})",
+    'ssn': r"(\d{3}-\d{2}-\d{4}|[X*]{3}-[X*]{2}-\d{4})",
+    'state': r"([A-Z]{2})(?:\s+\S+)?",
+    'text': r"(\S.*)",
+}
+
+# Form type -> title patterns that identify it, and (field, box label pattern, value kind) per box.
+# Field names are the ones the accountant and auditor agents read from extractedData.
+FORM_SPECS: Dict[str, Dict[str, Any]] = {
+    'W-2': {
+        'identifiers': [r"Form\s+W-2\b", r"Wage and Tax Statement"],
+        'boxes': [
+            ('employee_ssn', r"(?:a\s+)?Employee'?s social security number", 'ssn'),
+            ('employer_ein', r"(?:b\s+)?Employer identification number", 'ein'),
+            ('wages', r"(?:1\s+)?Wages,\s*tips,\s*other compensation", 'money'),
+            ('federal_tax_withheld', r"(?:2\s+)?Federal income tax withheld", 'money'),
+            ('social_security_wages', r"(?:3\s+)?Social security wages", 'money'),
+            ('social_security_tax_withheld', r"(?:4\s+)?Social security tax withheld", 'money'),
+            ('medicare_wages', r"(?:5\s+)?Medicare wages and tips", 'money'),
+            ('medicare_tax_withheld', r"(?:6\s+)?Medicare tax withheld", 'money'),
+            ('social_security_tips', r"(?:7\s+)?Social security tips", 'money'),
+            ('allocated_tips', r"(?:8\s+)?Allocated tips", 'money'),
+            ('dependent_care_benefits', r"(?:10\s+)?Dependent care benefits", 'money'),
+            ('nonqualified_plans', r"(?:11\s+)?Nonqualified plans", 'money'),
+            ('state', r"(?:15\s+)?State\b(?!\s+(?:wages|income))", 'state'),
+            ('state_wages', r"(?:16\s+)?State wages,\s*tips", 'money'),
+            ('state_tax_withheld', r"(?:17\s+)?State income tax", 'money'),
+            ('local_wages', r"(?:18\s+)?Local wages,\s*tips", 'money'),
+            ('local_tax_withheld', r"(?:19\s+)?Local income tax", 'money'),
+            ('locality_name', r"(?:20\s+)?Locality name", 'text'),
+        ],
+    },
+    '1099-NEC': {
+        'identifiers': [r"1099-NEC", r"Nonemployee Compensation"],
+        'boxes': [
+            ('payer_tin', r"PAYER'?S (?:TIN|federal identification number)", 'tin'),
+            ('recipient_tin', r"RECIPIENT'?S (?:TIN|identification number)", 'tin'),
+            ('nonemployee_compensation', r"(?:1\s+)?Nonemployee compensation", 'money'),
+            ('federal_tax_withheld', r"(?:4\s+)?Federal income tax withheld", 'money'),
+            ('state_tax_withheld', r"(?:5\s+)?State tax withheld", 'money'),
+        ],
+    },
+    '1099-INT': {
+        'identifiers': [r"1099-INT", r"Interest Income\s*$"],
+        'boxes': [
+            ('payer_tin', r"PAYER'?S (?:TIN|federal identification number)", 'tin'),
+            ('recipient_tin', r"RECIPIENT'?S (?:TIN|identification number)", 'tin'),
+            ('interest_income', r"(?:1\s+)?Interest income", 'money'),
+            ('early_withdrawal_penalty', r"(?:2\s+)?Early withdrawal penalty", 'money'),
+            ('us_savings_bond_interest', r"(?:3\s+)?Interest on U\.?S\.? Savings Bonds", 'money'),
+            ('federal_tax_withheld', r"(?:4\s+)?Federal income tax withheld", 'money'),
+            ('tax_exempt_interest', r"(?:8\s+)?Tax-exempt interest", 'money'),
+        ],
+    },
+    '1099-DIV': {
+        'identifiers': [r"1099-DIV", r"Dividends and Distributions"],
+        'boxes': [
+            ('payer_tin', r"PAYER'?S (?:TIN|federal identification number)", 'tin'),
+            ('recipient_tin', r"RECIPIENT'?S (?:TIN|identification number)", 'tin'),
+            ('total_dividends', r"(?:1a\s+)?Total ordinary dividends", 'money'),
+            ('qualified_dividends', r"(?:1b\s+)?Qualified dividends", 'money'),
+            ('capital_gain_distributions', r"(?:2a\s+)?Total capital gain distr", 'money'),
+            ('federal_tax_withheld', r"(?:4\s+)?Federal income tax withheld", 'money'),
+            ('foreign_tax_paid', r"(?:7\s+)?Foreign tax paid", 'money'),
+        ],
+    },
+    '1098': {
+        'identifiers': [r"Form\s+1098\b", r"Mortgage Interest\s+Statement"],
+        'boxes': [
+            ('lender_tin', r"RECIPIENT'?S/LENDER'?S TIN", 'tin'),
+            ('payer_tin', r"PAYER'?S/BORROWER'?S TIN", 'tin'),
+            ('mortgage_interest', r"(?:1\s+)?Mortgage interest received", 'money'),
+            ('outstanding_principal', r"(?:2\s+)?Outstanding mortgage\s+principal", 'money'),
+            ('mortgage_insurance_premiums', r"(?:5\s+)?Mortgage insurance premiums", 'money'),
+            ('points_paid', r"(?:6\s+)?Points paid on purchase", 'money'),
+        ],
+    },
+}
+
+@dataclass(frozen=True)
+class TextFragment:
+    """One run of text from the PDF text layer and where it starts on the page, in points"""
+    text: str
+    x: float
+    y: float
+
+@dataclass(frozen=True)
+class BoxTemplate:
+    field: str
+    label: re.Pattern
+    value: re.Pattern
+    kind: str
+
+    def convert(self, match: re.Match) -> Any:
+        value = match.group(1)
+        if self.kind == 'money':
+            return float(value.replace(',', ''))
+        return value.strip()
+
+@dataclass(frozen=True)
+class FormTemplate:
+    form_type: str
+    identifiers: Tuple[re.Pattern, ...]
+    boxes: Tuple[BoxTemplate, ...]
+
+    def matches(self, text: str) -> bool:
+        return any(identifier.search(text) for identifier in self.identifiers)
+
+    def extract(self, fragments: List[TextFragment]) -> Dict[str, Any]:
+        """Typed value per field, pairing each box label with the nearest value in its box.
+
+        Every (label, value) candidate is ranked by distance and taken in
+        that order, so a value is used for one box only and a form printed
+        as several copies on one page still yields each field once.
+        """
+        labels = []
+        for fragment in fragments:
+            for box in self.boxes:
+                if box.label.search(fragment.text):
+                    labels.append((box, fragment))
+        label_fragments = {id(fragment) for _, fragment in labels}
+
+        candidates = []
+        for box, label in labels:
+            for fragment in fragments:
+                if id(fragment) in label_fragments:
+                    continue
+                distance = _box_distance(label, fragment)
+                if distance is None:
+                    continue
+                match = box.value.fullmatch(fragment.text)
+                if match:
+                    candidates.append((distance, box, fragment, match))
+
+        fields: Dict[str, Any] = {}
+        used = set()
+        for _, box, fragment, match in sorted(candidates, key=lambda candidate: candidate[0]):
+            if box.field in fields or id(fragment) in used:
+                continue
+            try:
+                fields[box.field] = box.convert(match)
+            except ValueError:
+                continue
+            used.add(id(fragment))
+        return fields
+
+def _box_distance(label: TextFragment, fragment: TextFragment) -> Optional[float]:
+    """How far ``fragment`` is from ``label`` if it lies in the label's box, else None"""
+    dx = fragment.x - label.x
+    dy = label.y - fragment.y
+    if abs(dy) <= SAME_LINE_TOLERANCE and dx > 0:
+        # Set on the label's line, to its right
+        return abs(dy) + dx
+    if 0 < dy <= BOX_HEIGHT and -LEFT_SLACK <= dx <= BOX_WIDTH:
+        return dy + abs(dx) * 0.25
+    return None
+
+@lru_cache(maxsize=None)
+def form_templates() -> Tuple[FormTemplate, ...]:
+    """Every form template, compiled on first use and shared after that"""
+    templates = []
+    for form_type, spec in FORM_SPECS.items():
+        boxes = tuple(
+            BoxTemplate(
+                field,
+                re.compile(label, re.IGNORECASE),
+                re.compile(VALUE_PATTERNS[kind]),
+                kind
+            )
+            for field, label, kind in spec['boxes']
+        )
+        identifiers = tuple(re.compile(identifier, re.IGNORECASE | re.MULTILINE) for identifier in spec['identifiers'])
+        templates.append(FormTemplate(form_type, identifiers, boxes))
+    return tuple(templates)
+
+def detect_form(text: str) -> Optional[FormTemplate]:
+    """The template whose title appears in ``text``, or None"""
+    for template in form_templates():
+        if template.matches(text):
+            return template
+    return None
+
+def page_fragments(page) -> List[TextFragment]:
+    """Positioned text runs of one PyPDF2 page.
+
+    A run only carries the position it starts at, so when it holds line
+    breaks each later line is placed LINE_SPACING font sizes below the one
+    before.
+    """
+    fragments = []
+
+    def visit(text, cm, tm, font_dict, font_size):
+        text = text.strip()
+        if not text:
+            return
+        # The text matrix position, mapped to page space by the current transformation matrix
+        x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+        y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+        # Font size in page space: scaled by the vertical axis of both matrices
+        leading = font_size * LINE_SPACING * math.hypot(tm[2], tm[3]) * math.hypot(cm[2], cm[3])
+        for index, line in enumerate(text.split('\n')):
+            if line.strip():
+                fragments.append(TextFragment(line.strip(), x, y - index * leading))
+
+    page.extract_text(visitor_text=visit)
+    return fragments
+
+def extract_form_fields(source: Union[str, BinaryIO], max_pages: int = 2) -> Dict[str, Any]:
+    """``form_type`` and typed box values for a supported form, or {} for anything else.
+
+    Information returns put every box on the first page; later pages are
+    instructions, so only ``max_pages`` pages are read.
+    """
+    reader = PdfReader(source)
+    for page in reader.pages[:max_pages]:
+        try:
+            fragments = page_fragments(page)
+        except Exception as e:
+            logger.warning(f"Could not read the text layout of a page: {e}")
+            continue
+        template = detect_form('\n'.join(fragment.text for fragment in fragments))
+        if template is None:
+            continue
+        fields = template.extract(fragments)
+        if fields:
+            logger.info(f"Extracted {len(fields)} boxes from a {template.form_type}")
+            return {'form_type': template.form_type, **fields}
+    return {}
@@ -2,16 +2,18 @@ import firebase_admin
 from firebase_admin import credentials, firestore, auth, storage
 from firebase_functions import https_fn, firestore_fn
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from functools import wraps
-import tempfile
 import os
 from urllib.parse import urlparse
 
+from blob_io import open_blob
+
 # Firebase clients (lazy initialized)
 _db = None
 _bucket = None
 _app = None
+_parse_cache = None
 
 
 def _init_firebase():
@@ -50,6 +52,120 @@ def get_bucket():
 db = None
 bucket = None
 
+# A 'processing' claim older than the function timeout belongs to a dead invocation
+PROCESSING_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def get_processing_key(document_id, blob):
+    """Dedupe key for one parse: document id plus the stored object's content hash"""
+    blob.reload()
+    content_hash = blob.md5_hash or blob.generation
+    return f"{document_id}:{content_hash}"
+
+
+# Processes for page-parallel PDF text extraction; worth setting only on multi-vCPU instances
+PDF_PAGE_WORKERS = int(os.getenv('PDF_PAGE_WORKERS', '0'))
+PDF_PAGE_TIMEOUT_SECONDS = float(os.getenv('PDF_PAGE_TIMEOUT_SECONDS', '30'))
+
+
+def get_blob_path(url):
+    """Object path in the default bucket for a gs:// or HTTP(S) storage URL"""
+    if not url.startswith('gs://'):
+        # Convert HTTP URL to GCS path, skipping the first part which is the bucket name
+        path = urlparse(url).path.lstrip('/')
+        return '/'.join(path.split('/')[1:])
+    return url.split('/', 3)[3]  # Skip gs://bucket/
+
+
+def get_parse_cache():
+    """Parse result cache: a local LRU directory if PARSE_CACHE_DIR is set, else Firestore"""
+    global _parse_cache
+    if _parse_cache is None:
+        from parse_cache import FirestoreParseCache, LocalParseCache
+        cache_dir = os.getenv('PARSE_CACHE_DIR')
+        if cache_dir:
+            _parse_cache = LocalParseCache(cache_dir, int(os.getenv('PARSE_CACHE_MAX_ENTRIES', '1000')))
+        else:
+            _parse_cache = FirestoreParseCache(get_db())
+    return _parse_cache
+
+
+def _is_cacheable(metadata):
+    """Whether a parse is worth caching: it found at least one field and read every page"""
+    if not any(key != 'metadata' for key in metadata):
+        return False
+    pages = metadata.get('metadata', {}).get('pages', [])
+    return not any(page.get('error') for page in pages)
+
+
+def parse_document(blob, content_type, use_cache=True):
+    """Extracted metadata for a stored document and whether it came from the parse cache.
+
+    Only PDFs are parsed. ``blob`` must have its metadata loaded (see
+    get_processing_key) so its hash is known before anything is downloaded;
+    a cache hit skips the download and the parse. ``use_cache=False``
+    re-parses but still refreshes the cached result.
+    """
+    metadata = {}
+    if content_type != 'application/pdf':
+        return metadata, False
+
+    from parser import TaxDocumentParser
+    from parse_cache import parse_cache_key
+    cache_key = parse_cache_key(blob, TaxDocumentParser.PARSER_VERSION)
+    if cache_key and use_cache:
+        cached = get_parse_cache().get(cache_key)
+        if cached is not None:
+            # Stamped when the cached parse ran; the document is being processed now
+            if 'metadata' in cached:
+                cached['metadata']['processing_timestamp'] = datetime.now().isoformat()
+            return cached, True
+
+    with open_blob(blob) as stream:
+        parser = TaxDocumentParser(stream, PDF_PAGE_WORKERS, PDF_PAGE_TIMEOUT_SECONDS)
+        if PDF_PAGE_WORKERS > 1:
+            extracted_text = parser.extract_text()
+            if extracted_text:
+                metadata.update(parser.parse_data())
+        else:
+            # Page by page, stopping once every field is found; most forms have them all on page 1
+            metadata.update(parser.parse_incremental())
+        # Box values from a recognised form layout, read deterministically from the text layer
+        metadata.update(parser.parse_form())
+
+    # An empty result or one missing pages to errors or timeouts is parsed again next time
+    if cache_key and _is_cacheable(metadata):
+        get_parse_cache().put(cache_key, metadata)
+    return metadata, False
+
+
+def _claim_processing_in_transaction(transaction, doc_ref, processing_key):
+    """Mark the document as processing unless this exact content is already done or in flight"""
+    snapshot = doc_ref.get(transaction=transaction)
+    data = snapshot.to_dict() or {}
+
+    if data.get('processingKey') == processing_key:
+        if data.get('status') == 'processed':
+            return False
+        started_at = data.get('processingStartedAt')
+        if data.get('status') == 'processing' and started_at and \
+                datetime.fromisoformat(started_at) > datetime.now() - PROCESSING_CLAIM_TIMEOUT:
+            return False
+
+    transaction.update(doc_ref, {
+        'status': 'processing',
+        'processingKey': processing_key,
+        'processingStartedAt': datetime.now().isoformat()
+    })
+    return True
+
+
+def claim_document_processing(doc_ref, processing_key):
+    """Transactionally claim a parse so duplicate trigger deliveries and manual
+    requests for the same content do not parse it twice. Returns False for a duplicate."""
+    claim = firestore.transactional(_claim_processing_in_transaction)
+    return claim(get_db().transaction(), doc_ref, processing_key)
+
 def get_cors_headers(origin):
     return {
         'Access-Control-Allow-Origin': origin,
@@ -225,37 +341,17 @@ def process_new_tax_document(
             return
 
         try:
-            # Parse URL to get blob path
-            url = data['url']
-            if not url.startswith('gs://'):
-                # Convert HTTP URL to GCS path
-                parsed_url = urlparse(url)
-                path = parsed_url.path.lstrip('/')  # Remove leading slash
-                # Skip the first part which is the bucket name
-                blob_path = '/'.join(path.split('/')[1:])
-            else:
-                # Already a GCS path
-                blob_path = url.split('/', 3)[3]  # Skip gs://bucket/
-                
             # Get blob from default bucket
-            blob = get_bucket().blob(blob_path)
+            blob = get_bucket().blob(get_blob_path(data['url']))
             
-            # Create a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(data['name'])[1]) as temp_file:
-                blob.download_to_filename(temp_file.name)
-                
-                # Process the document based on type
-                metadata = {}
-                if data['type'] == 'application/pdf':
-                    from .parser import TaxDocumentParser
-                    parser = TaxDocumentParser(temp_file.name)
-                    extracted_text = parser.extract_text()
-                    if extracted_text:
-                        parsed_data = parser.parse_data()
-                        metadata.update(parsed_data)
-                        
-                # Clean up temp file
-                os.unlink(temp_file.name)
+            # Firestore triggers are at-least-once; skip redeliveries of a parse already done or running
+            processing_key = get_processing_key(document.id, blob)
+            if not claim_document_processing(document.reference, processing_key):
+                print(f"Skipping duplicate processing of {processing_key}")
+                return
+            
+            # Process the document based on type
+            metadata, cache_hit = parse_document(blob, data['type'])
                 
             # Update document with metadata and status
             update_data = {
@@ -265,7 +361,8 @@ def process_new_tax_document(
                 'processingDetails': {
                     'success': True,
                     'timestamp': datetime.now().isoformat(),
-                    'documentVersion': '1.0'
+                    'documentVersion': '1.0',
+                    'cacheHit': cache_hit
                 }
             }
             
@@ -417,47 +514,37 @@ def process_document(req: https_fn.Request) -> https_fn.Response:
             
         # Process document
         try:
-            # Parse URL to get blob path
-            url = doc_data['url']
-            if not url.startswith('gs://'):
-                # Convert HTTP URL to GCS path
-                parsed_url = urlparse(url)
-                path = parsed_url.path.lstrip('/')  # Remove leading slash
-                # Skip the first part which is the bucket name
-                blob_path = '/'.join(path.split('/')[1:])
-            else:
-                # Already a GCS path
-                blob_path = url.split('/', 3)[3]  # Skip gs://bucket/
-                
             # Get blob from default bucket
-            blob = get_bucket().blob(blob_path)
+            blob = get_bucket().blob(get_blob_path(doc_data['url']))
             
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(doc_data['name'])[1]) as temp_file:
-                blob.download_to_filename(temp_file.name)
-                
-                # Process based on file type
-                metadata = {}
-                if doc_data['type'] == 'application/pdf':
-                    from .parser import TaxDocumentParser
-                    parser = TaxDocumentParser(temp_file.name)
-                    extracted_text = parser.extract_text()
-                    if extracted_text:
-                        parsed_data = parser.parse_data()
-                        metadata.update(parsed_data)
-                        
-                # Clean up
-                os.unlink(temp_file.name)
+            # Reuse the trigger's result (or in-flight parse) for unchanged content unless forced
+            processing_key = get_processing_key(document_id, blob)
+            if not data.get('force') and not claim_document_processing(doc_ref, processing_key):
+                return https_fn.Response(
+                    json.dumps({
+                        "success": True,
+                        "documentId": document_id,
+                        "duplicate": True,
+                        "status": doc_data.get('status'),
+                        "metadata": doc_data.get('metadata', {})
+                    }),
+                    content_type='application/json'
+                )
+            
+            # Process based on file type; a forced re-parse bypasses the parse cache
+            metadata, cache_hit = parse_document(blob, doc_data['type'], use_cache=not data.get('force'))
                 
             # Update document
             update_data = {
                 'status': 'processed',
+                'processingKey': processing_key,
                 'metadata': metadata,
                 'processedAt': datetime.now().isoformat(),
                 'processingDetails': {
                     'success': True,
                     'timestamp': datetime.now().isoformat(),
-                    'documentVersion': '1.0'
+                    'documentVersion': '1.0',
+                    'cacheHit': cache_hit
                 }
             }
             
@@ -0,0 +1,127 @@
+"""
+Content-addressed parse result cache
+Parsed metadata keyed by the stored object's hash plus the parser version, in Firestore or a local directory
+"""
+
+import base64
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+def parse_cache_key(blob, parser_version: str) -> Optional[str]:
+    """Cache key for a blob whose metadata is loaded, or None if Storage reported no hash.
+
+    MD5 is used where present; composite objects only have a CRC32C. Both
+    are base64 in the object metadata and are hex encoded here, since
+    base64 can contain '/', which Firestore document ids cannot.
+    """
+    for kind, value in (('md5', blob.md5_hash), ('crc32c', blob.crc32c)):
+        if value:
+            return f"{kind}-{base64.b64decode(value).hex()}-v{parser_version}"
+    return None
+
+class ParseCache:
+    """Parsed metadata by cache key - to be implemented by subclasses"""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached metadata for ``key``, or None on a miss - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement get method")
+
+    def put(self, key: str, metadata: Dict[str, Any]):
+        """Store metadata for ``key`` - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement put method")
+
+class FirestoreParseCache(ParseCache):
+    """Cache shared by every function instance, one document per key in ``parseCache``.
+
+    With ``ttl_days`` set, entries carry an ``expire_at`` timestamp for a
+    Firestore TTL policy, which bounds the collection instead of an LRU.
+    """
+
+    def __init__(self, db, collection_name: str = 'parseCache', ttl_days: Optional[int] = 90):
+        self.collection = db.collection(collection_name)
+        self.ttl_days = ttl_days
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        snapshot = self.collection.document(key).get()
+        if not snapshot.exists:
+            return None
+        return snapshot.to_dict().get('metadata')
+
+    def put(self, key: str, metadata: Dict[str, Any]):
+        entry = {'metadata': metadata, 'createdAt': datetime.now().isoformat()}
+        if self.ttl_days:
+            entry['expire_at'] = datetime.now(timezone.utc) + timedelta(days=self.ttl_days)
+        self.collection.document(key).set(entry)
+
+class LocalParseCache(ParseCache):
+    """Cache of JSON files in ``directory``, holding at most ``max_entries`` least recently used.
+
+    Recency is the file's modification time, which ``get`` refreshes, so
+    the order survives restarts. Meant for one process, such as a batch
+    run or a long-lived worker; on Cloud Functions /tmp is memory.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 1000):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.json')]
+        self._entries: 'OrderedDict[str, None]' = OrderedDict(
+            (os.path.basename(path)[:-len('.json')], None) for path in sorted(paths, key=os.path.getmtime)
+        )
+        self._evict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            path = self._path(key)
+            try:
+                with open(path) as file:
+                    metadata = json.load(file)
+                os.utime(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Dropping unreadable parse cache entry {key}: {e}")
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return metadata
+
+    def put(self, key: str, metadata: Dict[str, Any]):
+        with self._lock:
+            # Written aside and renamed, so a crash never leaves a half-written entry
+            path = self._path(key)
+            partial = f"{path}.{os.getpid()}.tmp"
+            with open(partial, 'w') as file:
+                json.dump(metadata, file)
+            os.replace(partial, path)
+            self._entries[key] = None
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
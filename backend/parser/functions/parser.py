@@ -1,12 +1,32 @@
 import re
-from PyPDF2 import PdfReader
+from bisect import bisect_right
+from dataclasses import dataclass, field
 from datetime import datetime
 import logging
 
+from field_scanner import FieldScanner
+from form_templates import extract_form_fields
+from pdf_text import extract_pages, iter_pages, join_pages, page_starts
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@dataclass
+class Candidate:
+    """
+    One possible value for a field, with its score and where it was found.
+    """
+    value: str
+    score: float
+    page: int
+    # Index of the matching pattern in the field's PATTERNS list
+    pattern: int
+    match: re.Match = field(repr=False, compare=False)
+
+    def to_dict(self):
+        return {'value': self.value, 'score': self.score, 'page': self.page}
+
 class TaxDocumentParser:
     """
     Parser to extract data from tax documents.
@@ -48,11 +68,59 @@ class TaxDocumentParser:
         ]
     }
 
-    def __init__(self, file_path):
-        self.file_path = file_path
+    # Bump when parsing changes, so cached results from older parsers are not reused
+    PARSER_VERSION = '2.3'
+
+    # parse_incremental stops once every field has a match at least this confident
+    EARLY_EXIT_CONFIDENCE = 0.9
+    # Text before each new page that the early exit check scans again, for a label and value split across pages
+    PAGE_OVERLAP_CHARS = 200
+
+    # Context checks in _calculate_confidence, compiled once
+    TOTAL_CONTEXT = re.compile(r'total|sum|final')
+    DIGITS_ONLY = re.compile(r'^\d+$')
+
+    # Candidates per field kept by rank_candidates and reported in the metadata
+    TOP_K_CANDIDATES = 3
+
+    # A value on the line after its label, or set well apart from it, less likely belongs to it
+    LABEL_NEWLINE_FACTOR = 0.8
+    LABEL_GAP_FACTOR = 0.9
+    LABEL_GAP_CHARS = 3
+
+    # Summary values are on the first page; each later page scores a little lower, down to the floor
+    PAGE_DECAY = 0.97
+    PAGE_DECAY_FLOOR = 0.85
+
+    def __init__(self, source, page_workers=0, page_timeout=None):
+        # A file path, or a binary stream such as a spooled download
+        self.source = source
+        self.file_path = source if isinstance(source, str) else getattr(source, 'name', None) or '<stream>'
+        # page_workers > 1 extracts long documents on a process pool
+        self.page_workers = page_workers
+        self.page_timeout = page_timeout
         self.data = ""
         self.metadata = {}
         self.confidence_scores = {}
+        self.page_stats = []
+        # (offset in data, page number) where each page's text starts
+        self.page_starts = []
+        self.early_exit = False
+        # First matches of the early exit check, and the length of the text they were found in
+        self._first_matches = None
+        self._scanned_length = 0
+
+    @classmethod
+    def field_scanner(cls):
+        """
+        Scanner for this class's PATTERNS, built on first use.
+        """
+        # Looked up in the class's own __dict__ so a subclass with other PATTERNS gets its own scanner
+        scanner = cls.__dict__.get('_field_scanner')
+        if scanner is None:
+            scanner = FieldScanner(cls.PATTERNS)
+            cls._field_scanner = scanner
+        return scanner
 
     def extract_text(self):
         """
@@ -60,20 +128,13 @@ class TaxDocumentParser:
         """
         try:
             logger.info(f"Starting text extraction from {self.file_path}")
-            reader = PdfReader(self.file_path)
+            pages = extract_pages(self.source, self.page_workers, self.page_timeout)
+            for page in pages:
+                if not page.text and not page.error:
+                    logger.warning(f"Empty text extracted from page {page.number}")
             
-            text_parts = []
-            for i, page in enumerate(reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_parts.append(page_text)
-                    else:
-                        logger.warning(f"Empty text extracted from page {i+1}")
-                except Exception as e:
-                    logger.error(f"Error extracting text from page {i+1}: {str(e)}")
-            
-            self.data = " ".join(text_parts)
+            self.page_stats = [page.stats() for page in pages]
+            self._set_text(pages)
             if not self.data:
                 logger.error("No text could be extracted from the document")
             else:
@@ -85,23 +146,141 @@ class TaxDocumentParser:
             logger.error(f"Error during text extraction: {str(e)}")
             raise
 
-    def find_best_match(self, patterns, text):
+    def parse_incremental(self, min_confidence=None):
+        """
+        Extracts pages one at a time and parses as soon as every field is found.
+
+        After each page the field matchers pick up where they left off, on the
+        new page and the end of the one before. Once every field in PATTERNS
+        has a match of at least ``min_confidence`` that ends before the end of
+        the text so far (so the value cannot run on into the next page), the
+        remaining pages are skipped. Otherwise every page ends up
+        extracted and the result is the full-document parse.
+
+        An early result can differ from the full parse where a pattern tried
+        earlier for a field would first match on a later page; the confidence
+        threshold bounds how much weaker the kept match can be.
+        """
+        min_confidence = self.EARLY_EXIT_CONFIDENCE if min_confidence is None else min_confidence
+        logger.info(f"Starting incremental text extraction from {self.file_path}")
+        
+        pages = []
+        self.early_exit = False
+        self._first_matches = None
+        self._scanned_length = 0
+        for page in iter_pages(self.source, self.page_timeout):
+            pages.append(page)
+            if not page.text:
+                continue
+            self._set_text(pages)
+            if self._all_fields_found(min_confidence):
+                self.early_exit = True
+                logger.info(f"All fields found after page {page.number}, skipping the rest")
+                break
+        
+        self.page_stats = [page.stats() for page in pages]
+        self._set_text(pages)
+        if not self.data:
+            logger.error("No text could be extracted from the document")
+        return self.parse_data()
+
+    def _set_text(self, pages):
+        self.data = join_pages(pages)
+        self.page_starts = page_starts(pages)
+
+    def _all_fields_found(self, min_confidence):
+        # First matches only, so the check stops scanning as soon as it can; the ranked best
+        # candidate of a field scores at least as high as its first match.
+        # self.data only grows between calls, so matches from earlier calls are kept and the scan
+        # covers the new text plus PAGE_OVERLAP_CHARS before it, rather than the whole text each page.
+        # Matches that start in that overlap, or ran on to the old end of the text, are looked for again.
+        start = max(0, self._scanned_length - self.PAGE_OVERLAP_CHARS)
+        if self._first_matches is not None:
+            for matches in self._first_matches.values():
+                for match in matches:
+                    if match and match.end() >= self._scanned_length:
+                        start = min(start, match.start())
+            for matches in self._first_matches.values():
+                matches[:] = [match if match and match.start() < start else None for match in matches]
+        self._first_matches = self.field_scanner().first_matches(self.data, start, self._first_matches)
+        self._scanned_length = len(self.data)
+
+        offsets = [offset for offset, _ in self.page_starts]
+        for matches in self._first_matches.values():
+            scored = [
+                (self._score_candidate(match, self._page_of(match, offsets)), match)
+                for match in matches if match
+            ]
+            if not scored:
+                return False
+            confidence, best_match = max(scored, key=lambda candidate: candidate[0])
+            if confidence < min_confidence or best_match.end() >= len(self.data):
+                return False
+        return True
+
+    def parse_form(self):
         """
-        Finds the best matching pattern with confidence score.
+        Typed box values when the document is a W-2, 1099-NEC, 1099-INT, 1099-DIV or 1098.
+
+        Returns ``form_type`` plus one field per box found, read from where the
+        values sit on the page rather than from ``Label: value`` text, or {}
+        for any other document.
+        """
+        if not isinstance(self.source, str):
+            self.source.seek(0)
+        try:
+            return extract_form_fields(self.source)
+        except Exception as e:
+            logger.error(f"Error during form box extraction: {str(e)}")
+            return {}
+
+    def rank_candidates(self, top_k=None):
         """
-        best_match = None
-        best_confidence = 0
+        Every match of every field pattern in the text, scored and ranked best first.
+
+        One scan collects all the candidates (FieldScanner.all_matches), so a
+        better value later in the document is no longer hidden behind a
+        pattern's first match. Each is scored by _score_candidate; ties go to
+        the earlier pattern, then the earlier match. Returns up to ``top_k``
+        Candidates per field.
+        """
+        top_k = self.TOP_K_CANDIDATES if top_k is None else top_k
+        offsets = [offset for offset, _ in self.page_starts]
+        
+        ranked = {}
+        for field_name, matches in self.field_scanner().all_matches(self.data).items():
+            candidates = []
+            for index, match in matches:
+                page = self._page_of(match, offsets)
+                score = self._score_candidate(match, page)
+                candidates.append(Candidate(match.group(1).strip(), score, page, index, match))
+            candidates.sort(key=lambda candidate: (-candidate.score, candidate.pattern, candidate.match.start()))
+            ranked[field_name] = candidates[:top_k]
+        return ranked
+
+    def _page_of(self, match, offsets):
+        if not offsets:
+            return 1
+        return self.page_starts[max(0, bisect_right(offsets, match.start()) - 1)][1]
+
+    def _score_candidate(self, match, page):
+        """
+        _calculate_confidence adjusted for label proximity and the page the match is on.
+        """
+        confidence = self._calculate_confidence(match)
+        
+        # Label proximity: the whitespace between the label and the value
+        gap = match.string[match.start():match.start(1)]
+        spacing = len(gap) - len(gap.rstrip())
+        if '\n' in gap[len(gap) - spacing:]:
+            confidence *= self.LABEL_NEWLINE_FACTOR
+        elif spacing > self.LABEL_GAP_CHARS:
+            confidence *= self.LABEL_GAP_FACTOR
         
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                # Calculate confidence based on context and format
-                confidence = self._calculate_confidence(match)
-                if confidence > best_confidence:
-                    best_match = match
-                    best_confidence = confidence
+        # Page position
+        confidence *= max(self.PAGE_DECAY ** (page - 1), self.PAGE_DECAY_FLOOR)
         
-        return best_match, best_confidence
+        return confidence
 
     def _calculate_confidence(self, match):
         """
@@ -118,12 +297,11 @@ class TaxDocumentParser:
         
         # Context factor
         context_before = match.string[max(0, match.start() - 20):match.start()]
-        context_after = match.string[match.end():min(len(match.string), match.end() + 20)]
-        if re.search(r'total|sum|final', context_before.lower()):
+        if self.TOTAL_CONTEXT.search(context_before.lower()):
             confidence *= 1.2
         
         # Format factor
-        if re.match(r'^\d+$', match.group(1)):
+        if self.DIGITS_ONLY.match(match.group(1)):
             confidence *= 1.1
             
         return min(confidence, 1.0)
@@ -138,48 +316,55 @@ class TaxDocumentParser:
 
         parsed_data = {}
         
+        # One pass over the text finds and ranks every candidate for every field
+        ranked = self.rank_candidates()
+        
         # Process each field type
-        for field, patterns in self.PATTERNS.items():
-            best_match, confidence = self.find_best_match(patterns, self.data)
-            
-            if best_match:
-                value = best_match.group(1).strip()
+        for field_name, candidates in ranked.items():
+            for candidate in candidates:
+                value = candidate.value
                 
                 # Convert numeric values
-                if field in ['income', 'tax_due']:
+                if field_name in ['income', 'tax_due']:
                     try:
                         value = float(value.replace(',', ''))
                     except ValueError:
-                        logger.error(f"Error converting {field} value: {value}")
+                        logger.error(f"Error converting {field_name} value: {value}")
                         continue
                 
-                parsed_data[field] = value
-                self.confidence_scores[field] = confidence
-                logger.info(f"Found {field} with confidence {confidence:.2f}: {value}")
+                parsed_data[field_name] = value
+                self.confidence_scores[field_name] = candidate.score
+                logger.info(f"Found {field_name} with confidence {candidate.score:.2f}: {value}")
+                break
             else:
-                logger.warning(f"Could not find {field} in document")
+                logger.warning(f"Could not find {field_name} in document")
 
         # Add metadata
         parsed_data['metadata'] = {
             'confidence_scores': self.confidence_scores,
-            'parser_version': '2.0',
+            'parser_version': self.PARSER_VERSION,
             'processing_timestamp': datetime.now().isoformat(),
-            'extraction_success': bool(parsed_data)
+            'extraction_success': bool(parsed_data),
+            'pages': self.page_stats,
+            'early_exit': self.early_exit,
+            'candidates': {
+                field_name: [candidate.to_dict() for candidate in candidates]
+                for field_name, candidates in ranked.items() if candidates
+            }
         }
 
         return parsed_data
 
 
-# Example Usage
+# Example Usage; for many documents use batch.py
 if __name__ == "__main__":
-    # Provide the file path for the tax document
-    file_path = "tax_document.pdf"
+    import sys
 
-    parser = TaxDocumentParser(file_path)
-    text_data = parser.extract_text()
+    # Provide the file paths of the tax documents
+    for file_path in sys.argv[1:] or ["tax_document.pdf"]:
+        parser = TaxDocumentParser(file_path)
+        parsed_data = parser.parse_incremental()
 
-    if text_data:
-        parsed_data = parser.parse_data()
-        print("Parsed Tax Document Data:")
+        print(f"Parsed Tax Document Data from {file_path}:")
         for key, value in parsed_data.items():
             print(f"{key}: {value}")
@@ -0,0 +1,226 @@
+"""
+Page-level PDF text extraction
+Serial or page-parallel over a process pool, timing each page and isolating page failures
+"""
+
+import io
+import math
+import multiprocessing
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+import logging
+
+from PyPDF2 import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# Documents shorter than this are extracted serially; starting the pool costs more than it saves
+PARALLEL_MIN_PAGES = 8
+
+# Pool start-up time allowed on top of the page timeouts before pages are given up on
+POOL_STARTUP_GRACE_SECONDS = 10.0
+
+# Bounds the wait on a pool when no page timeout is given; a worker that fails to start is replaced forever
+POOL_PAGE_BACKSTOP_SECONDS = 60.0
+
+@dataclass
+class PageText:
+    """Text of one page; ``number`` is 1-based and ``error`` is set if the page failed"""
+    number: int
+    text: str
+    seconds: float
+    error: Optional[str] = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Timing and failure for document metadata, without the text"""
+        stats = asdict(self)
+        del stats['text']
+        if stats['error'] is None:
+            del stats['error']
+        return stats
+
+def extract_pages(
+    source: Union[str, BinaryIO],
+    workers: int = 0,
+    page_timeout: Optional[float] = None,
+    reader: Optional[PdfReader] = None
+) -> List[PageText]:
+    """Text of every page of a PDF path or binary stream, in page order.
+
+    With ``workers`` > 1 and at least PARALLEL_MIN_PAGES pages, pages are
+    extracted by a pool of that many processes. A page that raises or runs
+    past ``page_timeout`` seconds comes back with ``error`` set and empty
+    text; the other pages are unaffected. A caller that already opened
+    ``source`` passes its ``reader`` so the document is not parsed again.
+
+    The timeout is a SIGALRM, which only the main thread can set. Called
+    from any other thread, such as a Cloud Functions request handler, the
+    pages are extracted by a single pool process instead, whose main thread
+    enforces it.
+    """
+
+    if reader is None:
+        reader = PdfReader(source)
+    page_count = len(reader.pages)
+    if workers > 1 and page_count >= PARALLEL_MIN_PAGES:
+        return _extract_parallel(source, page_count, min(workers, page_count), page_timeout)
+    if page_timeout and not _alarm_available():
+        return _extract_parallel(source, page_count, 1, page_timeout)
+    return [_extract_page(reader, index, page_timeout) for index in range(page_count)]
+
+def iter_pages(source: Union[str, BinaryIO], page_timeout: Optional[float] = None) -> Iterator[PageText]:
+    """Pages of a PDF extracted one at a time, so a caller can stop before the end.
+
+    Off the main thread a ``page_timeout`` is enforced the way
+    ``extract_pages`` does it, by a single pool process that is stopped
+    when the caller stops iterating.
+    """
+    reader = PdfReader(source)
+    if page_timeout and not _alarm_available():
+        yield from _iter_pages_in_process(source, len(reader.pages), page_timeout)
+        return
+    for index in range(len(reader.pages)):
+        yield _extract_page(reader, index, page_timeout)
+
+def join_pages(pages: List[PageText], separator: str = " ") -> str:
+    """Text of the pages that produced any, joined once"""
+    return separator.join(page.text for page in pages if page.text)
+
+def page_starts(pages: List[PageText], separator: str = " ") -> List[Tuple[int, int]]:
+    """(offset, page number) where each page's text starts in ``join_pages(pages, separator)``"""
+    starts = []
+    offset = 0
+    for page in pages:
+        if page.text:
+            starts.append((offset, page.number))
+            offset += len(page.text) + len(separator)
+    return starts
+
+class PageTimeout(Exception):
+    pass
+
+_warned_unbounded = False
+
+def _alarm_available() -> bool:
+    """Whether SIGALRM can bound a page here: a Unix process's main thread"""
+    return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+@contextmanager
+def _page_alarm(timeout: Optional[float]):
+    """Raise PageTimeout in the block after ``timeout`` seconds.
+
+    Uses SIGALRM, so it is only enforced on the main thread of a Unix
+    process; elsewhere the block runs unbounded, with a warning logged once
+    per process.
+    """
+    global _warned_unbounded
+    if not timeout:
+        yield
+        return
+    if not _alarm_available():
+        if not _warned_unbounded:
+            _warned_unbounded = True
+            logger.warning(f"Page timeout of {timeout}s cannot be enforced here; pages run unbounded")
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise PageTimeout()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def _extract_page(reader: PdfReader, index: int, timeout: Optional[float]) -> PageText:
+    started = time.perf_counter()
+    try:
+        with _page_alarm(timeout):
+            text = reader.pages[index].extract_text() or ""
+        return PageText(index + 1, text, time.perf_counter() - started)
+    except PageTimeout:
+        logger.error(f"Text extraction from page {index + 1} timed out after {timeout}s")
+        return PageText(index + 1, "", time.perf_counter() - started, f"timed out after {timeout}s")
+    except Exception as e:
+        logger.error(f"Error extracting text from page {index + 1}: {str(e)}")
+        return PageText(index + 1, "", time.perf_counter() - started, str(e))
+
+def _extract_parallel(
+    source: Union[str, BinaryIO],
+    page_count: int,
+    workers: int,
+    page_timeout: Optional[float]
+) -> List[PageText]:
+    # Each worker opens the document once and then extracts the pages it is handed
+    context = multiprocessing.get_context('spawn')
+    initargs = (_document(source), page_timeout)
+    with context.Pool(workers, initializer=_init_page_worker, initargs=initargs) as pool:
+        pending = [pool.apply_async(_extract_worker_page, (index,)) for index in range(page_count)]
+
+        # Workers enforce page_timeout themselves; this only catches a worker that died or hung outside Python
+        rounds = math.ceil(page_count / workers)
+        page_allowance = page_timeout or POOL_PAGE_BACKSTOP_SECONDS
+        deadline = time.monotonic() + POOL_STARTUP_GRACE_SECONDS + rounds * 2 * page_allowance
+
+        pages = []
+        for index, result in enumerate(pending):
+            try:
+                pages.append(result.get(max(0.0, deadline - time.monotonic())))
+            except multiprocessing.TimeoutError:
+                logger.error(f"Text extraction from page {index + 1} did not finish")
+                pages.append(PageText(index + 1, "", 0.0, "worker did not finish"))
+        # Leaving the block terminates the pool, including any worker stuck on a page
+    return pages
+
+def _iter_pages_in_process(
+    source: Union[str, BinaryIO],
+    page_count: int,
+    page_timeout: float
+) -> Iterator[PageText]:
+    document = _document(source)
+    context = multiprocessing.get_context('spawn')
+    pool = None
+    try:
+        for index in range(page_count):
+            if pool is None:
+                pool = context.Pool(1, initializer=_init_page_worker, initargs=(document, page_timeout))
+                grace = POOL_STARTUP_GRACE_SECONDS
+            # The worker enforces page_timeout itself; this only catches one that died or hung outside Python
+            result = pool.apply_async(_extract_worker_page, (index,))
+            try:
+                page = result.get(grace + 2 * page_timeout)
+                grace = 0.0
+            except multiprocessing.TimeoutError:
+                logger.error(f"Text extraction from page {index + 1} did not finish")
+                page = PageText(index + 1, "", 0.0, "worker did not finish")
+                pool.terminate()
+                pool = None
+            yield page
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def _document(source: Union[str, BinaryIO]) -> Union[str, bytes]:
+    """A path or the bytes of a stream, to hand to pool processes"""
+    if isinstance(source, str):
+        return source
+    source.seek(0)
+    return source.read()
+
+_worker_reader: Optional[PdfReader] = None
+_worker_timeout: Optional[float] = None
+
+def _init_page_worker(document: Union[str, bytes], page_timeout: Optional[float]):
+    global _worker_reader, _worker_timeout
+    _worker_reader = PdfReader(document if isinstance(document, str) else io.BytesIO(document))
+    _worker_timeout = page_timeout
+
+def _extract_worker_page(index: int) -> PageText:
+    return _extract_page(_worker_reader, index, _worker_timeout)
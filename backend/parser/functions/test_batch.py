@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from batch import iter_documents, run_batch
+
+
+def write_pdf(path, text):
+    canvas = pytest.importorskip('reportlab.pdfgen.canvas')
+    pdf = canvas.Canvas(str(path))
+    pdf.drawString(72, 720, text)
+    pdf.showPage()
+    pdf.save()
+
+@pytest.fixture
+def documents(tmp_path):
+    directory = tmp_path / 'pdfs'
+    (directory / '2023').mkdir(parents=True)
+    for number in range(4):
+        write_pdf(directory / '2023' / f'w2-{number}.pdf', f'Tax Year: 2023 SSN: 123-45-678{number} end')
+    (directory / 'broken.pdf').write_bytes(b'not a pdf')
+    (directory / 'notes.txt').write_text('skipped')
+    return directory
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+def test_directory_input_is_every_pdf_in_a_stable_order(documents):
+    ids = [document['id'] for document in iter_documents(str(documents))]
+
+    assert ids == ['broken.pdf', '2023/w2-0.pdf', '2023/w2-1.pdf', '2023/w2-2.pdf', '2023/w2-3.pdf']
+
+def test_manifest_input(tmp_path):
+    manifest = tmp_path / 'manifest.jsonl'
+    manifest.write_text('{"path": "/data/a.pdf", "id": "doc_a"}\n\n{"path": "/data/b.pdf"}\n')
+
+    assert list(iter_documents(str(manifest))) == [
+        {'id': 'doc_a', 'path': '/data/a.pdf'},
+        {'id': '/data/b.pdf', 'path': '/data/b.pdf'},
+    ]
+
+def test_batch_writes_every_result_and_isolates_failures(documents, tmp_path):
+    output = tmp_path / 'parsed.jsonl'
+
+    stats = run_batch(iter_documents(str(documents)), str(output), workers=2, flush_every=2)
+
+    results = {result['id']: result for result in read_jsonl(output)}
+    assert (stats.parsed, stats.failed, stats.skipped) == (4, 1, 0)
+    assert stats.docs_per_second > 0
+    assert 'error' in results['broken.pdf']
+    assert results['2023/w2-2.pdf']['result']['tax_id'] == '123-45-6782'
+
+def test_rerun_skips_checkpointed_documents(documents, tmp_path):
+    output = tmp_path / 'parsed.jsonl'
+    run_batch(iter_documents(str(documents)), str(output), workers=2, flush_every=2)
+
+    stats = run_batch(iter_documents(str(documents)), str(output), workers=2, flush_every=2)
+
+    assert (stats.parsed, stats.failed, stats.skipped) == (0, 0, 5)
+    assert len(read_jsonl(output)) == 5
+
+def test_resume_after_crash_drops_unchecked_output(documents, tmp_path):
+    output = tmp_path / 'parsed.jsonl'
+    documents_list = list(iter_documents(str(documents)))
+    run_batch(documents_list[:2], str(output), workers=1, flush_every=2)
+    # A crash after writing part of the next chunk, before its checkpoint
+    with open(output, 'a') as file:
+        file.write('{"id": "2023/w2-2.pdf", "partial"')
+
+    stats = run_batch(documents_list, str(output), workers=2, flush_every=2)
+
+    ids = [result['id'] for result in read_jsonl(output)]
+    assert stats.skipped == 2
+    assert sorted(ids) == sorted(document['id'] for document in documents_list)
+
+def test_parquet_output(documents, tmp_path):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    output = tmp_path / 'parsed'
+
+    run_batch(iter_documents(str(documents)), str(output), 'parquet', workers=2, flush_every=2)
+
+    table = parquet.read_table(str(output))
+    assert table.num_rows == 5
+
+def crash_on_marker(document):
+    # Runs in the pool process, where batch.parse_file is the real one
+    import os
+    import batch
+    if 'crash' in document['path']:
+        os._exit(1)
+    return batch.parse_file(document)
+
+def test_document_that_kills_its_worker_is_recorded_as_failed(documents, tmp_path, monkeypatch):
+    import batch
+    (documents / 'crash.pdf').write_bytes(b'%PDF-1.4')
+    output = tmp_path / 'parsed.jsonl'
+    monkeypatch.setattr(batch, 'parse_file', crash_on_marker)
+
+    stats = run_batch(iter_documents(str(documents)), str(output), workers=2, flush_every=2)
+
+    results = {result['id']: result for result in read_jsonl(output)}
+    assert (stats.parsed, stats.failed) == (4, 2)
+    assert results['crash.pdf']['error'].startswith('BrokenProcessPool')
+    assert 'error' not in results['2023/w2-0.pdf']
+
+    rerun = run_batch(iter_documents(str(documents)), str(output), workers=2, flush_every=2)
+    assert rerun.skipped == 6
@@ -0,0 +1,122 @@
+import random
+import re
+
+from field_scanner import FieldScanner
+from parser import TaxDocumentParser
+
+DOCUMENT = """Form 1040 Tax Year: 2023 Filing Status: Married Filing Jointly
+Taxpayer Name: Jane Q Public SSN: 123-45-6789
+Wages 52,000.00 Total Income: $61,250.75 Adjusted Gross Income: $58,000.00
+Total Tax: $7,100.00 Balance Due: $350.25 Status: Final"""
+
+def _search_all(patterns, text):
+    return {
+        field: [re.search(pattern, text) for pattern in field_patterns]
+        for field, field_patterns in patterns.items()
+    }
+
+def _spans(matches):
+    return {
+        field: [(m.span(), m.groups()) if m else None for m in field_matches]
+        for field, field_matches in matches.items()
+    }
+
+def _parse(text):
+    parser = TaxDocumentParser('unused.pdf')
+    parser.data = text
+    parsed = parser.parse_data()
+    parsed.get('metadata', {}).pop('processing_timestamp', None)
+    return parsed
+
+def _reference_parse(text):
+    """parse_data by brute force: every re.finditer match of every pattern, scored and ranked"""
+    parser = TaxDocumentParser('unused.pdf')
+    parser.data = text
+    parsed = {}
+    for field, patterns in TaxDocumentParser.PATTERNS.items():
+        candidates = sorted(
+            (-parser._score_candidate(match, 1), index, match.start(), match)
+            for index, pattern in enumerate(patterns) for match in re.finditer(pattern, text)
+        )
+        for score, _, _, match in candidates[:TaxDocumentParser.TOP_K_CANDIDATES]:
+            value = match.group(1).strip()
+            if field in ['income', 'tax_due']:
+                try:
+                    value = float(value.replace(',', ''))
+                except ValueError:
+                    continue
+            parsed[field] = (value, -score)
+            break
+    return parsed
+
+def parser_confidence(parsed, field):
+    return parsed['metadata']['confidence_scores'][field]
+
+def test_first_matches_equal_per_pattern_search():
+    scanner = FieldScanner(TaxDocumentParser.PATTERNS)
+
+    assert _spans(scanner.first_matches(DOCUMENT)) == _spans(_search_all(TaxDocumentParser.PATTERNS, DOCUMENT))
+
+def test_overlapping_matches_are_all_found():
+    # "Status:" matches inside "Filing Status:", at an offset the filing pattern already covers
+    scanner = FieldScanner({'filing_status': [r"Filing Status:\s*([A-Za-z\s]+)", r"Status:\s*([A-Za-z\s]+)"]})
+
+    first, second = scanner.first_matches("Filing Status: Single")['filing_status']
+
+    assert first.start() == 0
+    assert second.start() == len("Filing ")
+
+def test_first_matches_equal_search_on_random_documents():
+    fragments = [
+        'Name: ', 'Taxpayer Name: ', 'SSN: ', 'EIN: 12-', 'Tax ID: ', 'Income: $', 'Total Income: $',
+        'Tax Due: $', 'Total Tax: $', 'Amount Due: $', 'Tax Year: ', 'For Year: ', 'Status: ',
+        'Filing Status: ', 'John Smith', '2023', '1,234.50', '99', '-', ' ', '\n', 'total ', 'final '
+    ]
+    rng = random.Random(18)
+    scanner = FieldScanner(TaxDocumentParser.PATTERNS)
+    for _ in range(300):
+        text = ''.join(rng.choice(fragments) for _ in range(rng.randint(0, 40)))
+        assert _spans(scanner.first_matches(text)) == _spans(_search_all(TaxDocumentParser.PATTERNS, text)), text
+        expected = _candidate_spans(_finditer_all(TaxDocumentParser.PATTERNS, text))
+        assert _candidate_spans(scanner.all_matches(text)) == expected, text
+        parsed = _parse(text)
+        assert {field: (value, parser_confidence(parsed, field))
+                for field, value in parsed.items() if field != 'metadata'} == _reference_parse(text), text
+
+def _finditer_all(patterns, text):
+    return {
+        field: sorted(
+            ((index, match) for index, pattern in enumerate(field_patterns) for match in re.finditer(pattern, text)),
+            key=lambda candidate: (candidate[1].start(), candidate[0])
+        )
+        for field, field_patterns in patterns.items()
+    }
+
+def _candidate_spans(matches):
+    return {
+        field: [(index, m.span(), m.groups()) for index, m in field_matches]
+        for field, field_matches in matches.items()
+    }
+
+def test_all_matches_equal_finditer():
+    scanner = FieldScanner(TaxDocumentParser.PATTERNS)
+    text = DOCUMENT + " Taxpayer Name: John Doe Tax Year: 2022 Income: $1,000.00"
+
+    expected = _candidate_spans(_finditer_all(TaxDocumentParser.PATTERNS, text))
+    assert _candidate_spans(scanner.all_matches(text)) == expected
+
+def test_parse_data_reports_fields_from_one_scan():
+    parsed = _parse(DOCUMENT)
+
+    assert parsed['tax_year'] == '2023'
+    assert parsed['income'] == 61250.75
+    assert parsed['tax_id'] == '123-45-6789'
+    assert parsed['filing_status'].startswith('Married Filing Jointly')
+
+def test_scanner_is_built_per_class():
+    class W2Parser(TaxDocumentParser):
+        PATTERNS = {'wages': [r"Wages\s+([\d,]+\.\d{2})"]}
+
+    assert W2Parser.field_scanner() is not TaxDocumentParser.field_scanner()
+    assert W2Parser.field_scanner() is W2Parser.field_scanner()
+    assert W2Parser.field_scanner().first_matches(DOCUMENT)['wages'][0].group(1) == '52,000.00'
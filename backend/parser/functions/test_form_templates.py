@@ -0,0 +1,126 @@
+import io
+
+import pytest
+
+from form_templates import (
+    LINE_SPACING, TextFragment, detect_form, extract_form_fields, form_templates, page_fragments
+)
+from parser import TaxDocumentParser
+
+W2_BOXES = [
+    ("a Employee's social security number", '123-45-6789', "b Employer identification number (EIN)", '12-3456789'),
+    ('1 Wages, tips, other compensation', '52,000.00', '2 Federal income tax withheld', '6,240.00'),
+    ('3 Social security wages', '52,000.00', '4 Social security tax withheld', '3,224.00'),
+    ('5 Medicare wages and tips', '52,000.00', '6 Medicare tax withheld', '754.00'),
+    ('7 Social security tips', '', '8 Allocated tips', '0.00'),
+    ('15 State', 'CA', '16 State wages, tips, etc.', '52,000.00'),
+    ('17 State income tax', '2,100.50', '20 Locality name', 'SAN FRANCISCO'),
+]
+
+INT_BOXES = [
+    ("PAYER'S TIN", '98-7654321', "RECIPIENT'S TIN", 'XXX-XX-6789'),
+    ('1 Interest income', '1,234.56', '2 Early withdrawal penalty', '0.00'),
+    ('3 Interest on U.S. Savings Bonds and Treasury obligations', '45.00', '4 Federal income tax withheld', '120.00'),
+    ('8 Tax-exempt interest', '300.00', '', ''),
+]
+
+
+def make_form(title, boxes, copies=1):
+    """A form drawn as a grid: each box has a small label and its value set below it"""
+    canvas = pytest.importorskip('reportlab.pdfgen.canvas')
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for copy in range(copies):
+        top = 760 - copy * 380
+        pdf.setFont('Helvetica-Bold', 12)
+        pdf.drawString(40, top, title)
+        for row, (left_label, left_value, right_label, right_value) in enumerate(boxes):
+            y = top - 30 - row * 36
+            for x, label, value in ((40, left_label, left_value), (300, right_label, right_value)):
+                pdf.setFont('Helvetica', 7)
+                pdf.drawString(x, y, label)
+                pdf.setFont('Helvetica', 10)
+                pdf.drawString(x + 6, y - 14, value)
+    pdf.showPage()
+    pdf.save()
+    buffer.seek(0)
+    return buffer
+
+def test_reads_w2_boxes_as_typed_fields():
+    fields = extract_form_fields(make_form('Form W-2 Wage and Tax Statement 2023', W2_BOXES))
+
+    assert fields == {
+        'form_type': 'W-2',
+        'employee_ssn': '123-45-6789',
+        'employer_ein': '12-3456789',
+        'wages': 52000.0,
+        'federal_tax_withheld': 6240.0,
+        'social_security_wages': 52000.0,
+        'social_security_tax_withheld': 3224.0,
+        'medicare_wages': 52000.0,
+        'medicare_tax_withheld': 754.0,
+        'allocated_tips': 0.0,
+        'state': 'CA',
+        'state_wages': 52000.0,
+        'state_tax_withheld': 2100.5,
+        'locality_name': 'SAN FRANCISCO',
+    }
+
+def test_empty_box_does_not_take_a_neighbouring_value():
+    fields = extract_form_fields(make_form('Form W-2 Wage and Tax Statement 2023', W2_BOXES))
+
+    # Box 7 is blank; the nearest money below it belongs to box 15/16's row
+    assert 'social_security_tips' not in fields
+
+def test_reads_1099_int():
+    fields = extract_form_fields(make_form('Form 1099-INT Interest Income', INT_BOXES))
+
+    assert fields == {
+        'form_type': '1099-INT',
+        'payer_tin': '98-7654321',
+        'recipient_tin': 'XXX-XX-6789',
+        'interest_income': 1234.56,
+        'early_withdrawal_penalty': 0.0,
+        'us_savings_bond_interest': 45.0,
+        'federal_tax_withheld': 120.0,
+        'tax_exempt_interest': 300.0,
+    }
+
+def test_several_copies_on_one_page_yield_each_field_once():
+    single = extract_form_fields(make_form('Form W-2 Wage and Tax Statement', W2_BOXES[:4]))
+    doubled = extract_form_fields(make_form('Form W-2 Wage and Tax Statement', W2_BOXES[:4], copies=2))
+
+    assert doubled == single
+
+def test_other_documents_have_no_form_fields():
+    assert extract_form_fields(make_form('Brokerage account summary', W2_BOXES)) == {}
+
+def test_detects_form_from_its_title():
+    assert detect_form('Form 1099-NEC Nonemployee Compensation').form_type == '1099-NEC'
+    assert detect_form('Dividends and Distributions 2023').form_type == '1099-DIV'
+    assert detect_form('Form 1098 Mortgage Interest Statement').form_type == '1098'
+    assert detect_form('Form 1040 U.S. Individual Income Tax Return') is None
+
+def test_templates_are_compiled_once():
+    assert form_templates() is form_templates()
+
+def test_parser_merges_form_fields():
+    document = make_form('Form W-2 Wage and Tax Statement 2023', W2_BOXES)
+    parser = TaxDocumentParser(document)
+    parsed = parser.parse_incremental()
+
+    parsed.update(parser.parse_form())
+
+    assert parsed['form_type'] == 'W-2'
+    assert parsed['wages'] == 52000.0
+    assert parsed['metadata']['parser_version'] == TaxDocumentParser.PARSER_VERSION
+
+def test_lines_of_one_text_run_are_placed_one_below_another():
+    class Page:
+        def extract_text(self, visitor_text):
+            visitor_text('1 Wages, tips\n\n52,000.00\n', [2, 0, 0, 2, 10, 0], [1, 0, 0, 1, 20, 700], {}, 10)
+
+    assert page_fragments(Page()) == [
+        TextFragment('1 Wages, tips', 50, 1400),
+        TextFragment('52,000.00', 50, 1400 - 2 * 10 * LINE_SPACING * 2),
+    ]
@@ -72,3 +72,135 @@ def test_get_tax_summary(mock_request):
     response_data = json.loads(response.data.decode())
     assert 'totalDocuments' in response_data
     assert 'documentTypes' in response_data
+
+def _snapshot(data):
+    return Mock(to_dict=Mock(return_value=data))
+
+def test_processing_claim_skips_duplicate_content():
+    from main import _claim_processing_in_transaction
+    from datetime import datetime
+
+    transaction = Mock()
+    doc_ref = Mock()
+
+    # Already parsed this exact content
+    doc_ref.get.return_value = _snapshot({'status': 'processed', 'processingKey': 'doc1:abc'})
+    assert _claim_processing_in_transaction(transaction, doc_ref, 'doc1:abc') is False
+
+    # Another invocation is parsing it right now
+    doc_ref.get.return_value = _snapshot({
+        'status': 'processing',
+        'processingKey': 'doc1:abc',
+        'processingStartedAt': datetime.now().isoformat()
+    })
+    assert _claim_processing_in_transaction(transaction, doc_ref, 'doc1:abc') is False
+    transaction.update.assert_not_called()
+
+def test_processing_claim_allows_new_content_and_stale_claims():
+    from main import _claim_processing_in_transaction
+
+    transaction = Mock()
+    doc_ref = Mock()
+
+    # The file was replaced, so its content hash changed
+    doc_ref.get.return_value = _snapshot({'status': 'processed', 'processingKey': 'doc1:abc'})
+    assert _claim_processing_in_transaction(transaction, doc_ref, 'doc1:def') is True
+
+    # The invocation that claimed it died
+    doc_ref.get.return_value = _snapshot({
+        'status': 'processing',
+        'processingKey': 'doc1:abc',
+        'processingStartedAt': '2020-01-01T00:00:00'
+    })
+    assert _claim_processing_in_transaction(transaction, doc_ref, 'doc1:abc') is True
+    assert transaction.update.call_args[0][1]['status'] == 'processing'
+
+def test_blob_path_from_storage_urls():
+    from main import get_blob_path
+
+    assert get_blob_path('gs://taxfront.appspot.com/users/u1/w2.pdf') == 'users/u1/w2.pdf'
+    assert get_blob_path(
+        'https://storage.googleapis.com/taxfront.appspot.com/users/u1/w2.pdf'
+    ) == 'users/u1/w2.pdf'
+
+def test_open_blob_streams_into_a_buffer_closed_on_error():
+    from main import open_blob
+
+    blob = Mock()
+    blob.download_to_file.side_effect = lambda buffer: buffer.write(b'%PDF-1.4')
+
+    with pytest.raises(ValueError):
+        with open_blob(blob) as stream:
+            assert stream.read() == b'%PDF-1.4'
+            raise ValueError('parse failed')
+    assert stream.closed
+
+def _pdf_bytes(text):
+    canvas = pytest.importorskip('reportlab.pdfgen.canvas')
+    import io
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    pdf.drawString(72, 720, text)
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+def test_parse_cache_hit_skips_download_and_parse(monkeypatch, tmp_path):
+    import main
+    from parse_cache import LocalParseCache
+
+    monkeypatch.setattr(main, 'get_parse_cache', lambda: cache)
+    cache = LocalParseCache(str(tmp_path))
+    content = _pdf_bytes('Tax Year: 2023')
+    blob = Mock(md5_hash='1B2M2Y8AsgTpgAmY7PhCfg==', crc32c=None)
+    blob.download_to_file.side_effect = lambda buffer: buffer.write(content)
+
+    metadata, cache_hit = main.parse_document(blob, 'application/pdf')
+    assert cache_hit is False
+    assert metadata['tax_year'] == '2023'
+
+    # The same content uploaded again, e.g. as another document
+    again, cache_hit = main.parse_document(blob, 'application/pdf')
+    assert cache_hit is True
+    assert again['tax_year'] == metadata['tax_year']
+    assert again['metadata']['processing_timestamp'] >= metadata['metadata']['processing_timestamp']
+    assert blob.download_to_file.call_count == 1
+
+    # A forced re-parse downloads again
+    _, cache_hit = main.parse_document(blob, 'application/pdf', use_cache=False)
+    assert cache_hit is False
+    assert blob.download_to_file.call_count == 2
+
+def test_failed_parses_are_not_cached(monkeypatch, tmp_path):
+    import main
+    import parser
+    from parse_cache import LocalParseCache
+
+    cache = LocalParseCache(str(tmp_path))
+    monkeypatch.setattr(main, 'get_parse_cache', lambda: cache)
+    blob = Mock(md5_hash='1B2M2Y8AsgTpgAmY7PhCfg==', crc32c=None)
+    blob.download_to_file.side_effect = lambda buffer: buffer.write(_pdf_bytes('Nothing to see here'))
+
+    # No fields found
+    metadata, _ = main.parse_document(blob, 'application/pdf')
+    assert set(metadata) == {'metadata'}
+    _, cache_hit = main.parse_document(blob, 'application/pdf')
+    assert cache_hit is False
+
+    # A field found, but a page timed out
+    timed_out = {'tax_year': '2023', 'metadata': {'pages': [{'number': 1, 'seconds': 0.1},
+                                                            {'number': 2, 'seconds': 30.0, 'error': 'timed out'}]}}
+    monkeypatch.setattr(parser.TaxDocumentParser, 'parse_incremental', lambda self: dict(timed_out))
+    main.parse_document(blob, 'application/pdf')
+    _, cache_hit = main.parse_document(blob, 'application/pdf')
+    assert cache_hit is False
+    assert blob.download_to_file.call_count == 4
+
+def test_non_pdf_documents_are_neither_parsed_nor_cached(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, 'get_parse_cache', Mock(side_effect=AssertionError('cache used')))
+    blob = Mock(md5_hash='1B2M2Y8AsgTpgAmY7PhCfg==')
+
+    assert main.parse_document(blob, 'image/png') == ({}, False)
+    blob.download_to_file.assert_not_called()
@@ -0,0 +1,66 @@
+import base64
+import os
+from unittest.mock import Mock
+
+import pytest
+
+from parse_cache import LocalParseCache, parse_cache_key
+
+
+def test_cache_key_prefers_md5_and_is_a_valid_document_id():
+    md5 = base64.b64encode(bytes.fromhex('ff' * 16)).decode()
+    assert '/' in md5
+
+    key = parse_cache_key(Mock(md5_hash=md5, crc32c='AAAAAA=='), '2.0')
+
+    assert key == 'md5-' + 'ff' * 16 + '-v2.0'
+    assert '/' not in key
+
+def test_cache_key_falls_back_to_crc32c_for_composite_objects():
+    blob = Mock(md5_hash=None, crc32c=base64.b64encode(b'\x01\x02\x03\x04').decode())
+
+    assert parse_cache_key(blob, '2.0') == 'crc32c-01020304-v2.0'
+    assert parse_cache_key(Mock(md5_hash=None, crc32c=None), '2.0') is None
+
+def test_local_cache_round_trips_and_misses(tmp_path):
+    cache = LocalParseCache(str(tmp_path))
+
+    assert cache.get('md5-aa-v2.0') is None
+    cache.put('md5-aa-v2.0', {'tax_year': '2023', 'income': 52000.0})
+    assert cache.get('md5-aa-v2.0') == {'tax_year': '2023', 'income': 52000.0}
+
+def test_local_cache_evicts_least_recently_used(tmp_path):
+    cache = LocalParseCache(str(tmp_path), max_entries=2)
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    cache.get('a')
+
+    cache.put('c', {'n': 3})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1}
+    assert sorted(os.listdir(tmp_path)) == ['a.json', 'c.json']
+
+def test_local_cache_keeps_its_bound_across_restarts(tmp_path):
+    cache = LocalParseCache(str(tmp_path), max_entries=3)
+    for name in 'abc':
+        cache.put(name, {'name': name})
+    os.utime(tmp_path / 'a.json', (1, 1))
+
+    reopened = LocalParseCache(str(tmp_path), max_entries=2)
+
+    assert len(reopened) == 2
+    assert reopened.get('a') is None
+    assert reopened.get('c') == {'name': 'c'}
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = LocalParseCache(str(tmp_path))
+    cache.put('a', {'n': 1})
+    (tmp_path / 'a.json').write_text('{not json')
+
+    assert cache.get('a') is None
+    assert not (tmp_path / 'a.json').exists()
+
+def test_max_entries_must_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        LocalParseCache(str(tmp_path), max_entries=0)
@@ -0,0 +1,146 @@
+import io
+import random
+
+import pytest
+
+import parser as parser_module
+from field_scanner import FieldScanner
+from parser import TaxDocumentParser
+from pdf_text import PageText
+
+FIRST_PAGE = [
+    'Taxpayer Name: Jane Public',
+    'SSN: 123-45-6789',
+    'Total Income: $61,250.75',
+    'Balance Due: $350.25',
+    'Tax Year: 2023',
+    'Filing Status: Single',
+    '2023 Form 1040 (page 1)',
+]
+
+
+def make_pdf(pages):
+    canvas = pytest.importorskip('reportlab.pdfgen.canvas')
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for lines in pages:
+        for row, line in enumerate(lines):
+            pdf.drawString(72, 720 - 14 * row, line)
+        pdf.showPage()
+    pdf.save()
+    buffer.seek(0)
+    return buffer
+
+def _fields(parsed):
+    return {field: value for field, value in parsed.items() if field != 'metadata'}
+
+def _full_parse(document):
+    parser = TaxDocumentParser(document)
+    parser.extract_text()
+    return parser.parse_data()
+
+def test_stops_after_the_page_with_every_field():
+    schedule = ['Schedule 1 additional income 0.00'] * 5
+    document = make_pdf([FIRST_PAGE] + [schedule] * 9)
+    parser = TaxDocumentParser(document)
+
+    parsed = parser.parse_incremental()
+
+    assert parser.early_exit is True
+    assert [page['number'] for page in parsed['metadata']['pages']] == [1]
+    assert parsed['metadata']['early_exit'] is True
+    document.seek(0)
+    assert _fields(parsed) == _fields(_full_parse(document))
+
+def test_falls_back_to_every_page_when_a_field_is_missing():
+    document = make_pdf([FIRST_PAGE[:3], ['Wages 52,000.00'], ['Tax Year: 2023']])
+    parser = TaxDocumentParser(document)
+
+    parsed = parser.parse_incremental()
+
+    assert parser.early_exit is False
+    assert len(parsed['metadata']['pages']) == 3
+    document.seek(0)
+    assert _fields(parsed) == _fields(_full_parse(document))
+
+def test_low_confidence_matches_do_not_end_the_scan():
+    # A one-letter name scores 0.5, below the threshold, so every page is read
+    first_page = ['Name: J1'] + FIRST_PAGE[1:]
+    parser = TaxDocumentParser(make_pdf([first_page, ['Taxpayer Name: Jane Public']]))
+
+    parsed = parser.parse_incremental()
+
+    assert parser.early_exit is False
+    assert parsed['name'].startswith('Jane Public')
+
+def test_value_at_the_end_of_the_text_waits_for_the_next_page():
+    parser = TaxDocumentParser('unused.pdf')
+    parser.data = ' '.join(FIRST_PAGE[:-1])
+
+    # "Single" could continue on the next page
+    assert not parser._all_fields_found(0.9)
+    parser.data += ' 2023 Form 1040'
+    assert parser._all_fields_found(0.9)
+
+def test_early_exit_check_scans_each_page_once(monkeypatch):
+    # Filing status is never found, so every page is checked and none ends the scan
+    pages = [PageText(number, ' '.join(FIRST_PAGE[:5] + ['Schedule 1 additional income 0.00'] * 40), 0.0)
+             for number in range(1, 41)]
+    monkeypatch.setattr(parser_module, 'iter_pages', lambda source, timeout: iter(pages))
+    scanned = []
+    first_matches = FieldScanner.first_matches
+
+    def counting_first_matches(self, text, start=0, previous=None):
+        scanned.append(len(text) - start)
+        return first_matches(self, text, start, previous)
+
+    monkeypatch.setattr(FieldScanner, 'first_matches', counting_first_matches)
+    parser = TaxDocumentParser('unused.pdf')
+
+    parser.parse_incremental()
+
+    assert parser.early_exit is False
+    assert len(scanned) == len(pages)
+    # Rescanning the text so far after every page would be about len(pages) / 2 times the text
+    assert sum(scanned) <= len(parser.data) + len(pages) * TaxDocumentParser.PAGE_OVERLAP_CHARS
+
+def test_early_exit_check_matches_a_full_scan_when_labels_are_split_across_pages():
+    fragments = [
+        'Name: ', 'Taxpayer Name: ', 'SSN: ', 'Tax ID: ', 'Total Income: $', 'Balance Due: $', 'Tax Year: ',
+        'Filing Status: ', 'Jane Public', '2023', '1,234.50', '123-45-6789', 'Single', ' ', '\n'
+    ]
+    rng = random.Random(20)
+    for _ in range(200):
+        text = ''.join(rng.choice(fragments) for _ in range(rng.randint(0, 60)))
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 5))))
+        parser = TaxDocumentParser('unused.pdf')
+        parser.data = ''
+        for cut in cuts + [len(text)]:
+            parser.data = text[:cut]
+            fresh = TaxDocumentParser('unused.pdf')
+            fresh.data = parser.data
+            assert parser._all_fields_found(0.5) == fresh._all_fields_found(0.5), (text, cut)
+            assert {field: [match and match.span() for match in matches]
+                    for field, matches in parser._first_matches.items()} == \
+                {field: [match and match.span() for match in matches]
+                 for field, matches in fresh._first_matches.items()}, (text, cut)
+
+def test_a_better_candidate_later_in_the_text_wins():
+    parser = TaxDocumentParser('unused.pdf')
+    parser.data = 'Name: J1 Tax Year: 2023 Taxpayer Name: Jane Public SSN: 123-45-6789'
+
+    parsed = parser.parse_data()
+
+    assert parsed['name'].startswith('Jane Public')
+    assert [candidate['value'] for candidate in parsed['metadata']['candidates']['name']][-1] == 'J'
+
+def test_candidates_are_ranked_with_page_and_label_features():
+    parser = TaxDocumentParser(make_pdf([['Tax Year:', '2022'], ['Tax Year: 2023'], ['Tax Year: 2021']]))
+    parser.extract_text()
+
+    ranked = parser.rank_candidates(top_k=2)
+
+    # Same-line values outrank the one set on the next line; the first page outranks later ones
+    assert [(candidate.value, candidate.page) for candidate in ranked['tax_year']] == [('2023', 2), ('2021', 3)]
+    assert ranked['tax_year'][0].score > ranked['tax_year'][1].score
+    assert ranked['name'] == []
@@ -0,0 +1,111 @@
+import io
+import threading
+import time
+
+import pytest
+from PyPDF2 import PageObject
+
+import pdf_text
+from pdf_text import extract_pages, join_pages
+
+
+def make_pdf(pages):
+    canvas = pytest.importorskip('reportlab.pdfgen.canvas')
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for number in range(1, pages + 1):
+        pdf.drawString(72, 720, f'Page {number} Wages: ${number},000.00')
+        pdf.showPage()
+    pdf.save()
+    buffer.seek(0)
+    return buffer
+
+def test_serial_extraction_keeps_page_order_and_timings():
+    pages = extract_pages(make_pdf(3))
+
+    assert [page.number for page in pages] == [1, 2, 3]
+    assert all(page.error is None and page.seconds >= 0 for page in pages)
+    assert 'Page 2 Wages' in pages[1].text
+    assert join_pages(pages).index('Page 1') < join_pages(pages).index('Page 3')
+
+def test_parallel_extraction_matches_serial():
+    document = make_pdf(pdf_text.PARALLEL_MIN_PAGES + 2)
+    serial = extract_pages(document)
+
+    parallel = extract_pages(document, workers=2, page_timeout=30)
+
+    assert [page.text for page in parallel] == [page.text for page in serial]
+    assert [page.stats()['number'] for page in parallel] == list(range(1, len(serial) + 1))
+
+def test_short_documents_are_not_sent_to_a_pool(monkeypatch):
+    def fail(*args):
+        raise AssertionError('pool started')
+
+    monkeypatch.setattr(pdf_text, '_extract_parallel', fail)
+    assert len(extract_pages(make_pdf(2), workers=4)) == 2
+
+def test_failed_page_is_recorded_without_losing_the_others(monkeypatch):
+    original = PageObject.extract_text
+
+    def extract_text(page, *args, **kwargs):
+        text = original(page, *args, **kwargs)
+        if 'Page 2' in text:
+            raise ValueError('bad content stream')
+        return text
+
+    monkeypatch.setattr(PageObject, 'extract_text', extract_text)
+    pages = extract_pages(make_pdf(3))
+
+    assert pages[1].text == '' and pages[1].error == 'bad content stream'
+    assert pages[1].stats()['error'] == 'bad content stream'
+    assert 'error' not in pages[0].stats()
+    assert 'Page 3' in join_pages(pages)
+
+def test_slow_page_times_out(monkeypatch):
+    original = PageObject.extract_text
+
+    def extract_text(page, *args, **kwargs):
+        text = original(page, *args, **kwargs)
+        if 'Page 1' in text:
+            time.sleep(5)
+        return text
+
+    monkeypatch.setattr(PageObject, 'extract_text', extract_text)
+    started = time.monotonic()
+    pages = extract_pages(make_pdf(2), page_timeout=0.2)
+
+    assert time.monotonic() - started < 2
+    assert pages[0].error.startswith('timed out')
+    assert 'Page 2' in pages[1].text
+
+def test_timeout_off_the_main_thread_uses_a_pool_process(monkeypatch):
+    calls = []
+
+    def extract_parallel(source, page_count, workers, page_timeout):
+        calls.append((page_count, workers, page_timeout))
+        return []
+
+    monkeypatch.setattr(pdf_text, '_extract_parallel', extract_parallel)
+    worker = threading.Thread(target=extract_pages, args=(make_pdf(2),), kwargs={'page_timeout': 5})
+    worker.start()
+    worker.join()
+
+    assert calls == [(2, 1, 5)]
+    assert len(extract_pages(make_pdf(2), page_timeout=5)) == 2
+
+def test_incremental_extraction_off_the_main_thread_runs_in_a_process(monkeypatch):
+    # Spawned workers import pdf_text afresh, so only this process sees the patch
+    monkeypatch.setattr(pdf_text, '_extract_page', None)
+    pages = []
+
+    def read_first_page():
+        for page in pdf_text.iter_pages(make_pdf(3), page_timeout=30):
+            pages.append(page)
+            break
+
+    worker = threading.Thread(target=read_first_page)
+    worker.start()
+    worker.join(timeout=30)
+
+    assert [page.number for page in pages] == [1]
+    assert 'Page 1 Wages' in pages[0].text
@@ -0,0 +1,147 @@
+"""
+Fair Scheduling for the TaxFront task queue
+Deficit round-robin across users within each priority band, plus queue wait-time tracking
+"""
+
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class FairScheduler:
+    """Decides how many tasks to claim for each user.
+
+    Priority bands are still served strictly from highest to lowest. Within
+    a band, users take turns by deficit round-robin: each turn adds the
+    user's weight (default 1.0) to their deficit and they may claim one
+    task per whole unit of deficit. A user with 2,000 queued documents
+    therefore gets the same share of a claim as a user with two.
+
+    Deficits and the round-robin position persist between calls, so small
+    claims (a worker asking for one task at a time) still rotate through
+    users instead of always starting with the same one.
+    """
+
+    def __init__(
+        self,
+        max_in_flight_per_user: Optional[int] = None,
+        user_in_flight_caps: Optional[Dict[str, int]] = None,
+        user_weights: Optional[Dict[str, float]] = None
+    ):
+        if user_weights and any(weight <= 0 for weight in user_weights.values()):
+            raise ValueError("User weights must be positive")
+
+        # Cap on a user's IN_PROGRESS tasks across all workers; None means unlimited
+        self.max_in_flight_per_user = max_in_flight_per_user
+        self.user_in_flight_caps = dict(user_in_flight_caps or {})
+        self.user_weights = dict(user_weights or {})
+
+        self._lock = threading.Lock()
+        self._deficits: Dict[Tuple[int, str], float] = {}
+        self._last_served: Dict[int, str] = {}
+
+    def in_flight_cap(self, user_id: str) -> Optional[int]:
+        return self.user_in_flight_caps.get(user_id, self.max_in_flight_per_user)
+
+    def allocate(
+        self,
+        backlog: Dict[int, Dict[str, int]],
+        n: int,
+        in_flight: Optional[Dict[str, int]] = None
+    ) -> List[Tuple[int, str]]:
+        """Pick up to ``n`` (priority, user_id) slots in the order they should be served.
+
+        ``backlog`` maps priority to the number of pending tasks per user and
+        ``in_flight`` maps user id to that user's tasks already in progress.
+        """
+
+        in_flight = dict(in_flight or {})
+        picks: List[Tuple[int, str]] = []
+
+        with self._lock:
+            for priority in sorted(backlog, reverse=True):
+                if len(picks) >= n:
+                    break
+                remaining = {user: count for user, count in backlog[priority].items() if count > 0}
+                ring = self._ring(priority, remaining)
+
+                while ring and len(picks) < n:
+                    for user_id in list(ring):
+                        if len(picks) >= n:
+                            break
+                        if self._at_cap(user_id, in_flight):
+                            ring.remove(user_id)
+                            continue
+
+                        key = (priority, user_id)
+                        deficit = self._deficits.get(key, 0.0) + self.user_weights.get(user_id, 1.0)
+                        while (
+                            deficit >= 1 and remaining[user_id] and len(picks) < n
+                            and not self._at_cap(user_id, in_flight)
+                        ):
+                            picks.append(key)
+                            deficit -= 1
+                            remaining[user_id] -= 1
+                            in_flight[user_id] = in_flight.get(user_id, 0) + 1
+
+                        self._last_served[priority] = user_id
+                        if remaining[user_id]:
+                            self._deficits[key] = deficit
+                        else:
+                            # An emptied queue forfeits its deficit, as in standard DRR
+                            self._deficits.pop(key, None)
+                            ring.remove(user_id)
+
+        return picks
+
+    def _ring(self, priority: int, users: Iterable[str]) -> List[str]:
+        """Users in round-robin order, starting after the last one served in this band"""
+
+        ring = sorted(users)
+        last = self._last_served.get(priority)
+        if last is None:
+            return ring
+        start = next((i for i, user_id in enumerate(ring) if user_id > last), 0)
+        return ring[start:] + ring[:start]
+
+    def _at_cap(self, user_id: str, in_flight: Dict[str, int]) -> bool:
+        cap = self.in_flight_cap(user_id)
+        return cap is not None and in_flight.get(user_id, 0) >= cap
+
+class WaitTimeTracker:
+    """Recent queue wait times (enqueue or due time → claim) per user"""
+
+    def __init__(self, max_samples_per_user: int = 1000):
+        self.max_samples_per_user = max_samples_per_user
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, user_id: str, wait_seconds: float):
+        with self._lock:
+            samples = self._samples.get(user_id)
+            if samples is None:
+                samples = self._samples[user_id] = deque(maxlen=self.max_samples_per_user)
+            samples.append(max(wait_seconds, 0.0))
+
+    def percentiles(self, percentiles: Iterable[int] = (50, 90, 99)) -> Dict[str, Dict[str, float]]:
+        """Nearest-rank wait-time percentiles in seconds, keyed by user id"""
+
+        with self._lock:
+            snapshot = {user_id: sorted(samples) for user_id, samples in self._samples.items()}
+
+        report = {}
+        for user_id, samples in snapshot.items():
+            if not samples:
+                continue
+            user_report = {'count': len(samples)}
+            for p in percentiles:
+                rank = max(1, -(-p * len(samples) // 100))
+                user_report[f"p{p}"] = samples[min(rank, len(samples)) - 1]
+            report[user_id] = user_report
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
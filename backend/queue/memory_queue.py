@@ -0,0 +1,488 @@
+"""
+In-memory Task Queue for TaxFront
+Heap-based BaseTaskQueue backend for tests, benchmarks and single-box batch runs
+"""
+
+import heapq
+import itertools
+import threading
+import uuid
+from dataclasses import replace
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Set, Tuple
+import logging
+
+from .notifier import TaskNotifier
+from .rate_limit import RateLimiter
+from .task_manager import (
+    BaseTaskQueue, DELAYED_STATUSES, FINISHED_STATUSES, Task, TaskType, TaskStatus, TaskPriority
+)
+
+logger = logging.getLogger(__name__)
+
+class InMemoryTaskQueue(BaseTaskQueue):
+    """Process-local task queue with the same semantics as the Firestore TaskQueue.
+
+    Ready tasks sit in one heap per task type ordered by (priority DESC,
+    created_at ASC); tasks scheduled in the future, including retries waiting
+    out their backoff, sit in a delayed heap ordered by ``scheduled_at`` and
+    are promoted when they come due. Heap entries are invalidated lazily: an
+    entry is live only while its sequence number matches ``_entries``.
+    """
+
+    def __init__(
+        self,
+        worker_id: Optional[str] = None,
+        lease_seconds: int = 120,
+        sweep_interval_seconds: int = 60,
+        promote_interval_seconds: float = 5,
+        notifier: Optional[TaskNotifier] = None,
+        rate_limiter: Optional[RateLimiter] = None
+    ):
+        super().__init__(
+            worker_id, lease_seconds, sweep_interval_seconds, promote_interval_seconds, notifier, rate_limiter
+        )
+        self._lock = threading.RLock()
+        self._tasks: Dict[str, Task] = {}
+        self._ready: Dict[TaskType, List[Tuple[int, datetime, int, str]]] = {}
+        self._delayed: List[Tuple[datetime, int, str]] = []
+        self._entries: Dict[str, int] = {}
+        self._seq = itertools.count()
+        # Dedupe key -> id of the newest task enqueued with it
+        self._dedupe: Dict[str, str] = {}
+        # Parent id -> ids of BLOCKED tasks waiting for it
+        self._dependents: Dict[str, Set[str]] = {}
+
+    def enqueue_task(
+        self,
+        task_type: TaskType,
+        user_id: str,
+        payload: Dict[str, Any],
+        priority: TaskPriority = TaskPriority.NORMAL,
+        scheduled_at: Optional[datetime] = None,
+        max_retries: int = 3,
+        timeout_seconds: int = 300,
+        dedupe_key: Optional[str] = None,
+        depends_on: Optional[List[str]] = None
+    ) -> str:
+        """Add a new task unless an unfinished task holds the same ``dedupe_key``.
+
+        With ``depends_on`` the task is BLOCKED until those tasks complete.
+        """
+
+        task = self._new_task(
+            task_type, user_id, payload, priority, scheduled_at, max_retries, timeout_seconds, dedupe_key,
+            depends_on
+        )
+
+        with self._lock:
+            if task.depends_on:
+                self._check_dependencies(task.depends_on, self._parent_states(task.depends_on))
+
+            if dedupe_key is not None:
+                existing = self._tasks.get(self._dedupe.get(dedupe_key))
+                if existing is not None and existing.status not in FINISHED_STATUSES:
+                    logger.info(f"Task for dedupe key {dedupe_key} already queued as {existing.id}")
+                    return existing.id
+                self._dedupe[dedupe_key] = task.id
+
+            self._tasks[task.id] = task
+            if task.depends_on:
+                self._settle(task, task.created_at)
+            else:
+                self._push(task, datetime.now())
+
+        logger.info(f"Enqueued task {task.id} of type {task_type.value} for user {user_id}")
+        return task.id
+
+    def claim_batch(
+        self,
+        n: int,
+        task_types: Optional[List[TaskType]] = None,
+        worker_id: Optional[str] = None,
+        lease_seconds: Optional[int] = None
+    ) -> List[Task]:
+        """Claim up to ``n`` available tasks under a lease"""
+
+        self._maybe_sweep_expired_leases()
+
+        worker_id = worker_id or self.worker_id
+        lease_seconds = lease_seconds or self.lease_seconds
+        n = self._rate_limited_count(n, task_types)
+        claimed = []
+
+        with self._lock:
+            now = datetime.now()
+            self._promote_due(now)
+            heaps = [self._ready[t] for t in (task_types or list(self._ready)) if t in self._ready]
+
+            while len(claimed) < n:
+                heap = self._best_heap(heaps)
+                if heap is None:
+                    break
+
+                _, _, _, task_id = heapq.heappop(heap)
+                task = self._tasks[task_id]
+                del self._entries[task_id]
+
+                task.status = TaskStatus.IN_PROGRESS
+                task.worker_id = worker_id
+                task.lease_id = uuid.uuid4().hex
+                task.lease_expires_at = now + timedelta(seconds=lease_seconds)
+                task.deadline_at = now + timedelta(seconds=task.timeout_seconds)
+                task.started_at = now
+                task.updated_at = now
+                claimed.append(replace(task))
+
+        claimed = self._apply_rate_limits(claimed, worker_id)
+        self._record_wait_times(claimed)
+        for task in claimed:
+            logger.info(f"Claimed task {task.id} of type {task.type.value} (worker {worker_id})")
+        return claimed
+
+    def renew_lease(
+        self,
+        task_id: str,
+        worker_id: Optional[str] = None,
+        lease_seconds: Optional[int] = None,
+        lease_id: Optional[str] = None
+    ) -> bool:
+        """Extend the lease on a claimed task; returns False if the lease was lost"""
+
+        worker_id = worker_id or self.worker_id
+        lease_seconds = lease_seconds or self.lease_seconds
+
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task.status != TaskStatus.IN_PROGRESS:
+                return False
+            if not self._holds_lease({'worker_id': task.worker_id, 'lease_id': task.lease_id}, worker_id, lease_id):
+                return False
+            task.lease_expires_at = datetime.now() + timedelta(seconds=lease_seconds)
+            return True
+
+    def requeue_expired_leases(self, limit: int = 100) -> int:
+        """Put tasks whose lease has expired back in the queue"""
+
+        requeued = 0
+        with self._lock:
+            now = datetime.now()
+            for task in self._tasks.values():
+                if requeued >= limit:
+                    break
+                if task.status != TaskStatus.IN_PROGRESS or task.lease_expires_at >= now:
+                    continue
+
+                task.status = TaskStatus.PENDING
+                task.worker_id = None
+                task.lease_id = None
+                task.lease_expires_at = None
+                task.deadline_at = None
+                task.started_at = None
+                task.updated_at = now
+                self._push(task, now)
+                requeued += 1
+
+        if requeued:
+            logger.info(f"Requeued {requeued} tasks with expired leases")
+        return requeued
+
+    def _timed_out_tasks(self, limit: int) -> Dict[str, int]:
+        with self._lock:
+            now = datetime.now()
+            timed_out = [
+                task for task in self._tasks.values()
+                if task.status == TaskStatus.IN_PROGRESS and task.deadline_at and task.deadline_at < now
+            ]
+            timed_out.sort(key=lambda task: task.deadline_at)
+            return {task.id: task.timeout_seconds for task in timed_out[:limit]}
+
+    def promote_due_tasks(self, limit: int = 200) -> int:
+        """Move delayed tasks whose ``scheduled_at`` has passed to PENDING"""
+
+        with self._lock:
+            return self._promote_due(datetime.now(), limit)
+
+    def next_due_at(self) -> Optional[datetime]:
+        """Earliest ``scheduled_at`` among delayed tasks"""
+
+        with self._lock:
+            while self._delayed and self._entries.get(self._delayed[0][2]) != self._delayed[0][1]:
+                heapq.heappop(self._delayed)
+            return self._delayed[0][0] if self._delayed else None
+
+    def complete_batch(
+        self,
+        results: Dict[str, Optional[Dict[str, Any]]],
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """Mark several tasks as completed"""
+
+        completed = []
+        with self._lock:
+            now = datetime.now()
+            for task_id, result in results.items():
+                task = self._claimed_task(task_id, worker_id, lease_ids)
+                if task is None:
+                    continue
+
+                task.status = TaskStatus.COMPLETED
+                task.completed_at = now
+                task.updated_at = now
+                if result:
+                    task.result = result
+                completed.append(task_id)
+            self._release_dependents(completed, now)
+
+        for task_id in completed:
+            logger.info(f"Completed task {task_id}")
+        return completed
+
+    def fail_batch(
+        self,
+        errors: Dict[str, str],
+        retry: bool = True,
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> Dict[str, TaskStatus]:
+        """Mark several tasks as failed, re-queueing those with retries left"""
+
+        outcomes = {}
+        with self._lock:
+            now = datetime.now()
+            for task_id, error_message in errors.items():
+                task = self._claimed_task(task_id, worker_id, lease_ids)
+                if task is None:
+                    continue
+
+                outcomes[task_id] = self._apply_failure(task, error_message, retry, now)
+                if task.status == TaskStatus.RETRY:
+                    self._push(task, now)
+            self._release_dependents(
+                [task_id for task_id, status in outcomes.items() if status == TaskStatus.FAILED], now
+            )
+
+        return outcomes
+
+    def defer_batch(
+        self,
+        delays: Dict[str, float],
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """Hand claimed tasks back as SCHEDULED without using a retry"""
+
+        deferred = []
+        with self._lock:
+            now = datetime.now()
+            for task_id, delay_seconds in delays.items():
+                task = self._claimed_task(task_id, worker_id, lease_ids)
+                if task is None:
+                    continue
+
+                self._apply_deferral(task, delay_seconds, now)
+                self._push(task, now)
+                deferred.append(task_id)
+
+        return deferred
+
+    def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get the current status of a task"""
+
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return task.to_dict() if task else None
+
+    def get_user_tasks_page(
+        self,
+        user_id: str,
+        status: Optional[TaskStatus] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get one page of a user's tasks, newest first"""
+
+        limit = max(1, limit)
+        after = self._parse_page_cursor(cursor) if cursor else None
+
+        with self._lock:
+            rows = [
+                task.to_dict() for task in self._tasks.values()
+                if task.user_id == user_id and (status is None or task.status == status)
+            ]
+
+        if after:
+            rows = [row for row in rows if (row['created_at'], row['id']) < after]
+        rows = heapq.nlargest(limit + 1, rows, key=lambda row: (row['created_at'], row['id']))
+
+        next_cursor = self._page_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return {'tasks': rows[:limit], 'next_cursor': next_cursor}
+
+    def cancel_task(self, task_id: str) -> bool:
+        """Cancel a pending, scheduled or blocked task; tasks depending on it fail"""
+
+        cancellable = (TaskStatus.PENDING, TaskStatus.SCHEDULED, TaskStatus.BLOCKED)
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task.status not in cancellable:
+                return False
+
+            task.status = TaskStatus.CANCELLED
+            task.updated_at = datetime.now()
+            self._entries.pop(task_id, None)
+            self._release_dependents([task_id], task.updated_at)
+
+        logger.info(f"Cancelled task {task_id}")
+        return True
+
+    def cleanup_old_tasks(self, days_old: int = 30) -> int:
+        """Delete completed and failed tasks older than ``days_old``"""
+
+        cutoff_date = datetime.now() - timedelta(days=days_old)
+        with self._lock:
+            old_ids = [
+                task.id for task in self._tasks.values()
+                if task.status in (TaskStatus.COMPLETED, TaskStatus.FAILED) and task.updated_at < cutoff_date
+            ]
+            for task_id in old_ids:
+                task = self._tasks.pop(task_id)
+                if task.dedupe_key and self._dedupe.get(task.dedupe_key) == task_id:
+                    del self._dedupe[task.dedupe_key]
+
+        if old_ids:
+            logger.info(f"Cleaned up {len(old_ids)} old tasks")
+        return len(old_ids)
+
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """Get queue statistics"""
+
+        stats = {
+            'pending': 0,
+            'delayed': 0,
+            'blocked': 0,
+            'in_progress': 0,
+            'completed_today': 0,
+            'failed_today': 0,
+            'by_type': {},
+            'by_priority': {},
+            'by_user': {},
+            'in_progress_by_user': {}
+        }
+        today_start = datetime.combine(datetime.now().date(), datetime.min.time())
+
+        with self._lock:
+            for task in self._tasks.values():
+                if task.status == TaskStatus.PENDING:
+                    stats['pending'] += 1
+                    task_type = task.type.value
+                    priority = str(task.priority.value)
+                    stats['by_type'][task_type] = stats['by_type'].get(task_type, 0) + 1
+                    stats['by_priority'][priority] = stats['by_priority'].get(priority, 0) + 1
+                    stats['by_user'][task.user_id] = stats['by_user'].get(task.user_id, 0) + 1
+                elif task.status in DELAYED_STATUSES:
+                    stats['delayed'] += 1
+                elif task.status == TaskStatus.BLOCKED:
+                    stats['blocked'] += 1
+                elif task.status == TaskStatus.IN_PROGRESS:
+                    stats['in_progress'] += 1
+                    in_progress_by_user = stats['in_progress_by_user']
+                    in_progress_by_user[task.user_id] = in_progress_by_user.get(task.user_id, 0) + 1
+                elif task.status == TaskStatus.COMPLETED and task.completed_at >= today_start:
+                    stats['completed_today'] += 1
+                elif task.status == TaskStatus.FAILED and task.updated_at >= today_start:
+                    stats['failed_today'] += 1
+
+        return stats
+
+    def _push(self, task: Task, now: datetime):
+        """Index a pending or retrying task in the ready or delayed heap"""
+
+        seq = next(self._seq)
+        self._entries[task.id] = seq
+
+        if task.scheduled_at and task.scheduled_at > now:
+            heapq.heappush(self._delayed, (task.scheduled_at, seq, task.id))
+        else:
+            self._push_ready(task, seq)
+
+    def _push_ready(self, task: Task, seq: int):
+        heap = self._ready.setdefault(task.type, [])
+        heapq.heappush(heap, (-task.priority.value, task.created_at, seq, task.id))
+        self.notifier.notify()
+
+    def _promote_due(self, now: datetime, limit: Optional[int] = None) -> int:
+        """Move delayed tasks whose ``scheduled_at`` has passed into the ready heaps"""
+
+        promoted = 0
+        while self._delayed and self._delayed[0][0] <= now and (limit is None or promoted < limit):
+            _, seq, task_id = heapq.heappop(self._delayed)
+            if self._entries.get(task_id) != seq:
+                continue
+
+            task = self._tasks[task_id]
+            task.status = TaskStatus.PENDING
+            task.updated_at = now
+            self._push_ready(task, seq)
+            promoted += 1
+        return promoted
+
+    def _parent_states(self, task_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return {
+            task_id: {'status': self._tasks[task_id].status.value, 'result': self._tasks[task_id].result}
+            for task_id in task_ids if task_id in self._tasks
+        }
+
+    def _settle(self, task: Task, now: datetime) -> Optional[TaskStatus]:
+        """Queue a BLOCKED task whose parents completed, or record it as waiting on them"""
+
+        status = self._settle_blocked(task, self._parent_states(task.depends_on), now)
+        if status is None:
+            for parent_id in task.depends_on:
+                self._dependents.setdefault(parent_id, set()).add(task.id)
+        elif status != TaskStatus.FAILED:
+            self._push(task, now)
+        return status
+
+    def _release_dependents(self, parent_ids: List[str], now: datetime):
+        """Settle the BLOCKED children of tasks that just finished, cascading failures"""
+
+        while parent_ids:
+            failed = []
+            for parent_id in parent_ids:
+                for child_id in sorted(self._dependents.pop(parent_id, ())):
+                    child = self._tasks.get(child_id)
+                    if child is None or child.status != TaskStatus.BLOCKED:
+                        continue
+                    if self._settle(child, now) == TaskStatus.FAILED:
+                        failed.append(child_id)
+            parent_ids = failed
+
+    def _best_heap(self, heaps: List[list]) -> Optional[list]:
+        """Return the heap whose top entry should be claimed next, dropping stale entries"""
+
+        best = None
+        for heap in heaps:
+            while heap and self._entries.get(heap[0][3]) != heap[0][2]:
+                heapq.heappop(heap)
+            if heap and (best is None or heap[0] < best[0]):
+                best = heap
+        return best
+
+    def _claimed_task(
+        self,
+        task_id: str,
+        worker_id: Optional[str],
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> Optional[Task]:
+        """Return the in-progress task if the caller may complete or fail it"""
+
+        task = self._tasks.get(task_id)
+        if task is None or task.status != TaskStatus.IN_PROGRESS:
+            logger.warning(f"Task {task_id} is not in progress")
+            return None
+        lease_id = (lease_ids or {}).get(task_id)
+        if not self._holds_lease({'worker_id': task.worker_id, 'lease_id': task.lease_id}, worker_id, lease_id):
+            logger.warning(f"Worker {worker_id} no longer holds the lease on task {task_id}")
+            return None
+        return task
@@ -0,0 +1,111 @@
+"""
+Task Notifiers for the TaxFront task queue
+Wake idle workers when a task becomes claimable instead of polling on a fixed interval
+"""
+
+import sqlite3
+import threading
+from typing import TYPE_CHECKING, List, Optional
+import logging
+
+from firebase_admin import firestore
+
+if TYPE_CHECKING:
+    from .task_manager import TaskType
+
+logger = logging.getLogger(__name__)
+
+# TaskStatus.PENDING.value; task_manager imports this module, so it cannot be imported here
+PENDING_STATUS = 'pending'
+
+class TaskNotifier:
+    """In-process wake-up signal for idle workers.
+
+    Every queue owns one. The queue calls ``notify`` when a task becomes
+    PENDING (enqueued, promoted, requeued or unblocked) and workers block
+    in ``wait`` between claims. This base class only sees tasks made ready
+    by the same process; subclasses add a cross-process source.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def notify(self):
+        self._event.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until notified or ``timeout`` passes; returns True if notified"""
+
+        notified = self._event.wait(timeout)
+        self._event.clear()
+        return notified
+
+    def close(self):
+        """Release listener resources"""
+
+class FirestoreTaskNotifier(TaskNotifier):
+    """Notifier driven by a snapshot listener on PENDING tasks in ``task_queue``.
+
+    The listener pays one document read when it starts, for each task that
+    is already pending, and one read for each task that becomes pending
+    after that. An idle worker therefore costs nothing per second, where
+    polling ``claim_batch`` costs at least one read every poll interval.
+    """
+
+    def __init__(
+        self,
+        db: firestore.Client,
+        collection_name: str = 'task_queue',
+        task_types: Optional[List['TaskType']] = None
+    ):
+        super().__init__()
+        query = db.collection(collection_name).where('status', '==', PENDING_STATUS)
+        if task_types:
+            query = query.where('type', 'in', [t.value for t in task_types])
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    def _on_snapshot(self, snapshots, changes, read_time):
+        # Claimed tasks leave the result set as REMOVED; only tasks entering it are new work
+        if any(change.type.name == 'ADDED' for change in changes):
+            self.notify()
+
+    def close(self):
+        self._watch.unsubscribe()
+
+class SQLiteTaskNotifier(TaskNotifier):
+    """Notifier for an SQLite queue file shared between processes.
+
+    A background thread polls ``PRAGMA data_version``, which changes when
+    any other connection commits to the database. This is a cheap read of
+    the file header that does not touch the tasks table. Any commit
+    notifies, so a worker may wake and find nothing to claim; it then
+    waits again.
+    """
+
+    def __init__(self, path: str, check_interval_seconds: float = 0.05):
+        super().__init__()
+        self.check_interval_seconds = check_interval_seconds
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name='sqlite-task-notifier', daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        version = self._data_version()
+        while not self._closed.wait(self.check_interval_seconds):
+            try:
+                current = self._data_version()
+            except sqlite3.Error as e:
+                logger.warning(f"Checking the queue database for changes failed: {e}")
+                continue
+            if current != version:
+                version = current
+                self.notify()
+
+    def _data_version(self) -> int:
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        self._conn.close()
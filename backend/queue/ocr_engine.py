@@ -0,0 +1,289 @@
+"""
+OCR engine for scanned documents
+Preprocesses images and rasterised PDF pages and recognises them on a long-lived pool of worker processes
+"""
+
+import io
+import multiprocessing
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import logging
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Pages are read at this resolution at most; tesseract gains nothing above it and slows down a lot
+DEFAULT_TARGET_DPI = 300
+
+# Bounds the long side of an image with no usable DPI recorded (phone photos), as a letter page at the target DPI
+PAGE_LONG_SIDE_INCHES = 11.0
+
+# Skew is searched within +/- this many degrees, in steps of SKEW_STEP_DEGREES, on a thumbnail this wide
+MAX_SKEW_DEGREES = 5.0
+SKEW_STEP_DEGREES = 0.5
+SKEW_THUMBNAIL_PIXELS = 600
+
+# Allowed on top of the page timeout for a worker to start and hand back its result
+WORKER_GRACE_SECONDS = 10.0
+
+# Bounds the wait on a page when no page timeout is given
+PAGE_BACKSTOP_SECONDS = 300.0
+
+@dataclass
+class OcrConfig:
+    """OCR engine configuration"""
+    # Worker processes, which is also the most pages in flight per document; 0 runs OCR in the caller.
+    # The pool is per engine, so each process that builds an engine starts this many more processes.
+    max_workers: int = 2
+    # Time tesseract may spend on one page before the page is given up on
+    page_timeout_seconds: Optional[float] = 60.0
+    target_dpi: int = DEFAULT_TARGET_DPI
+    deskew: bool = True
+    language: str = 'eng'
+
+@dataclass
+class OcrPage:
+    """Text recognised on one page or image; ``number`` is 1-based and ``error`` is set if OCR failed.
+
+    Shaped like pdf_text.PageText, so OCRed pages can stand in for pages
+    whose text layer is missing, without the queue importing from the
+    Cloud Functions source.
+    """
+    number: int
+    text: str
+    seconds: float
+    error: Optional[str] = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Timing and failure for document metadata, without the text"""
+        stats = asdict(self)
+        del stats['text']
+        if stats['error'] is None:
+            del stats['error']
+        return stats
+
+def preprocess(image: Image.Image, target_dpi: int = DEFAULT_TARGET_DPI, deskew: bool = True) -> Image.Image:
+    """Grayscale copy of ``image`` downscaled to ``target_dpi`` and, with ``deskew``, straightened.
+
+    The image's own DPI is used where it records a plausible one; otherwise
+    its long side is bounded as if it were a letter page.
+    """
+    image = ImageOps.exif_transpose(image)
+    gray = image.convert('L')
+
+    scale = target_dpi * PAGE_LONG_SIDE_INCHES / max(gray.size)
+    dpi = image.info.get('dpi')
+    if dpi and min(dpi) >= 72:
+        scale = min(scale, target_dpi / min(dpi))
+    if scale < 1:
+        gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))), Image.LANCZOS)
+
+    if deskew:
+        angle = estimate_skew(gray)
+        if angle:
+            gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    return gray
+
+def estimate_skew(gray: Image.Image, max_degrees: float = MAX_SKEW_DEGREES, step: float = SKEW_STEP_DEGREES) -> float:
+    """Rotation in degrees (counter-clockwise) that lines the text of ``gray`` up with the rows.
+
+    Text lines are straight when the ink per pixel row varies the most: rows
+    alternate between full lines and blank gaps. Each candidate angle is
+    scored on a thumbnail, and the row sums come from a one-pixel-wide box
+    resize, so the search stays in C.
+    """
+    thumbnail = gray.copy()
+    thumbnail.thumbnail((SKEW_THUMBNAIL_PIXELS, SKEW_THUMBNAIL_PIXELS))
+    # Ink white on black, so the corners rotation exposes read as blank paper
+    ink = ImageOps.invert(thumbnail).point(lambda value: 255 if value > 128 else 0)
+
+    steps = int(max_degrees / step)
+    best_angle, best_score = 0.0, -1.0
+    # Nearest to level first, so a page with no clear lines is left as it is
+    for index in sorted(range(-steps, steps + 1), key=abs):
+        angle = index * step
+        rows = ink.rotate(angle, resample=Image.BILINEAR).resize((1, ink.height), Image.BOX).tobytes()
+        mean = sum(rows) / len(rows)
+        score = sum((row - mean) ** 2 for row in rows)
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+def tesseract_recognizer(image: Image.Image, timeout: Optional[float], language: str) -> str:
+    """Text of a preprocessed page, by tesserocr's in-process API where installed, else the tesseract CLI"""
+    api = _tesserocr_api(language)
+    if api is not None:
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    import pytesseract
+    return pytesseract.image_to_string(image, lang=language, timeout=timeout or 0)
+
+_tesserocr_apis: dict = {}
+
+def _tesserocr_api(language: str):
+    # One API per process and language, so the models are loaded once rather than per page
+    if language not in _tesserocr_apis:
+        try:
+            import tesserocr
+            _tesserocr_apis[language] = tesserocr.PyTessBaseAPI(lang=language)
+        except ImportError:
+            _tesserocr_apis[language] = None
+    return _tesserocr_apis[language]
+
+class OcrEngine:
+    """Recognises images and scanned PDF pages on a pool of worker processes kept between documents.
+
+    Each worker preprocesses and recognises one page at a time, and at most
+    ``max_workers`` pages of a document are in flight, so a long scan holds
+    a bounded number of page images. A page tesseract gives up on, or that
+    outlives ``page_timeout_seconds`` by WORKER_GRACE_SECONDS, comes back
+    with ``error`` set; in the second case the pool is replaced, which also
+    fails pages other threads had in flight on it.
+
+    The pool belongs to the engine, not the machine: every process that
+    builds an engine starts ``max_workers`` OCR processes of its own. Under
+    a TaskWorker running document processing on its process pool, that is
+    ``process_pool_size * max_workers`` OCR processes in all.
+
+    ``recognizer(image, timeout, language) -> str`` replaces tesseract, and
+    must be a module-level function so workers can import it.
+    """
+
+    def __init__(self, config: Optional[OcrConfig] = None, recognizer: Callable[..., str] = tesseract_recognizer):
+        self.config = config or OcrConfig()
+        self.recognizer = recognizer
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def recognize_image(self, image: Union[bytes, Image.Image]) -> OcrPage:
+        """Text of one image, given as encoded file bytes or a PIL image"""
+        return self.recognize_pages([(1, image)])[0]
+
+    def recognize_pdf(self, source: Union[str, BinaryIO], page_numbers: Iterable[int]) -> List[OcrPage]:
+        """Text of the given 1-based pages of a PDF, rasterised one page at a time.
+
+        Needs pdf2image and poppler; raises ImportError without them.
+        """
+        from pdf2image import convert_from_bytes
+
+        if isinstance(source, str):
+            with open(source, 'rb') as file:
+                document = file.read()
+        else:
+            source.seek(0)
+            document = source.read()
+
+        dpi = self.config.target_dpi
+
+        def rasterise() -> Iterator[Tuple[int, Union[Image.Image, str]]]:
+            for number in page_numbers:
+                try:
+                    image = convert_from_bytes(
+                        document, dpi=dpi, first_page=number, last_page=number, grayscale=True
+                    )[0]
+                    # Rendered at the target resolution already, so preprocessing only deskews
+                    image.info['dpi'] = (dpi, dpi)
+                    yield number, image
+                except Exception as e:
+                    logger.error(f"Error rasterising page {number}: {str(e)}")
+                    yield number, f"rasterising failed: {e}"
+
+        return self.recognize_pages(rasterise())
+
+    def recognize_pages(self, pages: Iterable[Tuple[int, Union[bytes, Image.Image, str]]]) -> List[OcrPage]:
+        """Text of each (number, image) in order; an image given as a string is an error to report as is"""
+        if self.config.max_workers < 1:
+            return [self._recognize_inline(number, image) for number, image in pages]
+
+        results: List[OcrPage] = []
+        in_flight: Deque[Tuple[int, Any, Any, float]] = deque()
+        for number, image in pages:
+            if isinstance(image, str):
+                results.append(OcrPage(number, "", 0.0, image))
+                continue
+            if len(in_flight) >= self.config.max_workers:
+                results.append(self._collect(in_flight))
+            in_flight.append(self._submit(number, image))
+        while in_flight:
+            results.append(self._collect(in_flight))
+        return sorted(results, key=lambda page: page.number)
+
+    def close(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context('spawn')
+                self._pool = context.Pool(
+                    self.config.max_workers,
+                    initializer=_init_ocr_worker,
+                    initargs=(self.recognizer, self.config)
+                )
+            return self._pool
+
+    def _submit(self, number: int, image) -> Tuple[int, Any, Any, float]:
+        result = self._get_pool().apply_async(_ocr_worker_page, (number, image))
+        return number, image, result, time.monotonic()
+
+    def _collect(self, in_flight: Deque[Tuple[int, Any, Any, float]]) -> OcrPage:
+        number, image, result, submitted = in_flight.popleft()
+        deadline = submitted + (self.config.page_timeout_seconds or PAGE_BACKSTOP_SECONDS) + WORKER_GRACE_SECONDS
+        try:
+            return result.get(max(0.0, deadline - time.monotonic()))
+        except multiprocessing.TimeoutError:
+            logger.error(f"OCR of page {number} did not finish; restarting the OCR workers")
+            # The worker is stuck outside tesseract's own timeout; the rest of this document's pages go to a new pool
+            self.close()
+            retried = [self._submit(other, other_image) for other, other_image, _, _ in in_flight]
+            in_flight.clear()
+            in_flight.extend(retried)
+            return OcrPage(number, "", time.monotonic() - submitted, "OCR worker did not finish")
+
+    def _recognize_inline(self, number: int, image) -> OcrPage:
+        if isinstance(image, str):
+            return OcrPage(number, "", 0.0, image)
+        return _recognize_page(number, image, self.recognizer, self.config)
+
+def _recognize_page(
+    number: int,
+    image: Union[bytes, Image.Image],
+    recognizer: Callable[..., str],
+    config: OcrConfig
+) -> OcrPage:
+    started = time.perf_counter()
+    try:
+        if isinstance(image, bytes):
+            image = Image.open(io.BytesIO(image))
+        prepared = preprocess(image, config.target_dpi, config.deskew)
+        text = recognizer(prepared, config.page_timeout_seconds, config.language)
+        return OcrPage(number, text.strip(), time.perf_counter() - started)
+    except Exception as e:
+        logger.error(f"Error recognising page {number}: {str(e)}")
+        return OcrPage(number, "", time.perf_counter() - started, str(e))
+
+_worker_recognizer: Optional[Callable[..., str]] = None
+_worker_config: Optional[OcrConfig] = None
+
+def _init_ocr_worker(recognizer: Callable[..., str], config: OcrConfig):
+    global _worker_recognizer, _worker_config
+    _worker_recognizer = recognizer
+    _worker_config = config
+
+def _ocr_worker_page(number: int, image: Union[bytes, Image.Image]) -> OcrPage:
+    return _recognize_page(number, image, _worker_recognizer, _worker_config)
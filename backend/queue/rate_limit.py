@@ -0,0 +1,140 @@
+"""
+Rate Limiting for the TaxFront task queue
+Token buckets per task type and per user, checked when tasks are claimed
+"""
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+from .task_manager import TaskType
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class RateLimit:
+    """``rate_per_second`` sustained, with bursts of up to ``burst`` tasks"""
+    rate_per_second: float
+    burst: int = 1
+
+    def __post_init__(self):
+        if self.rate_per_second <= 0 or self.burst < 1:
+            raise ValueError("Rate limits need a positive rate and a burst of at least 1")
+
+    @classmethod
+    def per_minute(cls, count: float, burst: int = 1) -> 'RateLimit':
+        return cls(count / 60.0, burst)
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``limit.rate_per_second``; not thread-safe on its own"""
+
+    def __init__(self, limit: RateLimit, clock: Callable[[], float] = time.monotonic):
+        self.limit = limit
+        self._clock = clock
+        self._tokens = float(limit.burst)
+        self._updated_at = clock()
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def is_full(self) -> bool:
+        return self.tokens >= self.limit.burst
+
+    def seconds_until(self, tokens: float = 1.0) -> float:
+        """Time until ``tokens`` are available, 0 if they already are"""
+        return max(0.0, (tokens - self.tokens) / self.limit.rate_per_second)
+
+    def take(self, tokens: float = 1.0):
+        self._refill()
+        self._tokens -= tokens
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(float(self.limit.burst), self._tokens + elapsed * self.limit.rate_per_second)
+
+class RateLimiter:
+    """Per-task-type and per-user token buckets shared by every claimer in a process.
+
+    ``type_limits`` caps each task type across all users, e.g. the AI
+    provider's requests per minute. ``user_limits`` gives every user a
+    bucket of their own for that task type. A task is admitted only if
+    every bucket that applies to it has a token, and then takes one from
+    each. Pass one instance to every queue in the process so worker
+    threads share the same buckets.
+    """
+
+    # Idle per-user buckets are dropped once there are more than this many
+    max_user_buckets = 10000
+
+    def __init__(
+        self,
+        type_limits: Optional[Dict[TaskType, RateLimit]] = None,
+        user_limits: Optional[Dict[TaskType, RateLimit]] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.type_limits = dict(type_limits or {})
+        self.user_limits = dict(user_limits or {})
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._type_buckets = {t: TokenBucket(limit, clock) for t, limit in self.type_limits.items()}
+        self._user_buckets: Dict[Tuple[TaskType, str], TokenBucket] = {}
+
+    def acquire(self, task_type: TaskType, user_id: str) -> float:
+        """Take a token for one task; returns 0 if admitted, else seconds to wait before retrying.
+
+        The wait has up to one refill interval of jitter added, so tasks
+        deferred together do not all come back at the same moment.
+        """
+
+        with self._lock:
+            buckets = self._buckets(task_type, user_id)
+            wait = max((bucket.seconds_until() for bucket in buckets), default=0.0)
+            if wait == 0:
+                for bucket in buckets:
+                    bucket.take()
+                return 0.0
+
+            slowest = min(bucket.limit.rate_per_second for bucket in buckets)
+            return wait + random.uniform(0, 1 / slowest)
+
+    def available(self, task_type: TaskType) -> Optional[int]:
+        """Whole tokens left for ``task_type`` across users, or None if the type is not limited"""
+
+        with self._lock:
+            bucket = self._type_buckets.get(task_type)
+            return int(bucket.tokens) if bucket else None
+
+    def seconds_until_available(self, task_type: TaskType) -> float:
+        """Time until ``task_type`` can be claimed again, 0 if it can now or is not limited"""
+
+        with self._lock:
+            bucket = self._type_buckets.get(task_type)
+            return bucket.seconds_until() if bucket else 0.0
+
+    def _buckets(self, task_type: TaskType, user_id: str) -> List[TokenBucket]:
+        buckets = []
+        if task_type in self._type_buckets:
+            buckets.append(self._type_buckets[task_type])
+
+        user_limit = self.user_limits.get(task_type)
+        if user_limit is not None:
+            key = (task_type, user_id)
+            bucket = self._user_buckets.get(key)
+            if bucket is None:
+                if len(self._user_buckets) >= self.max_user_buckets:
+                    self._prune_user_buckets()
+                bucket = self._user_buckets[key] = TokenBucket(user_limit, self._clock)
+            buckets.append(bucket)
+        return buckets
+
+    def _prune_user_buckets(self):
+        """Forget full buckets; a new bucket starts full, so nothing changes for their users"""
+        for key in [key for key, bucket in self._user_buckets.items() if bucket.is_full()]:
+            del self._user_buckets[key]
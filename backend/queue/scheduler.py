@@ -0,0 +1,94 @@
+"""
+Delayed Task Scheduler for TaxFront
+Promotes scheduled and retrying tasks to PENDING when their scheduled_at comes due
+"""
+
+import threading
+from datetime import datetime
+from typing import Optional
+import logging
+
+from .task_manager import BaseTaskQueue
+
+logger = logging.getLogger(__name__)
+
+class DelayedTaskScheduler:
+    """Background promoter for SCHEDULED and RETRY tasks.
+
+    Sleeps until the earliest ``scheduled_at`` reported by the queue's
+    due-time index, promotes everything that has come due, and repeats.
+    Sleeps are capped at ``max_sleep_seconds`` so tasks enqueued by other
+    processes with an earlier due time are picked up promptly; call
+    ``wake`` after enqueueing a delayed task in this process to re-check
+    immediately.
+    """
+
+    def __init__(
+        self,
+        task_queue: BaseTaskQueue,
+        max_sleep_seconds: float = 30.0,
+        min_sleep_seconds: float = 0.05,
+        batch_size: int = 200
+    ):
+        self.task_queue = task_queue
+        self.max_sleep_seconds = max_sleep_seconds
+        self.min_sleep_seconds = min_sleep_seconds
+        self.batch_size = batch_size
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the scheduler thread"""
+
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self.run, name='task-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the scheduler thread"""
+
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        """Re-check the due-time index without waiting for the current sleep to end"""
+        self._wakeup.set()
+
+    def run(self):
+        """Promote due tasks until ``stop`` is called"""
+
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                self.run_once()
+                delay = self.seconds_until_next_due()
+            except Exception as e:
+                logger.error(f"Error promoting delayed tasks: {e}")
+                delay = self.max_sleep_seconds
+            self._wakeup.wait(delay)
+
+    def run_once(self) -> int:
+        """Promote every task that is due now and return how many were promoted"""
+
+        promoted = 0
+        while True:
+            count = self.task_queue.promote_due_tasks(self.batch_size)
+            promoted += count
+            if count < self.batch_size:
+                return promoted
+
+    def seconds_until_next_due(self) -> float:
+        """How long to sleep before the next delayed task comes due"""
+
+        due_at = self.task_queue.next_due_at()
+        if due_at is None:
+            return self.max_sleep_seconds
+        delay = (due_at - datetime.now()).total_seconds()
+        return min(max(delay, self.min_sleep_seconds), self.max_sleep_seconds)
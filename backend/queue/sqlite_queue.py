@@ -0,0 +1,607 @@
+"""
+SQLite Task Queue for TaxFront
+Single-file BaseTaskQueue backend (WAL mode) for local batch runs and benchmarks
+"""
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List
+import logging
+
+from .notifier import TaskNotifier
+from .rate_limit import RateLimiter
+from .task_manager import (
+    BaseTaskQueue, DELAYED_STATUSES, FINISHED_STATUSES, Task, TaskType, TaskStatus, TaskPriority
+)
+
+logger = logging.getLogger(__name__)
+
+# Column order matches the Task dataclass; payload and result are stored as JSON
+TASK_COLUMNS = [
+    'id', 'type', 'status', 'priority', 'user_id', 'payload', 'created_at', 'updated_at',
+    'scheduled_at', 'started_at', 'completed_at', 'retry_count', 'max_retries',
+    'error_message', 'result', 'timeout_seconds', 'worker_id', 'lease_id', 'lease_expires_at', 'deadline_at',
+    'dedupe_key', 'depends_on'
+]
+JSON_COLUMNS = ('payload', 'result', 'depends_on')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    scheduled_at TEXT,
+    started_at TEXT,
+    completed_at TEXT,
+    retry_count INTEGER NOT NULL DEFAULT 0,
+    max_retries INTEGER NOT NULL DEFAULT 3,
+    error_message TEXT,
+    result TEXT,
+    timeout_seconds INTEGER NOT NULL DEFAULT 300,
+    worker_id TEXT,
+    lease_id TEXT,
+    lease_expires_at TEXT,
+    deadline_at TEXT,
+    dedupe_key TEXT,
+    depends_on TEXT
+);
+-- One row per (BLOCKED task, parent it waits for); rows go once the task is settled
+CREATE TABLE IF NOT EXISTS task_dependencies (
+    parent_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    PRIMARY KEY (parent_id, task_id)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_claim ON tasks (status, priority DESC, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_user ON tasks (user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_tasks_lease ON tasks (status, lease_expires_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_deadline ON tasks (status, deadline_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks (status, scheduled_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_dedupe ON tasks (dedupe_key) WHERE dedupe_key IS NOT NULL;
+"""
+
+DELAYED_STATUS_VALUES = tuple(status.value for status in DELAYED_STATUSES)
+FINISHED_STATUS_VALUES = tuple(status.value for status in FINISHED_STATUSES)
+
+class SQLiteTaskQueue(BaseTaskQueue):
+    """Task queue stored in a single SQLite database.
+
+    Claims run inside ``BEGIN IMMEDIATE`` transactions, which take the
+    database write lock up front, so several worker processes can share one
+    database file without claiming the same task twice.
+    """
+
+    def __init__(
+        self,
+        path: str = ':memory:',
+        worker_id: Optional[str] = None,
+        lease_seconds: int = 120,
+        sweep_interval_seconds: int = 60,
+        promote_interval_seconds: float = 5,
+        notifier: Optional[TaskNotifier] = None,
+        rate_limiter: Optional[RateLimiter] = None
+    ):
+        super().__init__(
+            worker_id, lease_seconds, sweep_interval_seconds, promote_interval_seconds, notifier, rate_limiter
+        )
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._add_missing_columns()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def enqueue_task(
+        self,
+        task_type: TaskType,
+        user_id: str,
+        payload: Dict[str, Any],
+        priority: TaskPriority = TaskPriority.NORMAL,
+        scheduled_at: Optional[datetime] = None,
+        max_retries: int = 3,
+        timeout_seconds: int = 300,
+        dedupe_key: Optional[str] = None,
+        depends_on: Optional[List[str]] = None
+    ) -> str:
+        """Add a new task unless an unfinished task holds the same ``dedupe_key``.
+
+        With ``depends_on`` the task is BLOCKED until those tasks complete.
+        """
+
+        task = self._new_task(
+            task_type, user_id, payload, priority, scheduled_at, max_retries, timeout_seconds, dedupe_key,
+            depends_on
+        )
+
+        with self._transaction() as conn:
+            if dedupe_key is not None:
+                row = conn.execute(
+                    f"SELECT id FROM tasks WHERE dedupe_key = ? "
+                    f"AND status NOT IN ({_placeholders(FINISHED_STATUS_VALUES)}) LIMIT 1",
+                    (dedupe_key, *FINISHED_STATUS_VALUES)
+                ).fetchone()
+                if row is not None:
+                    logger.info(f"Task for dedupe key {dedupe_key} already queued as {row['id']}")
+                    return row['id']
+            blocked = False
+            if task.depends_on:
+                parents = self._parent_rows(conn, task.depends_on)
+                self._check_dependencies(task.depends_on, parents)
+                blocked = self._settle_blocked(task, parents, task.created_at) is None
+            self._insert(conn, task)
+            # Only once the task row is going in, so a deduplicated enqueue leaves no edges behind
+            if blocked:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO task_dependencies (parent_id, task_id) VALUES (?, ?)",
+                    [(parent_id, task.id) for parent_id in task.depends_on]
+                )
+
+        logger.info(f"Enqueued task {task.id} of type {task_type.value} for user {user_id}")
+        if task.status == TaskStatus.PENDING:
+            self.notifier.notify()
+        return task.id
+
+    def claim_batch(
+        self,
+        n: int,
+        task_types: Optional[List[TaskType]] = None,
+        worker_id: Optional[str] = None,
+        lease_seconds: Optional[int] = None
+    ) -> List[Task]:
+        """Claim up to ``n`` available tasks under a lease"""
+
+        self._maybe_sweep_expired_leases()
+
+        worker_id = worker_id or self.worker_id
+        lease_seconds = lease_seconds or self.lease_seconds
+        n = self._rate_limited_count(n, task_types)
+        if n <= 0:
+            return []
+
+        query = "SELECT * FROM tasks WHERE status = ?"
+        params: List[Any] = [TaskStatus.PENDING.value]
+        if task_types:
+            query += f" AND type IN ({_placeholders(task_types)})"
+            params.extend(t.value for t in task_types)
+        query += " ORDER BY priority DESC, created_at LIMIT ?"
+        params.append(n)
+
+        lease_fields = self._lease_fields(worker_id, lease_seconds)
+
+        with self._transaction() as conn:
+            # Promotion is an indexed range update, cheap enough to run on every claim
+            self._promote_due(conn, None)
+            rows = conn.execute(query, params).fetchall()
+            if not rows:
+                return []
+
+            claim_fields = [self._claim_fields(lease_fields, row['timeout_seconds']) for row in rows]
+            conn.executemany(
+                "UPDATE tasks SET status = ?, worker_id = ?, lease_id = ?, lease_expires_at = ?, deadline_at = ?, "
+                "started_at = ?, updated_at = ? WHERE id = ?",
+                [
+                    (
+                        fields['status'], fields['worker_id'], fields['lease_id'], fields['lease_expires_at'],
+                        fields['deadline_at'], fields['started_at'], fields['updated_at'], row['id']
+                    )
+                    for row, fields in zip(rows, claim_fields)
+                ]
+            )
+
+        claimed = []
+        for row, fields in zip(rows, claim_fields):
+            task_data = _row_to_dict(row)
+            task_data.update(fields)
+            claimed.append(Task.from_dict(task_data))
+
+        claimed = self._apply_rate_limits(claimed, worker_id)
+        self._record_wait_times(claimed)
+        for task in claimed:
+            logger.info(f"Claimed task {task.id} of type {task.type.value} (worker {worker_id})")
+        return claimed
+
+    def renew_lease(
+        self,
+        task_id: str,
+        worker_id: Optional[str] = None,
+        lease_seconds: Optional[int] = None,
+        lease_id: Optional[str] = None
+    ) -> bool:
+        """Extend the lease on a claimed task; returns False if the lease was lost"""
+
+        worker_id = worker_id or self.worker_id
+        lease_seconds = lease_seconds or self.lease_seconds
+        lease_expires_at = (datetime.now() + timedelta(seconds=lease_seconds)).isoformat()
+
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_expires_at = ? WHERE id = ? AND status = ? AND worker_id = ? "
+                "AND (? IS NULL OR lease_id = ?)",
+                (lease_expires_at, task_id, TaskStatus.IN_PROGRESS.value, worker_id, lease_id, lease_id)
+            )
+            return cursor.rowcount == 1
+
+    def requeue_expired_leases(self, limit: int = 100) -> int:
+        """Put tasks whose lease has expired back in the queue"""
+
+        now = datetime.now().isoformat()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = ?, worker_id = NULL, lease_id = NULL, lease_expires_at = NULL, "
+                "deadline_at = NULL, "
+                "started_at = NULL, updated_at = ? WHERE id IN ("
+                "SELECT id FROM tasks WHERE status = ? AND lease_expires_at < ? LIMIT ?)",
+                (TaskStatus.PENDING.value, now, TaskStatus.IN_PROGRESS.value, now, limit)
+            )
+            requeued = cursor.rowcount
+
+        if requeued:
+            logger.info(f"Requeued {requeued} tasks with expired leases")
+            self.notifier.notify()
+        return requeued
+
+    def _timed_out_tasks(self, limit: int) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, timeout_seconds FROM tasks WHERE status = ? AND deadline_at < ? "
+                "ORDER BY deadline_at LIMIT ?",
+                (TaskStatus.IN_PROGRESS.value, datetime.now().isoformat(), limit)
+            ).fetchall()
+        return {row['id']: row['timeout_seconds'] for row in rows}
+
+    def promote_due_tasks(self, limit: int = 200) -> int:
+        """Move delayed tasks whose ``scheduled_at`` has passed to PENDING"""
+
+        with self._transaction() as conn:
+            promoted = self._promote_due(conn, limit)
+
+        if promoted:
+            logger.info(f"Promoted {promoted} due tasks to pending")
+        return promoted
+
+    def next_due_at(self) -> Optional[datetime]:
+        """Earliest ``scheduled_at`` among delayed tasks"""
+
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT MIN(scheduled_at) AS due FROM tasks "
+                f"WHERE status IN ({_placeholders(DELAYED_STATUS_VALUES)})",
+                DELAYED_STATUS_VALUES
+            ).fetchone()
+        return datetime.fromisoformat(row['due']) if row['due'] else None
+
+    def complete_batch(
+        self,
+        results: Dict[str, Optional[Dict[str, Any]]],
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """Mark several tasks as completed in one transaction"""
+
+        now = datetime.now().isoformat()
+        completed = []
+
+        with self._transaction() as conn:
+            for task_id, task_data in self._claimed_rows(conn, list(results), worker_id, lease_ids).items():
+                result = results[task_id]
+                conn.execute(
+                    "UPDATE tasks SET status = ?, completed_at = ?, updated_at = ?, "
+                    "result = COALESCE(?, result) WHERE id = ?",
+                    (
+                        TaskStatus.COMPLETED.value, now, now,
+                        json.dumps(result) if result else None, task_id
+                    )
+                )
+                completed.append(task_id)
+            self._release_dependents(conn, completed)
+
+        for task_id in completed:
+            logger.info(f"Completed task {task_id}")
+        return completed
+
+    def fail_batch(
+        self,
+        errors: Dict[str, str],
+        retry: bool = True,
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> Dict[str, TaskStatus]:
+        """Mark several tasks as failed in one transaction"""
+
+        now = datetime.now()
+        outcomes = {}
+
+        with self._transaction() as conn:
+            for task_id, task_data in self._claimed_rows(conn, list(errors), worker_id, lease_ids).items():
+                task = Task.from_dict(task_data)
+                outcomes[task_id] = self._apply_failure(task, errors[task_id], retry, now)
+                self._insert(conn, task, replace=True)
+            self._release_dependents(
+                conn, [task_id for task_id, status in outcomes.items() if status == TaskStatus.FAILED]
+            )
+
+        return outcomes
+
+    def defer_batch(
+        self,
+        delays: Dict[str, float],
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """Hand claimed tasks back as SCHEDULED in one transaction, without using a retry"""
+
+        now = datetime.now()
+        deferred = []
+
+        with self._transaction() as conn:
+            for task_id, task_data in self._claimed_rows(conn, list(delays), worker_id, lease_ids).items():
+                task = Task.from_dict(task_data)
+                self._apply_deferral(task, delays[task_id], now)
+                self._insert(conn, task, replace=True)
+                deferred.append(task_id)
+
+        return deferred
+
+    def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get the current status of a task"""
+
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return _row_to_dict(row) if row else None
+
+    def get_user_tasks_page(
+        self,
+        user_id: str,
+        status: Optional[TaskStatus] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get one page of a user's tasks, newest first"""
+
+        limit = max(1, limit)
+        query = "SELECT * FROM tasks WHERE user_id = ?"
+        params: List[Any] = [user_id]
+        if status:
+            query += " AND status = ?"
+            params.append(status.value)
+        if cursor:
+            created_at, task_id = self._parse_page_cursor(cursor)
+            query += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+            params.extend([created_at, created_at, task_id])
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = [_row_to_dict(row) for row in self._conn.execute(query, params).fetchall()]
+
+        next_cursor = self._page_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return {'tasks': rows[:limit], 'next_cursor': next_cursor}
+
+    def cancel_task(self, task_id: str) -> bool:
+        """Cancel a pending, scheduled or blocked task; tasks depending on it fail"""
+
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = ?, updated_at = ? WHERE id = ? AND status IN (?, ?, ?)",
+                (
+                    TaskStatus.CANCELLED.value, datetime.now().isoformat(), task_id,
+                    TaskStatus.PENDING.value, TaskStatus.SCHEDULED.value, TaskStatus.BLOCKED.value
+                )
+            )
+            cancelled = cursor.rowcount == 1
+            if cancelled:
+                conn.execute("DELETE FROM task_dependencies WHERE task_id = ?", (task_id,))
+                self._release_dependents(conn, [task_id])
+
+        if cancelled:
+            logger.info(f"Cancelled task {task_id}")
+        return cancelled
+
+    def cleanup_old_tasks(self, days_old: int = 30) -> int:
+        """Delete completed and failed tasks older than ``days_old``"""
+
+        cutoff_date = (datetime.now() - timedelta(days=days_old)).isoformat()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM tasks WHERE status IN (?, ?) AND updated_at < ?",
+                (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, cutoff_date)
+            )
+
+        if cursor.rowcount:
+            logger.info(f"Cleaned up {cursor.rowcount} old tasks")
+        return cursor.rowcount
+
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """Get queue statistics"""
+
+        stats = {
+            'pending': 0,
+            'delayed': 0,
+            'blocked': 0,
+            'in_progress': 0,
+            'completed_today': 0,
+            'failed_today': 0,
+            'by_type': {},
+            'by_priority': {},
+            'by_user': {},
+            'in_progress_by_user': {}
+        }
+        today_start = datetime.combine(datetime.now().date(), datetime.min.time()).isoformat()
+
+        with self._lock:
+            pending_rows = self._conn.execute(
+                "SELECT type, priority, user_id, COUNT(*) AS n FROM tasks WHERE status = ? "
+                "GROUP BY type, priority, user_id",
+                (TaskStatus.PENDING.value,)
+            ).fetchall()
+            in_progress_rows = self._conn.execute(
+                "SELECT user_id, COUNT(*) AS n FROM tasks WHERE status = ? GROUP BY user_id",
+                (TaskStatus.IN_PROGRESS.value,)
+            ).fetchall()
+            counts = self._conn.execute(
+                f"SELECT "
+                f"SUM(status IN ({_placeholders(DELAYED_STATUS_VALUES)})) AS delayed, "
+                f"SUM(status = ?) AS blocked, "
+                f"SUM(status = ?) AS in_progress, "
+                f"SUM(status = ? AND completed_at >= ?) AS completed_today, "
+                f"SUM(status = ? AND updated_at >= ?) AS failed_today "
+                f"FROM tasks",
+                (
+                    *DELAYED_STATUS_VALUES,
+                    TaskStatus.BLOCKED.value,
+                    TaskStatus.IN_PROGRESS.value,
+                    TaskStatus.COMPLETED.value, today_start,
+                    TaskStatus.FAILED.value, today_start
+                )
+            ).fetchone()
+
+        for row in pending_rows:
+            stats['pending'] += row['n']
+            stats['by_type'][row['type']] = stats['by_type'].get(row['type'], 0) + row['n']
+            priority = str(row['priority'])
+            stats['by_priority'][priority] = stats['by_priority'].get(priority, 0) + row['n']
+            stats['by_user'][row['user_id']] = stats['by_user'].get(row['user_id'], 0) + row['n']
+        for row in in_progress_rows:
+            stats['in_progress_by_user'][row['user_id']] = row['n']
+
+        stats['delayed'] = counts['delayed'] or 0
+        stats['blocked'] = counts['blocked'] or 0
+        stats['in_progress'] = counts['in_progress'] or 0
+        stats['completed_today'] = counts['completed_today'] or 0
+        stats['failed_today'] = counts['failed_today'] or 0
+        return stats
+
+    def _add_missing_columns(self):
+        """Add task columns introduced after a database file was created; they are all nullable TEXT"""
+
+        with self._transaction() as conn:
+            existing = {row['name'] for row in conn.execute('PRAGMA table_info(tasks)')}
+            for column in TASK_COLUMNS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} TEXT")
+
+    @contextmanager
+    def _transaction(self):
+        """Serialize writers with an immediate (write-locking) transaction"""
+
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            else:
+                self._conn.execute('COMMIT')
+
+    def _insert(self, conn: sqlite3.Connection, task: Task, replace: bool = False):
+        data = task.to_dict()
+        for column in JSON_COLUMNS:
+            if data[column] is not None:
+                data[column] = json.dumps(data[column])
+
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+        conn.execute(
+            f"{verb} INTO tasks ({', '.join(TASK_COLUMNS)}) VALUES ({_placeholders(TASK_COLUMNS)})",
+            [data[column] for column in TASK_COLUMNS]
+        )
+
+    def _promote_due(self, conn: sqlite3.Connection, limit: Optional[int]) -> int:
+        now = datetime.now().isoformat()
+        cursor = conn.execute(
+            f"UPDATE tasks SET status = ?, updated_at = ? WHERE id IN ("
+            f"SELECT id FROM tasks WHERE status IN ({_placeholders(DELAYED_STATUS_VALUES)}) "
+            f"AND scheduled_at <= ? ORDER BY scheduled_at LIMIT ?)",
+            (TaskStatus.PENDING.value, now, *DELAYED_STATUS_VALUES, now, -1 if limit is None else limit)
+        )
+        if cursor.rowcount:
+            self.notifier.notify()
+        return cursor.rowcount
+
+    def _parent_rows(self, conn: sqlite3.Connection, task_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        rows = conn.execute(
+            f"SELECT id, status, result FROM tasks WHERE id IN ({_placeholders(task_ids)})", task_ids
+        ).fetchall()
+        return {
+            row['id']: {'status': row['status'], 'result': json.loads(row['result']) if row['result'] else None}
+            for row in rows
+        }
+
+    def _release_dependents(self, conn: sqlite3.Connection, parent_ids: List[str]):
+        """Settle the BLOCKED children of tasks that just finished, cascading failures"""
+
+        now = datetime.now()
+        while parent_ids:
+            rows = conn.execute(
+                f"SELECT DISTINCT tasks.* FROM task_dependencies "
+                f"JOIN tasks ON tasks.id = task_dependencies.task_id "
+                f"WHERE task_dependencies.parent_id IN ({_placeholders(parent_ids)}) AND tasks.status = ?",
+                [*parent_ids, TaskStatus.BLOCKED.value]
+            ).fetchall()
+
+            failed = []
+            for row in rows:
+                task = Task.from_dict(_row_to_dict(row))
+                status = self._settle_blocked(task, self._parent_rows(conn, task.depends_on), now)
+                if status is None:
+                    continue
+                self._insert(conn, task, replace=True)
+                conn.execute("DELETE FROM task_dependencies WHERE task_id = ?", (task.id,))
+                if status == TaskStatus.FAILED:
+                    failed.append(task.id)
+                elif status == TaskStatus.PENDING:
+                    self.notifier.notify()
+            parent_ids = failed
+
+    def _claimed_rows(
+        self,
+        conn: sqlite3.Connection,
+        task_ids: List[str],
+        worker_id: Optional[str],
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Fetch in-progress tasks the caller may complete or fail"""
+
+        if not task_ids:
+            return {}
+
+        rows = conn.execute(
+            f"SELECT * FROM tasks WHERE id IN ({_placeholders(task_ids)}) AND status = ?",
+            [*task_ids, TaskStatus.IN_PROGRESS.value]
+        ).fetchall()
+
+        claimed = {}
+        for row in rows:
+            task_data = _row_to_dict(row)
+            if not self._holds_lease(task_data, worker_id, (lease_ids or {}).get(row['id'])):
+                logger.warning(f"Worker {worker_id} no longer holds the lease on task {row['id']}")
+                continue
+            claimed[row['id']] = task_data
+
+        for task_id in task_ids:
+            if task_id not in claimed and all(row['id'] != task_id for row in rows):
+                logger.warning(f"Task {task_id} is not in progress")
+        return claimed
+
+def _placeholders(values) -> str:
+    return ', '.join('?' for _ in values)
+
+def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    data = {column: row[column] for column in TASK_COLUMNS}
+    for column in JSON_COLUMNS:
+        if data[column] is not None:
+            data[column] = json.loads(data[column])
+    return data
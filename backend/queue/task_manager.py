@@ -3,16 +3,29 @@ Firebase Task Queue Manager for TaxFront
 Manages different types of tasks using Firestore collections as queues
 """
 
+import base64
+import hashlib
+import heapq
 import json
+import os
+import random
+import socket
+import time
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from enum import Enum
-from typing import Dict, Any, Optional, List
-from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, Dict, Any, Optional, List, Callable, Iterable, Tuple
+from dataclasses import MISSING, dataclass, fields
 from firebase_admin import firestore
 from firebase_functions import firestore_fn
 import logging
 
+from .fair_scheduler import FairScheduler, WaitTimeTracker
+from .notifier import TaskNotifier
+
+if TYPE_CHECKING:
+    from .rate_limit import RateLimiter
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,6 +48,14 @@ class TaskStatus(Enum):
     FAILED = "failed"
     CANCELLED = "cancelled"
     RETRY = "retry"
+    SCHEDULED = "scheduled"
+    BLOCKED = "blocked"
+
+# Statuses of tasks waiting for their ``scheduled_at``; the scheduler promotes them to PENDING
+DELAYED_STATUSES = (TaskStatus.SCHEDULED, TaskStatus.RETRY)
+
+# Statuses a task never leaves; a dedupe key is free again once its task reaches one
+FINISHED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED)
 
 class TaskPriority(Enum):
     """Task priority levels"""
@@ -43,7 +64,11 @@ class TaskPriority(Enum):
     HIGH = 3
     URGENT = 4
 
-@dataclass
+DATETIME_FIELDS = [
+    'created_at', 'updated_at', 'scheduled_at', 'started_at', 'completed_at', 'lease_expires_at', 'deadline_at'
+]
+
+@dataclass(slots=True)
 class Task:
     """Task data structure"""
     id: str
@@ -62,42 +87,195 @@ class Task:
     error_message: Optional[str] = None
     result: Optional[Dict[str, Any]] = None
     timeout_seconds: int = 300  # 5 minutes default
+    worker_id: Optional[str] = None
+    # Fresh on every claim, so a late result from an earlier claim of the task is told apart
+    lease_id: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    # started_at + timeout_seconds, set on claim and enforced by fail_timed_out_tasks
+    deadline_at: Optional[datetime] = None
+    dedupe_key: Optional[str] = None
+    # Ids of tasks that must complete first; the task is BLOCKED until they do
+    depends_on: Optional[List[str]] = None
 
     def to_dict(self) -> Dict[str, Any]:
-        """Convert task to dictionary for Firestore storage"""
-        data = asdict(self)
-        # Convert enums to strings
-        data['type'] = self.type.value
-        data['status'] = self.status.value
-        data['priority'] = self.priority.value
-        # Convert datetime objects to ISO strings
-        for field in ['created_at', 'updated_at', 'scheduled_at', 'started_at', 'completed_at']:
-            if data[field]:
-                data[field] = data[field].isoformat()
-        return data
+        """Convert task to dictionary for Firestore storage.
+
+        ``payload`` and ``result`` are shared with the task, not copied.
+        """
+        return _encode_task(self)
+
+    def queue_wait_seconds(self) -> float:
+        """Seconds from becoming claimable (``scheduled_at``, or ``created_at``) to being claimed"""
+        ready_at = max(self.created_at, self.scheduled_at or self.created_at)
+        return (self.started_at - ready_at).total_seconds()
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Task':
-        """Create task from dictionary"""
-        # Convert string enums back to enum objects
-        data['type'] = TaskType(data['type'])
-        data['status'] = TaskStatus(data['status'])
-        data['priority'] = TaskPriority(data['priority'])
-        # Convert ISO strings back to datetime objects
-        for field in ['created_at', 'updated_at', 'scheduled_at', 'started_at', 'completed_at']:
-            if data[field]:
-                data[field] = datetime.fromisoformat(data[field])
-        return cls(**data)
-
-class TaskQueue:
-    """Firebase-based task queue manager"""
+        """Create task from dictionary; ``data`` is left unchanged"""
+        return _decode_task(cls, data)
+
+def _compile_task_codec() -> Tuple[Callable, Callable]:
+    """Generate straight-line encode/decode functions from the Task fields.
+
+    The generated code converts enums through value lookup tables and
+    datetimes inline, with no ``asdict`` deep copy and no per-call loop
+    over field names. Generating it from ``fields(Task)`` keeps the codec
+    in step when fields are added.
+    """
     
-    def __init__(self, db: firestore.Client):
-        self.db = db
-        self.tasks_collection = 'task_queue'
-        self.processing_collection = 'task_processing'
-        self.completed_collection = 'task_completed'
-        self.failed_collection = 'task_failed'
+    enums = {'type': TaskType, 'status': TaskStatus, 'priority': TaskPriority}
+    namespace: Dict[str, Any] = {'_fromisoformat': datetime.fromisoformat}
+    encoded, decoded = [], []
+    
+    for field in fields(Task):
+        name = field.name
+        if field.default is MISSING and field.default_factory is MISSING:
+            value = f"data[{name!r}]"
+        else:
+            namespace[f"_default_{name}"] = field.default
+            value = f"get({name!r}, _default_{name})"
+        
+        if name in enums:
+            namespace[f"_{name}_enum"] = enums[name]
+            namespace[f"_{name}_by_value"] = {member.value: member for member in enums[name]}
+            encoded.append(f"{name!r}: task.{name}.value")
+            decoded.append(f"{name}=_{name}_by_value.get({value}) or _{name}_enum({value})")
+        elif name in DATETIME_FIELDS:
+            encoded.append(f"{name!r}: task.{name}.isoformat() if task.{name} else task.{name}")
+            decoded.append(f"{name}=(_fromisoformat(v) if isinstance((v := {value}), str) and v else v)")
+        else:
+            encoded.append(f"{name!r}: task.{name}")
+            decoded.append(f"{name}={value}")
+    
+    source = (
+        "def encode(task):\n"
+        f"    return {{{', '.join(encoded)}}}\n"
+        "def decode(cls, data):\n"
+        "    get = data.get\n"
+        f"    return cls({', '.join(decoded)})\n"
+    )
+    exec(compile(source, '<task codec>', 'exec'), namespace)
+    return namespace['encode'], namespace['decode']
+
+_encode_task, _decode_task = _compile_task_codec()
+
+# Firestore rejects batches and transactions with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+class _StatsDelta:
+    """Counter changes for the sharded queue statistics.
+
+    Field names are Firestore field paths in a stats shard document, e.g.
+    ``pending_by_type.document_processing`` or ``completed_by_day.2025-03-01``.
+    Per-user changes (``pending.{type}.{priority}`` and ``in_progress``) are
+    kept apart in ``users``; they feed the fair scheduler and are only
+    written when one is configured, to one document per user.
+    """
+    
+    def __init__(self):
+        self.fields: Dict[str, int] = {}
+        self.users: Dict[str, Dict[str, int]] = {}
+    
+    def __bool__(self) -> bool:
+        return any(self.fields.values())
+    
+    def add(self, field: str, amount: int = 1):
+        self.fields[field] = self.fields.get(field, 0) + amount
+    
+    def add_user(self, user_id: str, field: str, amount: int):
+        user_fields = self.users.setdefault(user_id, {})
+        user_fields[field] = user_fields.get(field, 0) + amount
+    
+    def pending(self, task_data: Dict[str, Any], amount: int):
+        task_type = task_data.get('type', 'unknown')
+        priority = task_data.get('priority', 'unknown')
+        self.add('pending', amount)
+        self.add(f"pending_by_type.{task_type}", amount)
+        self.add(f"pending_by_priority.{priority}", amount)
+        self.add_user(task_data.get('user_id', 'unknown'), f"pending.{task_type}.{priority}", amount)
+    
+    def in_progress(self, task_data: Dict[str, Any], amount: int):
+        self.add('in_progress', amount)
+        self.add_user(task_data.get('user_id', 'unknown'), 'in_progress', amount)
+    
+    def delayed(self, amount: int):
+        self.add('delayed', amount)
+    
+    def blocked(self, amount: int):
+        self.add('blocked', amount)
+    
+    def finished(self, status: TaskStatus, when: datetime):
+        self.add(f"{status.value}_by_day.{when.date().isoformat()}", 1)
+    
+    def to_update(self) -> Dict[str, Any]:
+        """Nested ``Increment`` transforms for ``set(..., merge=True)``"""
+        return _nest(self.fields, firestore.Increment)
+    
+    def to_counters(self) -> Dict[str, Any]:
+        """Nested plain counters, the shape of a stats shard document"""
+        return _nest(self.fields, lambda amount: amount)
+    
+    def user_updates(self) -> Dict[str, Dict[str, Any]]:
+        """Nested ``Increment`` transforms per user id, for each user's counter document"""
+        updates = {}
+        for user_id, user_fields in self.users.items():
+            nested = _nest(user_fields, firestore.Increment)
+            if nested:
+                updates[user_id] = dict(nested, user_id=user_id)
+        return updates
+    
+    def user_counters(self) -> Dict[str, Dict[str, Any]]:
+        """Nested plain counters per user id, the shape of a user's counter document"""
+        counters = {}
+        for user_id, user_fields in self.users.items():
+            nested = _nest(user_fields, lambda amount: amount)
+            if nested:
+                counters[user_id] = dict(nested, user_id=user_id)
+        return counters
+
+def _nest(fields: Dict[str, int], wrap: Callable[[int], Any]) -> Dict[str, Any]:
+    """Nested maps from dotted field paths, skipping zero amounts"""
+    nested: Dict[str, Any] = {}
+    for field, amount in fields.items():
+        if not amount:
+            continue
+        target = nested
+        *parents, leaf = field.split('.')
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = wrap(amount)
+    return nested
+
+class BaseTaskQueue:
+    """Queue backend interface shared by the Firestore, in-memory and SQLite queues.
+
+    Subclasses implement storage; leasing, retry backoff and the
+    single-task convenience methods are defined here so every backend
+    claims, retries and reports tasks the same way.
+    """
+    
+    def __init__(
+        self,
+        worker_id: Optional[str] = None,
+        lease_seconds: int = 120,
+        sweep_interval_seconds: int = 60,
+        promote_interval_seconds: float = 5,
+        notifier: Optional[TaskNotifier] = None,
+        rate_limiter: Optional['RateLimiter'] = None
+    ):
+        # Identity recorded on every lease this queue instance takes out
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.promote_interval_seconds = promote_interval_seconds
+        self._last_sweep = 0.0
+        self._last_promote = 0.0
+        # Queue wait times of tasks claimed through this instance
+        self.wait_times = WaitTimeTracker()
+        # Wakes idle workers when this queue makes a task claimable
+        self.notifier = notifier or TaskNotifier()
+        # When set, claimed tasks over their type's or user's rate are deferred
+        self.rate_limiter = rate_limiter
 
     def enqueue_task(
         self,
@@ -107,17 +285,265 @@ class TaskQueue:
         priority: TaskPriority = TaskPriority.NORMAL,
         scheduled_at: Optional[datetime] = None,
         max_retries: int = 3,
-        timeout_seconds: int = 300
+        timeout_seconds: int = 300,
+        dedupe_key: Optional[str] = None,
+        depends_on: Optional[List[str]] = None
     ) -> str:
-        """Add a new task to the queue"""
+        """Add a new task to the queue - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement enqueue_task method")
+
+    def claim_batch(
+        self,
+        n: int,
+        task_types: Optional[List[TaskType]] = None,
+        worker_id: Optional[str] = None,
+        lease_seconds: Optional[int] = None
+    ) -> List[Task]:
+        """Claim up to ``n`` available tasks under a lease - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement claim_batch method")
+
+    def renew_lease(
+        self,
+        task_id: str,
+        worker_id: Optional[str] = None,
+        lease_seconds: Optional[int] = None,
+        lease_id: Optional[str] = None
+    ) -> bool:
+        """Extend the lease on a claimed task - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement renew_lease method")
+
+    def requeue_expired_leases(self, limit: int = 100) -> int:
+        """Return tasks with expired leases to the queue - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement requeue_expired_leases method")
+
+    def fail_timed_out_tasks(self, limit: int = 100) -> int:
+        """Fail in-progress tasks that have run past ``timeout_seconds``, with retry.
+
+        A crashed worker is caught by its lease expiring, but a worker that
+        is alive and stuck (a hung OCR call) keeps renewing its lease. The
+        deadline catches that case, and unlike a lease expiry it counts as a
+        failed attempt. Returns the number of tasks failed.
+        """
         
-        task_id = str(uuid.uuid4())
-        now = datetime.now()
+        timed_out = self._timed_out_tasks(limit)
+        if not timed_out:
+            return 0
+        
+        errors = {
+            task_id: f"Task timed out after {timeout_seconds} seconds"
+            for task_id, timeout_seconds in timed_out.items()
+        }
+        outcomes = self.fail_batch(errors, retry=True)
+        if outcomes:
+            logger.warning(f"Failed {len(outcomes)} tasks that ran past their timeout")
+        return len(outcomes)
+
+    def _timed_out_tasks(self, limit: int) -> Dict[str, int]:
+        """Ids and timeouts of in-progress tasks past ``deadline_at`` - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement _timed_out_tasks method")
+
+    def promote_due_tasks(self, limit: int = 200) -> int:
+        """Move SCHEDULED and RETRY tasks whose time has come to PENDING - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement promote_due_tasks method")
+
+    def next_due_at(self) -> Optional[datetime]:
+        """Earliest ``scheduled_at`` among delayed tasks - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement next_due_at method")
+
+    def complete_batch(
+        self,
+        results: Dict[str, Optional[Dict[str, Any]]],
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """Mark several tasks as completed - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement complete_batch method")
+
+    def fail_batch(
+        self,
+        errors: Dict[str, str],
+        retry: bool = True,
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> Dict[str, TaskStatus]:
+        """Mark several tasks as failed - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement fail_batch method")
+
+    def defer_batch(
+        self,
+        delays: Dict[str, float],
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """Return claimed tasks to the queue as SCHEDULED without using a retry - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement defer_batch method")
+
+    def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get the current status of a task - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement get_task_status method")
+
+    def get_user_tasks_page(
+        self,
+        user_id: str,
+        status: Optional[TaskStatus] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get one page of a user's tasks, newest first - to be implemented by subclasses.
+
+        Returns ``{'tasks': [...], 'next_cursor': ...}``; pass ``next_cursor``
+        back as ``cursor`` for the following page. It is None on the last page.
+        """
+        raise NotImplementedError("Subclasses must implement get_user_tasks_page method")
+
+    def cancel_task(self, task_id: str) -> bool:
+        """Cancel a pending task - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement cancel_task method")
+
+    def cleanup_old_tasks(self, days_old: int = 30) -> int:
+        """Delete old completed and failed tasks and return how many - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement cleanup_old_tasks method")
+
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """Get queue statistics - to be implemented by subclasses"""
+        raise NotImplementedError("Subclasses must implement get_queue_stats method")
+
+    def get_user_tasks(
+        self,
+        user_id: str,
+        status: Optional[TaskStatus] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """Get tasks for a specific user, newest first"""
+        
+        return self.get_user_tasks_page(user_id, status, limit)['tasks']
+
+    def get_next_task(
+        self,
+        task_types: Optional[List[TaskType]] = None,
+        worker_id: Optional[str] = None,
+        lease_seconds: Optional[int] = None
+    ) -> Optional[Task]:
+        """Claim the next available task from the queue under a lease"""
+        
+        tasks = self.claim_batch(1, task_types, worker_id=worker_id, lease_seconds=lease_seconds)
+        return tasks[0] if tasks else None
+
+    def complete_task(
+        self,
+        task_id: str,
+        result: Optional[Dict[str, Any]] = None,
+        worker_id: Optional[str] = None,
+        lease_id: Optional[str] = None
+    ):
+        """Mark a task as completed.
+
+        When ``worker_id`` is given the completion is ignored if that worker
+        no longer holds the lease (it expired and the task was re-claimed).
+        ``lease_id``, the ``Task.lease_id`` of the claim, also rules out an
+        earlier claim of the task by the same worker.
+        """
+        
+        lease_ids = {task_id: lease_id} if lease_id else None
+        self.complete_batch({task_id: result}, worker_id=worker_id, lease_ids=lease_ids)
+
+    def fail_task(
+        self,
+        task_id: str,
+        error_message: str,
+        retry: bool = True,
+        worker_id: Optional[str] = None,
+        lease_id: Optional[str] = None
+    ):
+        """Mark a task as failed and optionally retry"""
+        
+        lease_ids = {task_id: lease_id} if lease_id else None
+        self.fail_batch({task_id: error_message}, retry=retry, worker_id=worker_id, lease_ids=lease_ids)
+
+    def get_wait_time_percentiles(self, percentiles: Iterable[int] = (50, 90, 99)) -> Dict[str, Dict[str, float]]:
+        """Queue wait-time percentiles per user for tasks claimed by this instance.
+
+        Wait time runs from when a task became claimable (``scheduled_at``,
+        or ``created_at`` for immediate tasks) to when it was claimed, so
+        comparing users shows whether scheduling is fair.
+        """
+        
+        return self.wait_times.percentiles(percentiles)
+
+    def _rate_limited_count(self, n: int, task_types: Optional[List[TaskType]]) -> int:
+        """Shrink a claim to the tokens left for its task types, so throttled work stays queued"""
+        
+        if self.rate_limiter is None or not task_types:
+            return n
+        available = [self.rate_limiter.available(task_type) for task_type in task_types]
+        if any(tokens is None for tokens in available):
+            return n
+        return min(n, sum(available))
+
+    def _apply_rate_limits(self, tasks: List[Task], worker_id: str) -> List[Task]:
+        """Admit claimed tasks through the rate limiter and defer the rest"""
+        
+        if self.rate_limiter is None or not tasks:
+            return tasks
+        
+        admitted = []
+        delays = {}
+        for task in tasks:
+            wait_seconds = self.rate_limiter.acquire(task.type, task.user_id)
+            if wait_seconds > 0:
+                delays[task.id] = wait_seconds
+            else:
+                admitted.append(task)
+        
+        if delays:
+            lease_ids = {task.id: task.lease_id for task in tasks if task.id in delays}
+            deferred = self.defer_batch(delays, worker_id=worker_id, lease_ids=lease_ids)
+            logger.info(f"Deferred {len(deferred)} rate-limited tasks")
+        return admitted
+
+    def _apply_deferral(self, task: Task, delay_seconds: float, now: datetime):
+        """Return a claimed task to the queue as SCHEDULED; unlike a failure this leaves retry_count alone"""
         
-        task = Task(
-            id=task_id,
+        task.status = TaskStatus.SCHEDULED
+        task.scheduled_at = now + timedelta(seconds=delay_seconds)
+        task.updated_at = now
+        task.started_at = None
+        task.worker_id = None
+        task.lease_id = None
+        task.lease_expires_at = None
+        task.deadline_at = None
+
+    def _record_wait_times(self, tasks: List[Task]):
+        for task in tasks:
+            self.wait_times.record(task.user_id, task.queue_wait_seconds())
+
+    def _new_task(
+        self,
+        task_type: TaskType,
+        user_id: str,
+        payload: Dict[str, Any],
+        priority: TaskPriority,
+        scheduled_at: Optional[datetime],
+        max_retries: int,
+        timeout_seconds: int,
+        dedupe_key: Optional[str] = None,
+        depends_on: Optional[List[str]] = None
+    ) -> Task:
+        """Build a new pending task with a fresh id"""
+        
+        now = datetime.now()
+        if depends_on:
+            # Tasks with parents wait as BLOCKED until every parent has completed
+            status = TaskStatus.BLOCKED
+        elif scheduled_at is not None and scheduled_at > now:
+            # Future tasks wait as SCHEDULED so claim queries only see ready work
+            status = TaskStatus.SCHEDULED
+        else:
+            status = TaskStatus.PENDING
+        return Task(
+            id=str(uuid.uuid4()),
             type=task_type,
-            status=TaskStatus.PENDING,
+            status=status,
             priority=priority,
             user_id=user_id,
             payload=payload,
@@ -125,58 +551,587 @@ class TaskQueue:
             updated_at=now,
             scheduled_at=scheduled_at or now,
             max_retries=max_retries,
-            timeout_seconds=timeout_seconds
+            timeout_seconds=timeout_seconds,
+            dedupe_key=dedupe_key,
+            depends_on=list(depends_on) if depends_on else None
         )
+
+    def _apply_failure(self, task: Task, error_message: str, retry: bool, now: datetime) -> TaskStatus:
+        """Record a failed attempt on ``task`` and decide between retry and permanent failure"""
+        
+        task.retry_count += 1
+        task.error_message = error_message
+        task.updated_at = now
+        task.worker_id = None
+        task.lease_id = None
+        task.lease_expires_at = None
+        task.deadline_at = None
         
-        # Store task in Firestore
-        self.db.collection(self.tasks_collection).document(task_id).set(task.to_dict())
+        if retry and task.retry_count <= task.max_retries:
+            # Retry the task with exponential backoff
+            delay_minutes = 2 ** task.retry_count  # 2, 4, 8 minutes
+            task.scheduled_at = now + timedelta(minutes=delay_minutes)
+            task.status = TaskStatus.RETRY
+            logger.info(f"Retrying task {task.id} (attempt {task.retry_count}/{task.max_retries})")
+        else:
+            task.status = TaskStatus.FAILED
+            logger.error(f"Task {task.id} failed permanently: {error_message}")
+        
+        return task.status
+
+    def _check_dependencies(self, depends_on: List[str], parents: Dict[str, Dict[str, Any]]):
+        """Reject parents that do not exist or can never complete"""
+        
+        for parent_id in depends_on:
+            parent = parents.get(parent_id)
+            if parent is None:
+                raise ValueError(f"Dependency {parent_id} does not exist")
+            if parent['status'] in (TaskStatus.FAILED.value, TaskStatus.CANCELLED.value):
+                raise ValueError(f"Dependency {parent_id} is {parent['status']}")
+
+    def _settle_blocked(self, task: Task, parents: Dict[str, Dict[str, Any]], now: datetime) -> Optional[TaskStatus]:
+        """Unblock or fail a BLOCKED task given its parents' stored data.
+
+        Once every parent has completed the task becomes PENDING, or
+        SCHEDULED if its ``scheduled_at`` is still ahead, and
+        ``payload['parent_results']`` maps each parent id to its result. A
+        parent that failed, was cancelled or no longer exists fails the
+        task. Returns the new status, or None while parents are unfinished.
+        """
+        
+        parent_results = {}
+        for parent_id in task.depends_on:
+            parent = parents.get(parent_id)
+            status = parent['status'] if parent else None
+            if status in (None, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value):
+                task.status = TaskStatus.FAILED
+                task.error_message = f"Dependency {parent_id} {status or 'not found'}"
+                task.updated_at = now
+                logger.error(f"Task {task.id} failed permanently: {task.error_message}")
+                return task.status
+            if status == TaskStatus.COMPLETED.value:
+                parent_results[parent_id] = parent.get('result')
+        
+        if len(parent_results) < len(task.depends_on):
+            return None
+        
+        task.payload = dict(task.payload, parent_results=parent_results)
+        delayed = task.scheduled_at is not None and task.scheduled_at > now
+        task.status = TaskStatus.SCHEDULED if delayed else TaskStatus.PENDING
+        task.updated_at = now
+        logger.info(f"Unblocked task {task.id}: all {len(parent_results)} dependencies completed")
+        return task.status
+
+    def _maybe_promote_due_tasks(self):
+        """Promote due delayed tasks at most once per promote interval"""
+        
+        now = time.monotonic()
+        if now - self._last_promote < self.promote_interval_seconds:
+            return
+        self._last_promote = now
+        
+        try:
+            self.promote_due_tasks()
+        except Exception as e:
+            logger.warning(f"Promoting due tasks failed: {e}")
+
+    def _maybe_sweep_expired_leases(self):
+        """Run the expired-lease and timeout sweeps at most once per sweep interval"""
+        
+        now = time.monotonic()
+        if now - self._last_sweep < self.sweep_interval_seconds:
+            return
+        self._last_sweep = now
+        
+        try:
+            self.requeue_expired_leases()
+        except Exception as e:
+            logger.warning(f"Expired lease sweep failed: {e}")
+        
+        try:
+            self.fail_timed_out_tasks()
+        except Exception as e:
+            logger.warning(f"Timeout sweep failed: {e}")
+
+    @staticmethod
+    def _page_cursor(task_data: Dict[str, Any]) -> str:
+        """Opaque cursor positioned after ``task_data`` in (created_at, id) descending order"""
+        position = json.dumps([task_data['created_at'], task_data['id']])
+        return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _parse_page_cursor(cursor: str) -> Tuple[str, str]:
+        try:
+            created_at, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid page cursor: {cursor!r}") from e
+        return created_at, task_id
+
+    def _lease_fields(self, worker_id: str, lease_seconds: int) -> Dict[str, Any]:
+        """Fields written when a worker takes out a lease on a task"""
+        
+        now = datetime.now()
+        return {
+            'status': TaskStatus.IN_PROGRESS.value,
+            'worker_id': worker_id,
+            'lease_expires_at': (now + timedelta(seconds=lease_seconds)).isoformat(),
+            'started_at': now.isoformat(),
+            'updated_at': now.isoformat()
+        }
+
+    def _claim_fields(self, lease_fields: Dict[str, Any], timeout_seconds: int) -> Dict[str, Any]:
+        """Lease fields for one task plus its own lease id and the deadline its timeout sets"""
+        
+        deadline_at = datetime.fromisoformat(lease_fields['started_at']) + timedelta(seconds=timeout_seconds)
+        return dict(lease_fields, lease_id=uuid.uuid4().hex, deadline_at=deadline_at.isoformat())
+
+    def _holds_lease(self, task_data: Dict[str, Any], worker_id: Optional[str], lease_id: Optional[str] = None) -> bool:
+        """Check lease ownership; callers that pass neither a worker id nor a lease id are trusted.
+
+        The worker id alone cannot tell a worker's current claim of a task
+        from an earlier one that expired before the same worker claimed the
+        task again; the lease id, new on every claim, can.
+        """
+        if lease_id is not None and task_data.get('lease_id') != lease_id:
+            return False
+        return worker_id is None or task_data.get('worker_id') == worker_id
+
+class TaskQueue(BaseTaskQueue):
+    """Firebase-based task queue manager"""
+    
+    def __init__(
+        self,
+        db: firestore.Client,
+        worker_id: Optional[str] = None,
+        lease_seconds: int = 120,
+        sweep_interval_seconds: int = 60,
+        promote_interval_seconds: float = 5,
+        stats_shards: int = 10,
+        fair_scheduler: Optional[FairScheduler] = None,
+        ttl_days: Optional[int] = None,
+        notifier: Optional[TaskNotifier] = None,
+        rate_limiter: Optional['RateLimiter'] = None
+    ):
+        super().__init__(
+            worker_id, lease_seconds, sweep_interval_seconds, promote_interval_seconds, notifier, rate_limiter
+        )
+        self.db = db
+        self.tasks_collection = 'task_queue'
+        self.processing_collection = 'task_processing'
+        self.completed_collection = 'task_completed'
+        self.failed_collection = 'task_failed'
+        # One document per dedupe key held by an unfinished task
+        self.dedupe_collection = 'task_dedupe'
+        # Queue statistics are kept as counters spread over several shard
+        # documents so concurrent writers do not contend on a single document
+        self.stats_collection = 'task_stats'
+        self.stats_shards = stats_shards
+        # When set, claims share each priority band between users instead of strict FIFO,
+        # planned from per-user counters kept in one document per user
+        self.fair_scheduler = fair_scheduler
+        self.user_stats_collection = 'task_user_stats'
+        # When set, finished tasks get an ``expire_at`` timestamp for a Firestore TTL policy
+        self.ttl_days = ttl_days
+
+    def enqueue_task(
+        self,
+        task_type: TaskType,
+        user_id: str,
+        payload: Dict[str, Any],
+        priority: TaskPriority = TaskPriority.NORMAL,
+        scheduled_at: Optional[datetime] = None,
+        max_retries: int = 3,
+        timeout_seconds: int = 300,
+        dedupe_key: Optional[str] = None,
+        depends_on: Optional[List[str]] = None
+    ) -> str:
+        """Add a new task to the queue.
+
+        With a ``dedupe_key`` (for example a document id plus its content
+        hash) no new task is created while another task with the same key
+        is pending, scheduled, retrying or in progress; that task's id is
+        returned instead. The key is released when its task completes,
+        fails permanently or is cancelled.
+        
+        With ``depends_on`` the task stays BLOCKED until every listed task
+        has completed, then becomes claimable with the parents' results in
+        ``payload['parent_results']``; if a parent fails permanently or is
+        cancelled the task fails too. Raises ValueError if a parent does
+        not exist or has already failed or been cancelled.
+        """
+        
+        task = self._new_task(
+            task_type, user_id, payload, priority, scheduled_at, max_retries, timeout_seconds, dedupe_key,
+            depends_on
+        )
+        if depends_on:
+            parents = self._dependency_docs(depends_on)
+            self._check_dependencies(task.depends_on, parents)
+            self._settle_blocked(task, parents, task.created_at)
+        
+        task_id = task.id
+        task_data = task.to_dict()
+        task_ref = self.db.collection(self.tasks_collection).document(task_id)
+        
+        stats = _StatsDelta()
+        if task.status == TaskStatus.BLOCKED:
+            stats.blocked(1)
+        elif task.status == TaskStatus.SCHEDULED:
+            stats.delayed(1)
+        else:
+            stats.pending(task_data, 1)
+        
+        if dedupe_key is None:
+            # Store task in Firestore together with its stats counters
+            batch = self.db.batch()
+            batch.set(task_ref, task_data)
+            self._write_stats(batch, stats)
+            batch.commit()
+        else:
+            dedupe_ref = self._dedupe_ref(dedupe_key)
+            
+            @firestore.transactional
+            def enqueue(transaction) -> str:
+                snapshot = next(iter(transaction.get(dedupe_ref)), None)
+                if snapshot is not None and snapshot.exists:
+                    return snapshot.to_dict()['task_id']
+                
+                transaction.set(task_ref, task_data)
+                transaction.set(dedupe_ref, {
+                    'dedupe_key': dedupe_key,
+                    'task_id': task_id,
+                    'created_at': task_data['created_at']
+                })
+                self._write_stats(transaction, stats)
+                return task_id
+            
+            existing_id = enqueue(self.db.transaction())
+            if existing_id != task_id:
+                logger.info(f"Task for dedupe key {dedupe_key} already queued as {existing_id}")
+                return existing_id
         
         logger.info(f"Enqueued task {task_id} of type {task_type.value} for user {user_id}")
+        
+        if task.status == TaskStatus.PENDING:
+            self.notifier.notify()
+        elif task.status == TaskStatus.BLOCKED:
+            # A parent may have finished after it was read above, and its
+            # completion would not have seen this task yet
+            self._settle_blocked_tasks({task_id: task_data})
         return task_id
 
-    def get_next_task(self, task_types: Optional[List[TaskType]] = None) -> Optional[Task]:
-        """Get the next available task from the queue"""
+    def claim_batch(
+        self,
+        n: int,
+        task_types: Optional[List[TaskType]] = None,
+        worker_id: Optional[str] = None,
+        lease_seconds: Optional[int] = None
+    ) -> List[Task]:
+        """Claim up to ``n`` available tasks under a lease.
+
+        One query reads the candidates and one transaction commit claims them,
+        so two workers racing for the same documents cannot both win: the
+        loser's transaction is retried and sees the tasks as in progress.
+        With a ``fair_scheduler`` the candidates come from one query per
+        user chosen by the scheduler instead (see ``_fair_claim_queries``).
+        """
+        
+        self._maybe_sweep_expired_leases()
+        self._maybe_promote_due_tasks()
+        
+        worker_id = worker_id or self.worker_id
+        lease_seconds = lease_seconds or self.lease_seconds
+        # Each claim writes two documents, and maybe a user's counters, plus one stats shard write per transaction
+        per_transaction = (MAX_BATCH_WRITES - 1) // (2 + self._user_stats_writes_per_task())
+        n = max(0, min(self._rate_limited_count(n, task_types), per_transaction))
+        if n == 0:
+            return []
+        
+        picks = None
+        if self.fair_scheduler is not None:
+            picks, queries = self._fair_claim_queries(n, task_types)
+        else:
+            # Delayed tasks are SCHEDULED or RETRY until promoted, so every PENDING task is ready
+            query = self.db.collection(self.tasks_collection)\
+                .where('status', '==', TaskStatus.PENDING.value)\
+                .order_by('priority', direction=firestore.Query.DESCENDING)\
+                .order_by('created_at')\
+                .limit(n)
+            
+            # Filter by task types if specified
+            if task_types:
+                type_values = [t.value for t in task_types]
+                query = query.where('type', 'in', type_values)
+            queries = [query]
+        
+        if not queries:
+            return []
+        
+        @firestore.transactional
+        def claim(transaction) -> List[Task]:
+            claimed = []
+            claim_data = self._lease_fields(worker_id, lease_seconds)
+            stats = _StatsDelta()
+            
+            # Firestore transactions must finish reading before they write
+            docs = [doc for query in queries for doc in query.stream(transaction=transaction)]
+            
+            for doc in docs:
+                task_data = doc.to_dict()
+                
+                # Compare-and-set: only a task that is still pending can be claimed
+                if task_data.get('status') != TaskStatus.PENDING.value:
+                    continue
+                
+                stats.pending(task_data, -1)
+                stats.in_progress(task_data, 1)
+                task_fields = self._claim_fields(claim_data, task_data.get('timeout_seconds', 300))
+                task_data.update(task_fields)
+                transaction.update(doc.reference, task_fields)
+                processing_ref = self.db.collection(self.processing_collection).document(doc.id)
+                transaction.set(processing_ref, task_data)
+                claimed.append(Task.from_dict(task_data))
+            
+            self._write_stats(transaction, stats)
+            return claimed
+        
+        try:
+            tasks = claim(self.db.transaction())
+        except Exception as e:
+            logger.warning(f"Failed to claim tasks: {e}")
+            return []
+        
+        if picks is not None:
+            tasks = _in_pick_order(tasks, picks)
+        tasks = self._apply_rate_limits(tasks, worker_id)
+        self._record_wait_times(tasks)
+        
+        for task in tasks:
+            logger.info(f"Claimed task {task.id} of type {task.type.value} (worker {worker_id})")
+        return tasks
+
+    def _fair_claim_queries(
+        self,
+        n: int,
+        task_types: Optional[List[TaskType]]
+    ) -> Tuple[List[Tuple[int, str]], List[Any]]:
+        """Plan a fair claim from the per-user counters.
+
+        The scheduler splits ``n`` between users from the pending and
+        in-flight counters in the per-user documents; each (priority, user) it
+        picks becomes one ``user_id``/``priority`` query ordered by
+        ``created_at``. The counters are read outside the claim transaction,
+        so per-user in-flight caps can be overshot slightly when several
+        workers claim at the same moment.
+        """
+        
+        users = self._read_user_counters()
+        type_values = {t.value for t in task_types} if task_types else None
+        
+        backlog: Dict[int, Dict[str, int]] = {}
+        for user_id, counters in users.items():
+            for task_type, by_priority in counters.get('pending', {}).items():
+                if type_values is not None and task_type not in type_values:
+                    continue
+                for priority, count in by_priority.items():
+                    if count > 0:
+                        band = backlog.setdefault(int(priority), {})
+                        band[user_id] = band.get(user_id, 0) + count
+        
+        in_flight = {user_id: counters.get('in_progress', 0) for user_id, counters in users.items()}
+        picks = self.fair_scheduler.allocate(backlog, n, in_flight)
+        
+        wanted: Dict[Tuple[int, str], int] = {}
+        for pick in picks:
+            wanted[pick] = wanted.get(pick, 0) + 1
+        
+        queries = []
+        for (priority, user_id), count in wanted.items():
+            query = self.db.collection(self.tasks_collection)\
+                .where('status', '==', TaskStatus.PENDING.value)\
+                .where('user_id', '==', user_id)\
+                .where('priority', '==', priority)\
+                .order_by('created_at')\
+                .limit(count)
+            if task_types:
+                query = query.where('type', 'in', [t.value for t in task_types])
+            queries.append(query)
+        return picks, queries
+
+    def promote_due_tasks(self, limit: int = 200) -> int:
+        """Move SCHEDULED and RETRY tasks whose ``scheduled_at`` has passed to PENDING.
+
+        Uses the (status, scheduled_at) index as a due-time index, so the
+        cost is proportional to the number of tasks coming due rather than
+        the number waiting.
+        """
         
+        # One write per task, and maybe a user's counters, plus the stats shard must fit in a transaction
+        limit = max(0, min(limit, (MAX_BATCH_WRITES - 1) // (1 + self._user_stats_writes_per_task())))
         query = self.db.collection(self.tasks_collection)\
-            .where('status', '==', TaskStatus.PENDING.value)\
+            .where('status', 'in', [status.value for status in DELAYED_STATUSES])\
             .where('scheduled_at', '<=', datetime.now().isoformat())\
-            .order_by('priority', direction=firestore.Query.DESCENDING)\
-            .order_by('created_at')\
-            .limit(1)
+            .order_by('scheduled_at')\
+            .limit(limit)
         
-        # Filter by task types if specified
-        if task_types:
-            type_values = [t.value for t in task_types]
-            query = query.where('type', 'in', type_values)
+        @firestore.transactional
+        def promote(transaction) -> int:
+            stats = _StatsDelta()
+            now = datetime.now().isoformat()
+            promoted = 0
+            
+            for doc in query.stream(transaction=transaction):
+                task_data = doc.to_dict()
+                transaction.update(doc.reference, {
+                    'status': TaskStatus.PENDING.value,
+                    'updated_at': now
+                })
+                stats.delayed(-1)
+                stats.pending(task_data, 1)
+                promoted += 1
+            
+            self._write_stats(transaction, stats)
+            return promoted
+        
+        promoted = promote(self.db.transaction())
+        if promoted:
+            logger.info(f"Promoted {promoted} due tasks to pending")
+            self.notifier.notify()
+        return promoted
+
+    def next_due_at(self) -> Optional[datetime]:
+        """Earliest ``scheduled_at`` among SCHEDULED and RETRY tasks"""
         
-        docs = query.stream()
+        docs = self.db.collection(self.tasks_collection)\
+            .where('status', 'in', [status.value for status in DELAYED_STATUSES])\
+            .order_by('scheduled_at')\
+            .limit(1)\
+            .stream()
         
         for doc in docs:
-            task_data = doc.to_dict()
-            task = Task.from_dict(task_data)
+            return datetime.fromisoformat(doc.to_dict()['scheduled_at'])
+        return None
+
+    def renew_lease(
+        self,
+        task_id: str,
+        worker_id: Optional[str] = None,
+        lease_seconds: Optional[int] = None,
+        lease_id: Optional[str] = None
+    ) -> bool:
+        """Extend the lease on a claimed task; returns False if the lease was lost.
+
+        With ``lease_id`` only that claim's lease is extended, not a later
+        claim of the same task by this worker.
+        """
+        
+        worker_id = worker_id or self.worker_id
+        lease_seconds = lease_seconds or self.lease_seconds
+        processing_ref = self.db.collection(self.processing_collection).document(task_id)
+        task_ref = self.db.collection(self.tasks_collection).document(task_id)
+        
+        @firestore.transactional
+        def renew(transaction) -> bool:
+            snapshot = next(iter(transaction.get(processing_ref)), None)
+            if snapshot is None or not snapshot.exists:
+                return False
+            if not self._holds_lease(snapshot.to_dict(), worker_id, lease_id):
+                return False
             
-            # Try to claim the task by updating its status
+            lease_expires_at = (datetime.now() + timedelta(seconds=lease_seconds)).isoformat()
+            transaction.update(processing_ref, {'lease_expires_at': lease_expires_at})
+            transaction.update(task_ref, {'lease_expires_at': lease_expires_at})
+            return True
+        
+        return renew(self.db.transaction())
+
+    def requeue_expired_leases(self, limit: int = 100) -> int:
+        """Put tasks whose lease has expired back in the queue.
+
+        A worker that dies mid-task stops renewing its lease; once the lease
+        runs out the task becomes PENDING again without counting as a retry.
+        """
+        
+        expired_docs = self.db.collection(self.processing_collection)\
+            .where('lease_expires_at', '<', datetime.now().isoformat())\
+            .limit(limit)\
+            .stream()
+        
+        requeued = 0
+        for doc in expired_docs:
             try:
-                doc.reference.update({
-                    'status': TaskStatus.IN_PROGRESS.value,
-                    'started_at': datetime.now().isoformat(),
-                    'updated_at': datetime.now().isoformat()
-                })
-                
-                # Move task to processing collection
-                self.db.collection(self.processing_collection).document(task.id).set(task_data)
-                
-                logger.info(f"Claimed task {task.id} of type {task.type.value}")
-                return task
-                
+                if self._requeue_expired(doc.id):
+                    requeued += 1
             except Exception as e:
-                logger.warning(f"Failed to claim task {task.id}: {e}")
-                continue
+                logger.warning(f"Failed to requeue expired task {doc.id}: {e}")
         
-        return None
+        if requeued:
+            logger.info(f"Requeued {requeued} tasks with expired leases")
+            self.notifier.notify()
+        return requeued
+
+    def _requeue_expired(self, task_id: str) -> bool:
+        """Return one expired task to the queue if its lease is still expired"""
+        
+        processing_ref = self.db.collection(self.processing_collection).document(task_id)
+        task_ref = self.db.collection(self.tasks_collection).document(task_id)
+        
+        @firestore.transactional
+        def requeue(transaction) -> bool:
+            snapshot = next(iter(transaction.get(processing_ref)), None)
+            if snapshot is None or not snapshot.exists:
+                return False
+            
+            # The lease may have been renewed since the sweep query ran
+            lease_expires_at = snapshot.to_dict().get('lease_expires_at')
+            now = datetime.now().isoformat()
+            if not lease_expires_at or lease_expires_at >= now:
+                return False
+            
+            transaction.delete(processing_ref)
+            transaction.update(task_ref, {
+                'status': TaskStatus.PENDING.value,
+                'worker_id': None,
+                'lease_id': None,
+                'lease_expires_at': None,
+                'deadline_at': None,
+                'started_at': None,
+                'updated_at': now
+            })
+            
+            stats = _StatsDelta()
+            stats.in_progress(snapshot.to_dict(), -1)
+            stats.pending(snapshot.to_dict(), 1)
+            self._write_stats(transaction, stats)
+            return True
+        
+        return requeue(self.db.transaction())
 
-    def complete_task(self, task_id: str, result: Optional[Dict[str, Any]] = None):
-        """Mark a task as completed"""
+    def _timed_out_tasks(self, limit: int) -> Dict[str, int]:
+        """One range query on the processing collection's ``deadline_at`` index"""
+        
+        docs = self.db.collection(self.processing_collection)\
+            .where('deadline_at', '<', datetime.now().isoformat())\
+            .order_by('deadline_at')\
+            .limit(limit)\
+            .stream()
+        
+        return {doc.id: doc.to_dict().get('timeout_seconds', 300) for doc in docs}
+
+    def complete_batch(
+        self,
+        results: Dict[str, Optional[Dict[str, Any]]],
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """Mark several tasks as completed, one transaction per chunk of tasks.
+
+        ``results`` maps task id to its result; ``lease_ids`` optionally maps
+        task id to the ``Task.lease_id`` of the claim the result belongs to. Each chunk's processing
+        documents are read in one ``get_all`` inside the transaction that
+        moves them, so the lease check and the move commit together.
+        Returns the ids that were completed.
+        """
         
         now = datetime.now()
         update_data = {
@@ -185,68 +1140,151 @@ class TaskQueue:
             'updated_at': now.isoformat()
         }
         
-        if result:
-            update_data['result'] = result
-        
-        # Update task in processing collection
-        processing_ref = self.db.collection(self.processing_collection).document(task_id)
-        processing_doc = processing_ref.get()
-        
-        if processing_doc.exists:
-            processing_ref.update(update_data)
-            
-            # Move to completed collection
-            task_data = processing_doc.to_dict()
+        def complete(transaction, stats: _StatsDelta, task_id: str, task_data: Dict[str, Any]) -> TaskStatus:
             task_data.update(update_data)
-            self.db.collection(self.completed_collection).document(task_id).set(task_data)
-            
-            # Remove from processing and queue collections
-            processing_ref.delete()
-            self.db.collection(self.tasks_collection).document(task_id).delete()
+            task_data.update(self._expiry_fields(now))
+            if results[task_id]:
+                task_data['result'] = results[task_id]
             
+            # Move to completed collection, remove from processing and queue collections
+            transaction.set(self.db.collection(self.completed_collection).document(task_id), task_data)
+            transaction.delete(self.db.collection(self.processing_collection).document(task_id))
+            transaction.delete(self.db.collection(self.tasks_collection).document(task_id))
+            self._release_dedupe_key(transaction, task_data)
+            stats.in_progress(task_data, -1)
+            stats.finished(TaskStatus.COMPLETED, now)
+            return TaskStatus.COMPLETED
+        
+        completed = list(self._settle_claimed(list(results), worker_id, 4, complete, lease_ids))
+        
+        for task_id in completed:
             logger.info(f"Completed task {task_id}")
-        else:
-            logger.warning(f"Task {task_id} not found in processing collection")
+        self._release_dependents(completed)
+        return completed
 
-    def fail_task(self, task_id: str, error_message: str, retry: bool = True):
-        """Mark a task as failed and optionally retry"""
+    def fail_batch(
+        self,
+        errors: Dict[str, str],
+        retry: bool = True,
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> Dict[str, TaskStatus]:
+        """Mark several tasks as failed, one transaction per chunk of tasks.
+
+        ``errors`` maps task id to its error message. Tasks with retries left
+        go back to the queue with exponential backoff, the rest move to the
+        failed collection. Returns the resulting status per task id.
+        """
         
-        processing_ref = self.db.collection(self.processing_collection).document(task_id)
-        processing_doc = processing_ref.get()
+        now = datetime.now()
         
-        if not processing_doc.exists:
-            logger.warning(f"Task {task_id} not found in processing collection")
-            return
+        def fail(transaction, stats: _StatsDelta, task_id: str, task_data: Dict[str, Any]) -> TaskStatus:
+            task = Task.from_dict(task_data)
+            status = self._apply_failure(task, errors[task_id], retry, now)
+            
+            processing_ref = self.db.collection(self.processing_collection).document(task_id)
+            task_ref = self.db.collection(self.tasks_collection).document(task_id)
+            stats.in_progress(task_data, -1)
+            
+            if status == TaskStatus.RETRY:
+                # Move back to queue; the scheduler promotes it once the backoff has passed
+                transaction.set(task_ref, task.to_dict())
+                transaction.delete(processing_ref)
+                stats.delayed(1)
+            else:
+                # Move to failed collection
+                failed_data = task.to_dict()
+                failed_data.update(self._expiry_fields(now))
+                transaction.set(self.db.collection(self.failed_collection).document(task_id), failed_data)
+                transaction.delete(processing_ref)
+                transaction.delete(task_ref)
+                self._release_dedupe_key(transaction, task_data)
+                stats.finished(TaskStatus.FAILED, now)
+            return task.status
         
-        task_data = processing_doc.to_dict()
-        task = Task.from_dict(task_data)
+        outcomes = self._settle_claimed(list(errors), worker_id, 4, fail, lease_ids)
+        self._release_dependents([
+            task_id for task_id, status in outcomes.items() if status == TaskStatus.FAILED
+        ])
+        return outcomes
+
+    def defer_batch(
+        self,
+        delays: Dict[str, float],
+        worker_id: Optional[str] = None,
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """Hand claimed tasks back to the queue as SCHEDULED, one transaction per chunk of tasks.
+
+        ``delays`` maps task id to seconds to wait. Used for rate-limited
+        tasks: the retry count is untouched. Returns the ids deferred.
+        """
         
         now = datetime.now()
-        task.retry_count += 1
-        task.error_message = error_message
-        task.updated_at = now
         
-        if retry and task.retry_count <= task.max_retries:
-            # Retry the task with exponential backoff
-            delay_minutes = 2 ** task.retry_count  # 2, 4, 8 minutes
-            task.scheduled_at = now + timedelta(minutes=delay_minutes)
-            task.status = TaskStatus.RETRY
-            
-            # Move back to queue
-            self.db.collection(self.tasks_collection).document(task_id).set(task.to_dict())
-            processing_ref.delete()
+        def defer(transaction, stats: _StatsDelta, task_id: str, task_data: Dict[str, Any]) -> TaskStatus:
+            task = Task.from_dict(task_data)
+            self._apply_deferral(task, delays[task_id], now)
             
-            logger.info(f"Retrying task {task_id} (attempt {task.retry_count}/{task.max_retries})")
-        else:
-            # Mark as permanently failed
-            task.status = TaskStatus.FAILED
+            transaction.set(self.db.collection(self.tasks_collection).document(task_id), task.to_dict())
+            transaction.delete(self.db.collection(self.processing_collection).document(task_id))
+            stats.in_progress(task_data, -1)
+            stats.delayed(1)
+            return task.status
+        
+        return list(self._settle_claimed(list(delays), worker_id, 3, defer, lease_ids))
+
+    def _settle_claimed(
+        self,
+        task_ids: List[str],
+        worker_id: Optional[str],
+        writes_per_task: int,
+        settle: Callable[[Any, _StatsDelta, str, Dict[str, Any]], TaskStatus],
+        lease_ids: Optional[Dict[str, str]] = None
+    ) -> Dict[str, TaskStatus]:
+        """Apply ``settle`` to each task whose lease ``worker_id`` still holds; returns its outcome per task id.
+
+        Tasks listed in ``lease_ids`` are settled only while that claim is
+        current, so a result from an earlier claim of the task is dropped.
+
+        The processing documents are read inside the transaction that writes
+        the outcome. If the sweep requeues a task and another worker claims
+        it after the read, the commit fails on the changed document and the
+        transaction retries, now seeing the new owner and skipping the task,
+        so a stale worker never overwrites another worker's claim.
+        ``settle`` may run more than once per task and must only write
+        through the transaction and ``stats``.
+        """
+        
+        outcomes: Dict[str, TaskStatus] = {}
+        # Leave room for the stats shard write and each task's user counters
+        per_transaction = (MAX_BATCH_WRITES - 1) // (writes_per_task + self._user_stats_writes_per_task())
+        
+        for start in range(0, len(task_ids), per_transaction):
+            refs = [
+                self.db.collection(self.processing_collection).document(task_id)
+                for task_id in task_ids[start:start + per_transaction]
+            ]
             
-            # Move to failed collection
-            self.db.collection(self.failed_collection).document(task_id).set(task.to_dict())
-            processing_ref.delete()
-            self.db.collection(self.tasks_collection).document(task_id).delete()
+            @firestore.transactional
+            def settle_chunk(transaction) -> Dict[str, TaskStatus]:
+                stats = _StatsDelta()
+                chunk_outcomes = {}
+                for snapshot in self.db.get_all(refs, transaction=transaction):
+                    if not snapshot.exists:
+                        logger.warning(f"Task {snapshot.id} not found in processing collection")
+                        continue
+                    task_data = snapshot.to_dict()
+                    lease_id = (lease_ids or {}).get(snapshot.id)
+                    if not self._holds_lease(task_data, worker_id, lease_id):
+                        logger.warning(f"Worker {worker_id} no longer holds the lease on task {snapshot.id}")
+                        continue
+                    chunk_outcomes[snapshot.id] = settle(transaction, stats, snapshot.id, task_data)
+                self._write_stats(transaction, stats)
+                return chunk_outcomes
             
-            logger.error(f"Task {task_id} failed permanently: {error_message}")
+            outcomes.update(settle_chunk(self.db.transaction()))
+        return outcomes
 
     def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
         """Get the current status of a task"""
@@ -266,111 +1304,438 @@ class TaskQueue:
         
         return None
 
-    def get_user_tasks(
+    def get_user_tasks_page(
         self,
         user_id: str,
         status: Optional[TaskStatus] = None,
-        limit: int = 50
-    ) -> List[Dict[str, Any]]:
-        """Get tasks for a specific user"""
-        
-        collections = [
-            self.tasks_collection,
-            self.processing_collection,
-            self.completed_collection,
-            self.failed_collection
-        ]
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get one page of a user's tasks, newest first.
+
+        Each collection that can hold tasks in ``status`` is streamed in
+        (created_at, id) descending order, starting after the cursor and
+        capped at ``limit + 1`` rows. A lazy k-way heap merge stops as soon
+        as the page is full, so deep pages cost the same as the first one.
+        Finished and in-progress tasks live in their own collections, so only
+        queue statuses need a status filter; every other query runs on a
+        (user_id, created_at, id) index.
+        """
         
-        all_tasks = []
+        limit = max(1, limit)
+        after = self._parse_page_cursor(cursor) if cursor else None
         
-        for collection_name in collections:
-            query = self.db.collection(collection_name)\
-                .where('user_id', '==', user_id)\
+        streams = []
+        for collection_name, status_value in self._user_task_sources(status):
+            query = self.db.collection(collection_name).where('user_id', '==', user_id)
+            if status_value:
+                query = query.where('status', '==', status_value)
+            query = query\
                 .order_by('created_at', direction=firestore.Query.DESCENDING)\
-                .limit(limit)
-            
-            if status:
-                query = query.where('status', '==', status.value)
-            
-            docs = query.stream()
-            for doc in docs:
-                task_data = doc.to_dict()
-                task_data['collection'] = collection_name
-                all_tasks.append(task_data)
+                .order_by('id', direction=firestore.Query.DESCENDING)
+            if after:
+                query = query.start_after({'created_at': after[0], 'id': after[1]})
+            streams.append(_tagged_stream(query.limit(limit + 1), collection_name))
+        
+        tasks = []
+        next_cursor = None
+        for task_data in heapq.merge(*streams, key=_page_key, reverse=True):
+            if len(tasks) == limit:
+                next_cursor = self._page_cursor(tasks[-1])
+                break
+            tasks.append(task_data)
         
-        # Sort by created_at descending
-        all_tasks.sort(key=lambda x: x['created_at'], reverse=True)
-        return all_tasks[:limit]
+        return {'tasks': tasks, 'next_cursor': next_cursor}
+
+    def _user_task_sources(self, status: Optional[TaskStatus]) -> List[Tuple[str, Optional[str]]]:
+        """Collections to read for ``status``, with the status filter each needs.
+
+        The queue collection keeps a copy of every unfinished task (claims
+        update it as well as writing the processing document), so the
+        processing collection is only read for IN_PROGRESS.
+        """
+        
+        if status is None:
+            return [(self.tasks_collection, None), (self.completed_collection, None), (self.failed_collection, None)]
+        if status == TaskStatus.IN_PROGRESS:
+            return [(self.processing_collection, None)]
+        if status == TaskStatus.COMPLETED:
+            return [(self.completed_collection, None)]
+        if status == TaskStatus.FAILED:
+            return [(self.failed_collection, None)]
+        return [(self.tasks_collection, status.value)]
 
     def cancel_task(self, task_id: str) -> bool:
-        """Cancel a pending task"""
+        """Cancel a pending, scheduled or blocked task; tasks depending on it fail"""
         
         task_ref = self.db.collection(self.tasks_collection).document(task_id)
-        task_doc = task_ref.get()
-        
-        if task_doc.exists:
-            task_data = task_doc.to_dict()
-            if task_data['status'] == TaskStatus.PENDING.value:
-                task_ref.update({
-                    'status': TaskStatus.CANCELLED.value,
-                    'updated_at': datetime.now().isoformat()
-                })
-                logger.info(f"Cancelled task {task_id}")
-                return True
+        cancellable = (TaskStatus.PENDING.value, TaskStatus.SCHEDULED.value, TaskStatus.BLOCKED.value)
+        
+        @firestore.transactional
+        def cancel(transaction) -> bool:
+            snapshot = next(iter(transaction.get(task_ref)), None)
+            if snapshot is None or not snapshot.exists:
+                return False
+            
+            task_data = snapshot.to_dict()
+            if task_data['status'] not in cancellable:
+                return False
+            
+            transaction.update(task_ref, {
+                'status': TaskStatus.CANCELLED.value,
+                'updated_at': datetime.now().isoformat()
+            })
+            self._release_dedupe_key(transaction, task_data)
+            stats = _StatsDelta()
+            if task_data['status'] == TaskStatus.SCHEDULED.value:
+                stats.delayed(-1)
+            elif task_data['status'] == TaskStatus.BLOCKED.value:
+                stats.blocked(-1)
+            else:
+                stats.pending(task_data, -1)
+            self._write_stats(transaction, stats)
+            return True
         
-        return False
+        cancelled = cancel(self.db.transaction())
+        if cancelled:
+            logger.info(f"Cancelled task {task_id}")
+            self._release_dependents([task_id])
+        return cancelled
 
-    def cleanup_old_tasks(self, days_old: int = 30):
-        """Clean up old completed and failed tasks"""
+    def resolve_blocked_tasks(self, limit: int = 100) -> int:
+        """Settle BLOCKED tasks whose parents have already finished.
+
+        Children are normally settled right after their parents finish; this
+        is a maintenance job for children missed because that follow-up
+        failed (e.g. the process died between the two). Returns the number
+        of tasks unblocked or failed.
+        """
         
-        cutoff_date = datetime.now() - timedelta(days=days_old)
-        collections = [self.completed_collection, self.failed_collection]
+        docs = self.db.collection(self.tasks_collection)\
+            .where('status', '==', TaskStatus.BLOCKED.value)\
+            .limit(limit)\
+            .stream()
         
-        for collection_name in collections:
-            query = self.db.collection(collection_name)\
-                .where('completed_at', '<', cutoff_date.isoformat())\
-                .limit(100)
-            
-            docs = query.stream()
-            batch = self.db.batch()
-            count = 0
+        return len(self._settle_blocked_tasks({doc.id: doc.to_dict() for doc in docs}))
+
+    def _release_dependents(self, parent_ids: List[str]):
+        """Settle the BLOCKED children of tasks that just finished"""
+        
+        if not parent_ids:
+            return
+        try:
+            self._settle_blocked_tasks(self._blocked_children(parent_ids))
+        except Exception as e:
+            # The parents are already finished; resolve_blocked_tasks picks the children up later
+            logger.warning(f"Releasing dependents of {len(parent_ids)} tasks failed: {e}")
+
+    def _settle_blocked_tasks(self, blocked: Dict[str, Dict[str, Any]]) -> Dict[str, TaskStatus]:
+        """Unblock or fail ``blocked`` tasks, cascading failures to their own children"""
+        
+        outcomes = {}
+        while blocked:
+            parents = self._dependency_docs(
+                parent_id for task_data in blocked.values() for parent_id in task_data['depends_on']
+            )
+            failed = []
+            for task_data in blocked.values():
+                task = Task.from_dict(task_data)
+                if self._settle_blocked(task, parents, datetime.now()) is None:
+                    continue
+                if self._write_settled(task):
+                    outcomes[task.id] = task.status
+                    if task.status == TaskStatus.FAILED:
+                        failed.append(task.id)
+            blocked = self._blocked_children(failed)
+        return outcomes
+
+    def _write_settled(self, task: Task) -> bool:
+        """Store a task ``_settle_blocked`` decided on, unless another writer already settled it"""
+        
+        task_ref = self.db.collection(self.tasks_collection).document(task.id)
+        task_data = task.to_dict()
+        
+        @firestore.transactional
+        def settle(transaction) -> bool:
+            snapshot = next(iter(transaction.get(task_ref)), None)
+            if snapshot is None or not snapshot.exists:
+                return False
+            if snapshot.to_dict()['status'] != TaskStatus.BLOCKED.value:
+                return False
             
+            stats = _StatsDelta()
+            stats.blocked(-1)
+            if task.status == TaskStatus.FAILED:
+                failed_data = dict(task_data, **self._expiry_fields(task.updated_at))
+                transaction.set(self.db.collection(self.failed_collection).document(task.id), failed_data)
+                transaction.delete(task_ref)
+                self._release_dedupe_key(transaction, task_data)
+                stats.finished(TaskStatus.FAILED, task.updated_at)
+            else:
+                transaction.update(task_ref, {
+                    'status': task_data['status'],
+                    'payload': task_data['payload'],
+                    'updated_at': task_data['updated_at']
+                })
+                if task.status == TaskStatus.SCHEDULED:
+                    stats.delayed(1)
+                else:
+                    stats.pending(task_data, 1)
+            self._write_stats(transaction, stats)
+            return True
+        
+        settled = settle(self.db.transaction())
+        if settled and task.status == TaskStatus.PENDING:
+            self.notifier.notify()
+        return settled
+
+    def _blocked_children(self, parent_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """BLOCKED tasks that list any of ``parent_ids`` in ``depends_on``"""
+        
+        children = {}
+        for parent_id in parent_ids:
+            docs = self.db.collection(self.tasks_collection)\
+                .where('depends_on', 'array_contains', parent_id)\
+                .where('status', '==', TaskStatus.BLOCKED.value)\
+                .stream()
             for doc in docs:
-                batch.delete(doc.reference)
-                count += 1
+                children[doc.id] = doc.to_dict()
+        return children
+
+    def _dependency_docs(self, task_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Stored data of ``task_ids``, wherever they are, in one round trip.
+
+        Every task is in exactly one of the queue, completed and failed
+        collections, since finishing a task moves it in a single batch.
+        """
+        
+        task_ids = list(dict.fromkeys(task_ids))
+        if not task_ids:
+            return {}
+        
+        collections = (self.tasks_collection, self.completed_collection, self.failed_collection)
+        refs = [self.db.collection(name).document(task_id) for name in collections for task_id in task_ids]
+        return {snapshot.id: snapshot.to_dict() for snapshot in self.db.get_all(refs) if snapshot.exists}
+
+    def cleanup_old_tasks(
+        self,
+        days_old: int = 30,
+        batch_size: int = MAX_BATCH_WRITES,
+        pause_seconds: float = 1.0
+    ) -> int:
+        """Delete completed and failed tasks older than ``days_old``.
+
+        Each collection is drained completely in write batches of up to
+        ``batch_size`` deletes, pausing ``pause_seconds`` between batches to
+        keep the sustained delete rate gentle on the indexes. Completed
+        tasks age by ``completed_at``; failed tasks never set it, so they
+        age by ``updated_at``. Returns the number of tasks deleted.
+
+        With ``ttl_days`` set, a Firestore TTL policy on ``expire_at`` does
+        this instead and cleanup only needs to run for tasks finished before
+        TTL was enabled.
+        """
+        
+        cutoff_date = (datetime.now() - timedelta(days=days_old)).isoformat()
+        batch_size = max(1, min(batch_size, MAX_BATCH_WRITES))
+        sources = [
+            (self.completed_collection, 'completed_at'),
+            (self.failed_collection, 'updated_at')
+        ]
+        
+        total = 0
+        for collection_name, age_field in sources:
+            # Only document references are needed, so skip downloading task fields
+            query = self.db.collection(collection_name)\
+                .where(age_field, '<', cutoff_date)\
+                .select([])\
+                .limit(batch_size)
             
-            if count > 0:
+            deleted = 0
+            while True:
+                docs = list(query.stream())
+                if not docs:
+                    break
+                
+                batch = self.db.batch()
+                for doc in docs:
+                    batch.delete(doc.reference)
                 batch.commit()
-                logger.info(f"Cleaned up {count} old tasks from {collection_name}")
+                deleted += len(docs)
+                
+                if len(docs) < batch_size:
+                    break
+                time.sleep(pause_seconds)
+            
+            if deleted:
+                logger.info(f"Cleaned up {deleted} old tasks from {collection_name}")
+            total += deleted
+        
+        return total
 
     def get_queue_stats(self) -> Dict[str, Any]:
-        """Get queue statistics"""
-        
-        stats = {
-            'pending': 0,
-            'in_progress': 0,
-            'completed_today': 0,
-            'failed_today': 0,
-            'by_type': {},
-            'by_priority': {}
-        }
+        """Get queue statistics from the sharded counters.
+
+        Reads the ``stats_shards`` counter documents in one round trip, so
+        the cost does not grow with queue depth. ``by_user`` and
+        ``in_progress_by_user`` are only counted with a ``fair_scheduler``,
+        and cost one read per user with unfinished tasks.
+        """
+        
+        users = self._read_user_counters() if self.fair_scheduler is not None else {}
+        return _stats_from_counters(self._read_stats_counters(), users)
+
+    def reconcile_queue_stats(self) -> Dict[str, Any]:
+        """Recount statistics with a full scan and reset the counter shards.
+
+        Intended as a periodic maintenance job to correct drift. Counter
+        updates committed while the scan runs may be lost, so schedule it
+        for a quiet period. Per-day counters older than today are dropped.
+        """
+        
+        counters, users = self._scan_counters()
+        
+        batch = self.db.batch()
+        refs = self._stats_shard_refs()
+        batch.set(refs[0], counters)
+        for ref in refs[1:]:
+            batch.set(ref, {})
+        batch.commit()
+        
+        if self.fair_scheduler is None:
+            users = {}
+        else:
+            self._reset_user_counters(users)
+        stats = _stats_from_counters(counters, users)
+        
+        logger.info(f"Reconciled queue statistics: {stats}")
+        return stats
+
+    def _expiry_fields(self, finished_at: datetime) -> Dict[str, Any]:
+        """``expire_at`` for the TTL policy; a datetime is stored as a Firestore timestamp"""
+        if self.ttl_days is None:
+            return {}
+        # Task times are naive local time, while TTL compares against UTC timestamps
+        expire_at = finished_at.astimezone(timezone.utc) + timedelta(days=self.ttl_days)
+        return {'expire_at': expire_at}
+
+    def _dedupe_ref(self, dedupe_key: str):
+        # Keys may contain '/', which is not allowed in a document id
+        doc_id = hashlib.sha256(dedupe_key.encode('utf-8')).hexdigest()
+        return self.db.collection(self.dedupe_collection).document(doc_id)
+
+    def _release_dedupe_key(self, writer, task_data: Dict[str, Any]):
+        """Free a finished task's dedupe key in the same batch or transaction that finishes it"""
+        if task_data.get('dedupe_key'):
+            writer.delete(self._dedupe_ref(task_data['dedupe_key']))
+
+    def _read_stats_counters(self) -> Dict[str, Any]:
+        """Sum the counter shards, read in one round trip"""
+        
+        totals: Dict[str, Any] = {}
+        for snapshot in self.db.get_all(self._stats_shard_refs()):
+            if snapshot.exists:
+                _add_counters(totals, snapshot.to_dict())
+        return totals
+
+    def _stats_shard_refs(self) -> List[Any]:
+        collection = self.db.collection(self.stats_collection)
+        return [collection.document(f"shard_{i}") for i in range(self.stats_shards)]
+
+    def _random_stats_shard(self):
+        shard = random.randrange(self.stats_shards)
+        return self.db.collection(self.stats_collection).document(f"shard_{shard}")
+
+    def _write_stats(self, writer, stats: _StatsDelta):
+        """Add counter changes to a transaction or batch, with the per-user counters under fair scheduling"""
+        if stats:
+            writer.set(self._random_stats_shard(), stats.to_update(), merge=True)
+        if self.fair_scheduler is not None:
+            for user_id, update in stats.user_updates().items():
+                writer.set(self._user_stats_ref(user_id), update, merge=True)
+    
+    def _user_stats_writes_per_task(self) -> int:
+        # A task's move writes its user's counter document too under fair scheduling
+        return 1 if self.fair_scheduler is not None else 0
+    
+    def _user_stats_ref(self, user_id: str):
+        return self.db.collection(self.user_stats_collection).document(user_id)
+    
+    def _read_user_counters(self) -> Dict[str, Dict[str, Any]]:
+        """Counter document per user id; documents that have dropped to zero are deleted"""
+        
+        users = {}
+        idle = []
+        for doc in self.db.collection(self.user_stats_collection).stream():
+            counters = doc.to_dict()
+            if _user_is_idle(counters):
+                idle.append(doc.reference)
+            else:
+                users[counters.get('user_id', doc.id)] = counters
+        if idle:
+            try:
+                self._delete_idle_user_counters(idle)
+            except Exception as e:
+                logger.warning(f"Deleting {len(idle)} idle user counter documents failed: {e}")
+        return users
+    
+    def _delete_idle_user_counters(self, refs: List[Any]):
+        """Delete user counter documents that are still all zero when re-read in the deleting transaction"""
+        
+        for start in range(0, len(refs), MAX_BATCH_WRITES):
+            chunk = refs[start:start + MAX_BATCH_WRITES]
+            
+            @firestore.transactional
+            def delete_idle(transaction):
+                # A task moved for the user since the stream changes the document and fails the commit
+                for snapshot in self.db.get_all(chunk, transaction=transaction):
+                    if snapshot.exists and _user_is_idle(snapshot.to_dict()):
+                        transaction.delete(snapshot.reference)
+            
+            delete_idle(self.db.transaction())
+    
+    def _reset_user_counters(self, users: Dict[str, Dict[str, Any]]):
+        """Replace every user counter document with recounted ``users``, deleting the rest"""
+        
+        stale = [
+            doc.reference for doc in self.db.collection(self.user_stats_collection).select([]).stream()
+            if doc.id not in users
+        ]
+        writes = [(self._user_stats_ref(user_id), counters) for user_id, counters in users.items()]
+        writes += [(ref, None) for ref in stale]
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for ref, counters in writes[start:start + MAX_BATCH_WRITES]:
+                if counters is None:
+                    batch.delete(ref)
+                else:
+                    batch.set(ref, counters)
+            batch.commit()
+
+    def _scan_counters(self) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """Rebuild the stats shard and per-user counters by streaming the queue collections"""
+        
+        stats = _StatsDelta()
+        
+        # Count tasks waiting for their scheduled time
+        delayed_docs = self.db.collection(self.tasks_collection)\
+            .where('status', 'in', [status.value for status in DELAYED_STATUSES]).stream()
+        stats.add('delayed', len(list(delayed_docs)))
+        
+        # Count tasks waiting for their dependencies
+        blocked_docs = self.db.collection(self.tasks_collection)\
+            .where('status', '==', TaskStatus.BLOCKED.value).stream()
+        stats.add('blocked', len(list(blocked_docs)))
         
         # Count pending tasks
         pending_docs = self.db.collection(self.tasks_collection)\
             .where('status', '==', TaskStatus.PENDING.value).stream()
-        
         for doc in pending_docs:
-            stats['pending'] += 1
-            task_data = doc.to_dict()
-            task_type = task_data.get('type', 'unknown')
-            priority = task_data.get('priority', 'unknown')
-            
-            stats['by_type'][task_type] = stats['by_type'].get(task_type, 0) + 1
-            stats['by_priority'][str(priority)] = stats['by_priority'].get(str(priority), 0) + 1
+            stats.pending(doc.to_dict(), 1)
         
         # Count in-progress tasks
-        processing_docs = self.db.collection(self.processing_collection).stream()
-        stats['in_progress'] = len(list(processing_docs))
+        for doc in self.db.collection(self.processing_collection).stream():
+            stats.in_progress(doc.to_dict(), 1)
         
         # Count today's completed/failed tasks
         today = datetime.now().date()
@@ -378,10 +1743,70 @@ class TaskQueue:
         
         completed_today = self.db.collection(self.completed_collection)\
             .where('completed_at', '>=', today_start.isoformat()).stream()
-        stats['completed_today'] = len(list(completed_today))
+        stats.add(f"completed_by_day.{today.isoformat()}", len(list(completed_today)))
         
         failed_today = self.db.collection(self.failed_collection)\
             .where('updated_at', '>=', today_start.isoformat()).stream()
-        stats['failed_today'] = len(list(failed_today))
+        stats.add(f"failed_by_day.{today.isoformat()}", len(list(failed_today)))
         
-        return stats
\ No newline at end of file
+        counters = stats.to_counters()
+        for key in ('pending', 'delayed', 'blocked', 'in_progress'):
+            counters.setdefault(key, 0)
+        return counters, stats.user_counters()
+
+def _add_counters(totals: Dict[str, Any], shard: Dict[str, Any]):
+    """Sum a stats shard document into ``totals``, recursing into counter maps"""
+    for key, value in shard.items():
+        if isinstance(value, dict):
+            _add_counters(totals.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)):
+            totals[key] = totals.get(key, 0) + value
+
+def _user_pending(counters: Dict[str, Any]) -> int:
+    return sum(count for by_priority in counters.get('pending', {}).values() for count in by_priority.values())
+
+def _user_is_idle(counters: Dict[str, Any]) -> bool:
+    """Whether a user counter document has nothing pending or in progress left"""
+    return not _user_pending(counters) and not counters.get('in_progress', 0)
+
+def _stats_from_counters(counters: Dict[str, Any], users: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Shape summed stats shard counters and per-user counters into the ``get_queue_stats`` report"""
+    
+    today = datetime.now().date().isoformat()
+    pending_by_user = {user_id: _user_pending(user_counters) for user_id, user_counters in users.items()}
+    in_progress_by_user = {user_id: user_counters.get('in_progress', 0) for user_id, user_counters in users.items()}
+    return {
+        'pending': counters.get('pending', 0),
+        'delayed': counters.get('delayed', 0),
+        'blocked': counters.get('blocked', 0),
+        'in_progress': counters.get('in_progress', 0),
+        'completed_today': counters.get('completed_by_day', {}).get(today, 0),
+        'failed_today': counters.get('failed_by_day', {}).get(today, 0),
+        'by_type': {k: v for k, v in counters.get('pending_by_type', {}).items() if v},
+        'by_priority': {k: v for k, v in counters.get('pending_by_priority', {}).items() if v},
+        'by_user': {k: v for k, v in pending_by_user.items() if v},
+        'in_progress_by_user': {k: v for k, v in in_progress_by_user.items() if v}
+    }
+
+def _page_key(task_data: Dict[str, Any]) -> Tuple[str, str]:
+    return task_data['created_at'], task_data['id']
+
+def _tagged_stream(query, collection_name: str):
+    """Stream a query lazily, tagging each task with the collection it came from"""
+    for doc in query.stream():
+        task_data = doc.to_dict()
+        task_data['collection'] = collection_name
+        yield task_data
+
+def _in_pick_order(tasks: List[Task], picks: List[Tuple[int, str]]) -> List[Task]:
+    """Order claimed tasks the way the fair scheduler interleaved their users"""
+    
+    by_pick: Dict[Tuple[int, str], List[Task]] = {}
+    for task in tasks:
+        by_pick.setdefault((task.priority.value, task.user_id), []).append(task)
+    
+    ordered = []
+    for pick in picks:
+        if by_pick.get(pick):
+            ordered.append(by_pick[pick].pop(0))
+    return ordered
@@ -4,22 +4,21 @@ Each processor handles a specific type of task from the queue
 """
 
 import json
-import tempfile
-import os
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import BinaryIO, Dict, Any, Optional, Type
 from urllib.parse import urlparse
 import logging
 
 from firebase_admin import storage, firestore
-from .task_manager import Task, TaskType, TaskQueue
+from ..parser.functions.blob_io import open_blob
+from .task_manager import BaseTaskQueue, Task, TaskType
 
 logger = logging.getLogger(__name__)
 
 class BaseTaskProcessor:
     """Base class for all task processors"""
     
-    def __init__(self, db: firestore.Client, task_queue: TaskQueue):
+    def __init__(self, db: firestore.Client, task_queue: BaseTaskQueue):
         self.db = db
         self.task_queue = task_queue
         self.bucket = storage.bucket()
@@ -35,6 +34,20 @@ class BaseTaskProcessor:
 class DocumentProcessingProcessor(BaseTaskProcessor):
     """Processor for document processing tasks"""
     
+    # Processes for page-parallel PDF text extraction, and the time any one page may take.
+    # Workers already run this processor on a process pool, so extraction is serial by default.
+    PAGE_WORKERS = 0
+    PAGE_TIMEOUT_SECONDS = 30.0
+    
+    # Images and PDF pages without a text layer are OCRed on a pool of this many processes,
+    # kept for the processor's lifetime; 0 runs OCR in this process. Each TaskWorker pool
+    # process has its own processor, so a worker runs up to process_pool_size times this many.
+    OCR_MAX_WORKERS = 2
+    OCR_PAGE_TIMEOUT_SECONDS = 60.0
+    OCR_TARGET_DPI = 300
+    
+    _ocr_engine = None
+    
     def validate_payload(self, payload: Dict[str, Any]) -> bool:
         required_fields = ['document_id', 'document_url', 'document_type']
         return all(field in payload for field in required_fields)
@@ -48,7 +61,6 @@ class DocumentProcessingProcessor(BaseTaskProcessor):
         document_id = task.payload['document_id']
         document_url = task.payload['document_url']
         document_type = task.payload['document_type']
-        document_name = task.payload.get('document_name', 'unknown')
         
         logger.info(f"Processing document {document_id} of type {document_type}")
         
@@ -57,23 +69,18 @@ class DocumentProcessingProcessor(BaseTaskProcessor):
             blob_path = self._get_blob_path(document_url)
             blob = self.bucket.blob(blob_path)
             
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(document_name)[1]) as temp_file:
-                blob.download_to_filename(temp_file.name)
-                
-                # Process based on document type
-                metadata = {}
-                extracted_text = ""
-                
-                if document_type == 'application/pdf':
-                    metadata, extracted_text = self._process_pdf(temp_file.name)
-                elif document_type.startswith('image/'):
-                    metadata, extracted_text = self._process_image(temp_file.name)
-                else:
-                    logger.warning(f"Unsupported document type: {document_type}")
-                
-                # Clean up temp file
-                os.unlink(temp_file.name)
+            # Process based on document type
+            metadata = {}
+            extracted_text = ""
+            
+            if document_type == 'application/pdf':
+                with open_blob(blob) as stream:
+                    metadata, extracted_text = self._process_pdf(stream)
+            elif document_type.startswith('image/'):
+                with open_blob(blob) as stream:
+                    metadata, extracted_text = self._process_image(stream)
+            else:
+                logger.warning(f"Unsupported document type: {document_type}")
             
             # Update document in Firestore
             doc_ref = self.db.collection('taxDocuments').document(document_id)
@@ -126,36 +133,35 @@ class DocumentProcessingProcessor(BaseTaskProcessor):
             path = parsed_url.path.lstrip('/')
             return '/'.join(path.split('/')[1:])  # Skip bucket name
     
-    def _process_pdf(self, file_path: str) -> tuple[Dict[str, Any], str]:
+    def _process_pdf(self, stream: BinaryIO) -> tuple[Dict[str, Any], str]:
         """Process PDF document"""
         try:
             import PyPDF2
+            from ..parser.functions.pdf_text import extract_pages
             
             metadata = {}
-            extracted_text = ""
             
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                # Extract metadata
-                if pdf_reader.metadata:
-                    metadata.update({
-                        'title': pdf_reader.metadata.get('/Title', ''),
-                        'author': pdf_reader.metadata.get('/Author', ''),
-                        'creator': pdf_reader.metadata.get('/Creator', ''),
-                        'producer': pdf_reader.metadata.get('/Producer', ''),
-                        'creation_date': str(pdf_reader.metadata.get('/CreationDate', '')),
-                    })
-                
-                metadata['page_count'] = len(pdf_reader.pages)
-                
-                # Extract text from all pages
-                for page_num, page in enumerate(pdf_reader.pages):
-                    try:
-                        page_text = page.extract_text()
-                        extracted_text += f"\n--- Page {page_num + 1} ---\n{page_text}"
-                    except Exception as e:
-                        logger.warning(f"Error extracting text from page {page_num + 1}: {e}")
+            pdf_reader = PyPDF2.PdfReader(stream)
+            
+            # Extract metadata
+            if pdf_reader.metadata:
+                metadata.update({
+                    'title': pdf_reader.metadata.get('/Title', ''),
+                    'author': pdf_reader.metadata.get('/Author', ''),
+                    'creator': pdf_reader.metadata.get('/Creator', ''),
+                    'producer': pdf_reader.metadata.get('/Producer', ''),
+                    'creation_date': str(pdf_reader.metadata.get('/CreationDate', '')),
+                })
+            
+            metadata['page_count'] = len(pdf_reader.pages)
+            
+            # Extract text from all pages; failed pages are recorded rather than failing the document.
+            # The reader is passed on so the document is parsed once.
+            pages = extract_pages(stream, self.PAGE_WORKERS, self.PAGE_TIMEOUT_SECONDS, reader=pdf_reader)
+            pages = self._ocr_scanned_pages(stream, pages, metadata)
+            metadata['pages'] = [page.stats() for page in pages]
+            metadata['failed_pages'] = [page.number for page in pages if page.error]
+            extracted_text = "\n".join(f"--- Page {page.number} ---\n{page.text}" for page in pages)
             
             return metadata, extracted_text.strip()
             
@@ -163,14 +169,39 @@ class DocumentProcessingProcessor(BaseTaskProcessor):
             logger.error(f"Error processing PDF: {e}")
             return {}, ""
     
-    def _process_image(self, file_path: str) -> tuple[Dict[str, Any], str]:
+    def _get_ocr_engine(self):
+        """OCR engine shared by every document this processor handles, started on first use"""
+        if self._ocr_engine is None:
+            from .ocr_engine import OcrConfig, OcrEngine
+            self._ocr_engine = OcrEngine(OcrConfig(
+                max_workers=self.OCR_MAX_WORKERS,
+                page_timeout_seconds=self.OCR_PAGE_TIMEOUT_SECONDS,
+                target_dpi=self.OCR_TARGET_DPI
+            ))
+        return self._ocr_engine
+    
+    def _ocr_scanned_pages(self, stream: BinaryIO, pages: list, metadata: Dict[str, Any]) -> list:
+        """Pages with their text layer missing replaced by the OCR of their rasterised image"""
+        scanned = [page.number for page in pages if not page.text.strip() and not page.error]
+        if not scanned:
+            return pages
+        
+        try:
+            recognised = {page.number: page for page in self._get_ocr_engine().recognize_pdf(stream, scanned)}
+        except ImportError as e:
+            logger.warning(f"Cannot OCR scanned pages {scanned}, rasterising needs pdf2image: {e}")
+            return pages
+        
+        metadata['ocr_pages'] = scanned
+        return [recognised.get(page.number, page) for page in pages]
+    
+    def _process_image(self, stream: BinaryIO) -> tuple[Dict[str, Any], str]:
         """Process image document using OCR"""
         try:
-            import pytesseract
             from PIL import Image
             
-            # Open image
-            image = Image.open(file_path)
+            # Open image; only the header is read here, the OCR workers decode it
+            image = Image.open(stream)
             
             # Extract metadata
             metadata = {
@@ -181,10 +212,14 @@ class DocumentProcessingProcessor(BaseTaskProcessor):
                 'height': image.height
             }
             
-            # Perform OCR
-            extracted_text = pytesseract.image_to_string(image)
+            # Perform OCR on the pool, preprocessed (grayscale, downscaled, deskewed) by the worker
+            stream.seek(0)
+            page = self._get_ocr_engine().recognize_image(stream.read())
+            metadata['ocr_seconds'] = page.seconds
+            if page.error:
+                metadata['ocr_error'] = page.error
             
-            return metadata, extracted_text.strip()
+            return metadata, page.text
             
         except Exception as e:
             logger.error(f"Error processing image: {e}")
@@ -423,4 +458,19 @@ class NotificationProcessor(BaseTaskProcessor):
         notification_ref.set(notification_data)
         
         logger.info(f"In-app notification created for {recipient}")
-        return {'notification_id': notification_ref.id, 'status': 'created'}
\ No newline at end of file
+        return {'notification_id': notification_ref.id, 'status': 'created'}
+
+# Processor class responsible for each task type
+PROCESSOR_REGISTRY: Dict[TaskType, Type[BaseTaskProcessor]] = {
+    TaskType.DOCUMENT_PROCESSING: DocumentProcessingProcessor,
+    TaskType.FORM_GENERATION: FormGenerationProcessor,
+    TaskType.AI_ANALYSIS: AIAnalysisProcessor,
+    TaskType.NOTIFICATION: NotificationProcessor,
+}
+
+def get_processor_class(task_type: TaskType) -> Type[BaseTaskProcessor]:
+    """Look up the processor class registered for a task type"""
+    try:
+        return PROCESSOR_REGISTRY[task_type]
+    except KeyError:
+        raise ValueError(f"No processor registered for task type: {task_type.value}")
@@ -0,0 +1,333 @@
+"""
+Shared fixtures for the task queue tests.
+
+TaskQueue leans on Firestore transactions, batched writes and ordered queries,
+which a MagicMock cannot model faithfully. FakeFirestore is a small in-memory
+stand-in that implements just the client surface the queue uses, so the tests
+exercise real claim/complete/fail semantics without Firebase credentials.
+"""
+
+import copy
+import itertools
+import os
+import sys
+
+import pytest
+from google.cloud.firestore_v1.transforms import Increment
+
+# Repo root on sys.path so the queue is importable as ``backend.queue``
+# (a bare ``queue`` import would resolve to the standard library module).
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../.."))
+
+
+# ---------------------------------------------------------------------------
+# Field helpers
+# ---------------------------------------------------------------------------
+
+_MISSING = object()
+
+
+def _get_field(data, path):
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return _MISSING
+        data = data[part]
+    return data
+
+
+def _set_field(data, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    current = data.get(parts[-1], 0)
+    if isinstance(value, Increment):
+        value = (current or 0) + value.value
+    data[parts[-1]] = value
+
+
+def _merge(target, updates, prefix=""):
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        elif isinstance(value, dict):
+            target[key] = {}
+            _merge(target[key], value)
+        else:
+            _set_field(target, key, value)
+
+
+def _strip_transforms(data):
+    clean = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            clean[key] = _strip_transforms(value)
+        elif isinstance(value, Increment):
+            clean[key] = value.value
+        else:
+            clean[key] = copy.deepcopy(value)
+    return clean
+
+
+# ---------------------------------------------------------------------------
+# Fake client
+# ---------------------------------------------------------------------------
+
+class FakeSnapshot:
+
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocumentReference:
+
+    def __init__(self, db, collection, doc_id):
+        self._db = db
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def _store(self):
+        return self._db.data.setdefault(self._collection, {})
+
+    def get(self, transaction=None):
+        self._db.reads += 1
+        return FakeSnapshot(self, self._store.get(self.id))
+
+    def set(self, data, merge=False):
+        self._db.writes += 1
+        if merge and self.id in self._store:
+            _merge(self._store[self.id], data)
+        else:
+            self._store[self.id] = _strip_transforms(data)
+
+    def update(self, data):
+        self._db.writes += 1
+        if self.id not in self._store:
+            raise KeyError(f"No document to update: {self._collection}/{self.id}")
+        for key, value in data.items():
+            _set_field(self._store[self.id], key, copy.deepcopy(value))
+
+    def delete(self):
+        self._db.writes += 1
+        self._store.pop(self.id, None)
+
+
+class FakeQuery:
+
+    _OPS = {
+        "==": lambda a, b: a == b,
+        "!=": lambda a, b: a != b,
+        "<": lambda a, b: a < b,
+        "<=": lambda a, b: a <= b,
+        ">": lambda a, b: a > b,
+        ">=": lambda a, b: a >= b,
+        "in": lambda a, b: a in b,
+        "not-in": lambda a, b: a not in b,
+        "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    }
+
+    def __init__(self, db, collection, filters=(), orders=(), limit_to=None, cursor=None):
+        self._db = db
+        self._collection = collection
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit_to
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = dict(
+            filters=self._filters, orders=self._orders,
+            limit_to=self._limit, cursor=self._cursor,
+        )
+        state.update(changes)
+        return FakeQuery(self._db, self._collection, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(orders=self._orders + [(field, direction)])
+
+    def limit(self, count):
+        return self._copy(limit_to=count)
+
+    def start_after(self, values):
+        return self._copy(cursor=values)
+
+    def select(self, field_paths):
+        # Projection only trims the returned fields; the fake returns whole documents
+        return self._copy()
+
+    def document(self, doc_id=None):
+        doc_id = doc_id or f"auto_{next(self._db.ids)}"
+        return FakeDocumentReference(self._db, self._collection, doc_id)
+
+    def _sort_key(self, item):
+        return [_get_field(item[1], field) for field, _ in self._orders]
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            current = _get_field(data, field)
+            if current is _MISSING or current is None and op not in ("==", "!="):
+                return False
+            if not self._OPS[op](current, value):
+                return False
+        for field, _ in self._orders:
+            if _get_field(data, field) is _MISSING:
+                return False
+        return True
+
+    def stream(self, transaction=None):
+        store = self._db.data.get(self._collection, {})
+        items = [(doc_id, data) for doc_id, data in store.items() if self._matches(data)]
+        for field, direction in reversed(self._orders):
+            items.sort(
+                key=lambda item: _get_field(item[1], field),
+                reverse=direction == "DESCENDING",
+            )
+        if self._cursor is not None:
+            items = self._after_cursor(items)
+        if self._limit is not None:
+            items = items[: self._limit]
+        self._db.reads += max(len(items), 1)
+        return iter([
+            FakeSnapshot(FakeDocumentReference(self._db, self._collection, doc_id), copy.deepcopy(data))
+            for doc_id, data in items
+        ])
+
+    def _after_cursor(self, items):
+        cursor = self._cursor
+        if isinstance(cursor, dict):
+            cursor = [cursor[field] for field, _ in self._orders]
+        for index, (_, data) in enumerate(items):
+            key = [_get_field(data, field) for field, _ in self._orders]
+            if self._is_after(key, list(cursor)):
+                return items[index:]
+        return []
+
+    def _is_after(self, key, cursor):
+        for value, bound, (_, direction) in zip(key, cursor, self._orders):
+            if value == bound:
+                continue
+            return value < bound if direction == "DESCENDING" else value > bound
+        return False
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback):
+        # Listeners are only recorded; tests invoke the callback with the changes they need
+        self._db.listeners.append(callback)
+        return FakeWatch(self._db, callback)
+
+
+class FakeWatch:
+
+    def __init__(self, db, callback):
+        self._db = db
+        self._callback = callback
+
+    def unsubscribe(self):
+        self._db.listeners.remove(self._callback)
+
+
+class FakeWriteBatch:
+
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(("set", reference, copy.deepcopy(data), merge))
+
+    def update(self, reference, data):
+        self._ops.append(("update", reference, copy.deepcopy(data), False))
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference, None, False))
+
+    def __len__(self):
+        return len(self._ops)
+
+    def commit(self):
+        self._db.commits += 1
+        for op, reference, data, merge in self._ops:
+            if op == "set":
+                reference.set(data, merge=merge)
+            elif op == "update":
+                reference.update(data)
+            else:
+                reference.delete()
+        self._ops = []
+
+
+class FakeTransaction(FakeWriteBatch):
+    """Buffers writes and applies them on commit, like a Firestore transaction.
+
+    Implements the private hooks ``firestore.transactional`` drives so the
+    real decorator can be used unchanged.
+    """
+
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, db):
+        super().__init__(db)
+        self._id = None
+
+    def _clean_up(self):
+        self._ops = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = next(self._db.ids)
+
+    def _commit(self):
+        self.commit()
+        self._clean_up()
+
+    def _rollback(self):
+        self._clean_up()
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, FakeDocumentReference):
+            return iter([ref_or_query.get()])
+        return ref_or_query.stream(transaction=self)
+
+
+class FakeFirestore:
+
+    def __init__(self):
+        self.data = {}
+        self.ids = itertools.count(1)
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+        self.listeners = []
+
+    def collection(self, name):
+        return FakeQuery(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def get_all(self, references, transaction=None):
+        for reference in references:
+            yield reference.get()
+
+
+@pytest.fixture
+def fake_db():
+    return FakeFirestore()
@@ -0,0 +1,67 @@
+"""
+Tests for fair_scheduler.py — deficit round-robin allocation and wait-time tracking.
+"""
+
+import pytest
+
+from backend.queue.fair_scheduler import FairScheduler, WaitTimeTracker
+
+
+class TestAllocate:
+
+    def test_round_robin_within_band(self):
+        scheduler = FairScheduler()
+
+        picks = scheduler.allocate({2: {"a": 100, "b": 1, "c": 2}}, 5)
+
+        assert picks == [(2, "a"), (2, "b"), (2, "c"), (2, "a"), (2, "c")]
+
+    def test_higher_band_served_first(self):
+        scheduler = FairScheduler()
+
+        picks = scheduler.allocate({1: {"a": 5}, 4: {"b": 1}}, 3)
+
+        assert picks == [(4, "b"), (1, "a"), (1, "a")]
+
+    def test_weights_scale_share(self):
+        scheduler = FairScheduler(user_weights={"a": 2.0})
+
+        picks = scheduler.allocate({2: {"a": 10, "b": 10}}, 6)
+
+        assert [user for _, user in picks].count("a") == 4
+
+    def test_fractional_weight_accumulates_deficit(self):
+        scheduler = FairScheduler(user_weights={"slow": 0.5})
+
+        picks = scheduler.allocate({2: {"slow": 10, "fast": 10}}, 6)
+
+        assert [user for _, user in picks].count("slow") == 2
+
+    def test_caps_count_existing_in_flight_tasks(self):
+        scheduler = FairScheduler(max_in_flight_per_user=3, user_in_flight_caps={"vip": 10})
+
+        picks = scheduler.allocate({2: {"a": 10, "vip": 10}}, 8, in_flight={"a": 2})
+
+        assert [user for _, user in picks].count("a") == 1
+        assert len(picks) == 8
+
+    def test_everyone_capped_returns_nothing(self):
+        scheduler = FairScheduler(max_in_flight_per_user=1)
+
+        assert scheduler.allocate({2: {"a": 5}}, 3, in_flight={"a": 1}) == []
+
+    def test_rejects_non_positive_weights(self):
+        with pytest.raises(ValueError):
+            FairScheduler(user_weights={"a": 0})
+
+
+def test_wait_time_percentiles():
+    tracker = WaitTimeTracker(max_samples_per_user=100)
+    for seconds in range(1, 101):
+        tracker.record("a", float(seconds))
+    tracker.record("b", -0.5)
+
+    report = tracker.percentiles((50, 90, 99))
+
+    assert report["a"] == {"count": 100, "p50": 50.0, "p90": 90.0, "p99": 99.0}
+    assert report["b"]["p50"] == 0.0
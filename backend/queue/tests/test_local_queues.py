@@ -0,0 +1,335 @@
+"""
+Tests for the local queue backends — memory_queue.py and sqlite_queue.py.
+
+Every test runs against both backends to check they share the Firestore
+TaskQueue's enqueue/claim/complete/fail semantics. The ``clock`` fixture
+freezes ``datetime.now`` so backoff and leases can be stepped through.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.queue import memory_queue, sqlite_queue, task_manager
+from backend.queue.memory_queue import InMemoryTaskQueue
+from backend.queue.rate_limit import RateLimit, RateLimiter
+from backend.queue.sqlite_queue import SQLiteTaskQueue
+from backend.queue.task_manager import TaskPriority, TaskStatus, TaskType
+
+
+class Clock:
+    def __init__(self):
+        self.now = datetime(2025, 3, 1, 9, 0, 0)
+
+    def advance(self, **kwargs):
+        self.now += timedelta(**kwargs)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return clock.now
+
+    for module in (task_manager, memory_queue, sqlite_queue):
+        monkeypatch.setattr(module, "datetime", FrozenDatetime)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def local_queue(request, tmp_path, clock):
+    if request.param == "memory":
+        yield InMemoryTaskQueue(worker_id="worker-a")
+    else:
+        task_queue = SQLiteTaskQueue(str(tmp_path / "queue.db"), worker_id="worker-a")
+        yield task_queue
+        task_queue.close()
+
+
+def enqueue(task_queue, **kwargs):
+    kwargs.setdefault("task_type", TaskType.DOCUMENT_PROCESSING)
+    kwargs.setdefault("user_id", "user_123")
+    kwargs.setdefault("payload", {"document_id": "doc_1"})
+    return task_queue.enqueue_task(**kwargs)
+
+
+class TestClaiming:
+
+    def test_priority_then_fifo_order(self, local_queue, clock):
+        first_low = enqueue(local_queue, priority=TaskPriority.LOW)
+        clock.advance(seconds=1)
+        second_low = enqueue(local_queue, priority=TaskPriority.LOW)
+        urgent = enqueue(local_queue, priority=TaskPriority.URGENT)
+
+        claimed = [task.id for task in local_queue.claim_batch(3)]
+
+        assert claimed == [urgent, first_low, second_low]
+
+    def test_claim_sets_lease(self, local_queue, clock):
+        enqueue(local_queue)
+
+        task = local_queue.get_next_task()
+
+        assert task.status == TaskStatus.IN_PROGRESS
+        assert task.worker_id == "worker-a"
+        assert task.lease_expires_at == clock.now + timedelta(seconds=120)
+        assert local_queue.get_next_task() is None
+
+    def test_task_types_filter(self, local_queue):
+        enqueue(local_queue, task_type=TaskType.NOTIFICATION)
+        doc_id = enqueue(local_queue)
+
+        assert [t.id for t in local_queue.claim_batch(5, [TaskType.DOCUMENT_PROCESSING])] == [doc_id]
+
+    def test_future_scheduled_task_waits(self, local_queue, clock):
+        task_id = enqueue(local_queue, scheduled_at=clock.now + timedelta(minutes=5))
+
+        assert local_queue.get_next_task() is None
+        clock.advance(minutes=5)
+        assert local_queue.get_next_task().id == task_id
+
+    def test_scheduled_task_is_promoted_when_due(self, local_queue, clock):
+        due_at = clock.now + timedelta(minutes=5)
+        task_id = enqueue(local_queue, scheduled_at=due_at)
+
+        assert local_queue.get_task_status(task_id)["status"] == TaskStatus.SCHEDULED.value
+        assert local_queue.next_due_at() == due_at
+        assert local_queue.promote_due_tasks() == 0
+
+        clock.advance(minutes=5)
+        assert local_queue.promote_due_tasks() == 1
+        assert local_queue.get_task_status(task_id)["status"] == TaskStatus.PENDING.value
+        assert local_queue.next_due_at() is None
+
+    def test_payload_round_trips(self, local_queue):
+        enqueue(local_queue, payload={"document_id": "doc_9", "pages": [1, 2]})
+
+        assert local_queue.get_next_task().payload == {"document_id": "doc_9", "pages": [1, 2]}
+
+
+class TestCompletionAndRetry:
+
+    def test_complete_batch(self, local_queue):
+        ids = [enqueue(local_queue) for _ in range(3)]
+        local_queue.claim_batch(3)
+
+        completed = local_queue.complete_batch({task_id: {"ok": True} for task_id in ids})
+
+        assert sorted(completed) == sorted(ids)
+        status = local_queue.get_task_status(ids[0])
+        assert status["status"] == TaskStatus.COMPLETED.value
+        assert status["result"] == {"ok": True}
+
+    def test_failed_task_retries_after_backoff(self, local_queue, clock):
+        task_id = enqueue(local_queue)
+        local_queue.get_next_task()
+
+        assert local_queue.fail_batch({task_id: "timeout"}) == {task_id: TaskStatus.RETRY}
+        assert local_queue.get_next_task() is None
+
+        clock.advance(minutes=2)
+        retried = local_queue.get_next_task()
+        assert retried.id == task_id
+        assert retried.retry_count == 1
+
+    def test_retries_exhausted_fail_permanently(self, local_queue):
+        task_id = enqueue(local_queue, max_retries=0)
+        local_queue.get_next_task()
+
+        local_queue.fail_task(task_id, "corrupt pdf")
+
+        assert local_queue.get_task_status(task_id)["status"] == TaskStatus.FAILED.value
+
+    def test_stale_worker_cannot_complete(self, local_queue):
+        task_id = enqueue(local_queue)
+        local_queue.get_next_task()
+
+        assert local_queue.complete_batch({task_id: None}, worker_id="worker-b") == []
+
+    def test_expired_lease_is_requeued(self, local_queue, clock):
+        task_id = enqueue(local_queue)
+        local_queue.get_next_task()
+        clock.advance(seconds=121)
+
+        assert local_queue.requeue_expired_leases() == 1
+        assert local_queue.get_next_task(worker_id="worker-b").id == task_id
+
+    def test_earlier_claim_by_the_same_worker_cannot_settle(self, local_queue, clock):
+        task_id = enqueue(local_queue)
+        first = local_queue.get_next_task(worker_id="w1")
+        clock.advance(seconds=121)
+        local_queue.requeue_expired_leases()
+        second = local_queue.get_next_task(worker_id="w1")
+
+        assert local_queue.renew_lease(task_id, worker_id="w1", lease_id=first.lease_id) is False
+        assert local_queue.complete_batch(
+            {task_id: None}, worker_id="w1", lease_ids={task_id: first.lease_id}
+        ) == []
+        assert local_queue.get_task_status(task_id)["status"] == TaskStatus.IN_PROGRESS.value
+        assert local_queue.complete_batch(
+            {task_id: None}, worker_id="w1", lease_ids={task_id: second.lease_id}
+        ) == [task_id]
+
+    def test_task_past_timeout_is_failed_with_retry(self, local_queue, clock):
+        task_id = enqueue(local_queue, timeout_seconds=60)
+        local_queue.get_next_task()
+        clock.advance(seconds=30)
+        local_queue.renew_lease(task_id)
+
+        assert local_queue.fail_timed_out_tasks() == 0
+
+        clock.advance(seconds=31)
+
+        assert local_queue.fail_timed_out_tasks() == 1
+        status = local_queue.get_task_status(task_id)
+        assert status["status"] == TaskStatus.RETRY.value
+        assert status["retry_count"] == 1
+        assert status["deadline_at"] is None
+
+
+class TestRateLimits:
+
+    def limiter(self, clock, **limits):
+        return RateLimiter(clock=lambda: clock.now.timestamp(), **limits)
+
+    def test_throttled_task_is_deferred_without_a_retry(self, local_queue, clock):
+        local_queue.rate_limiter = self.limiter(clock, user_limits={TaskType.AI_ANALYSIS: RateLimit.per_minute(1)})
+        first = enqueue(local_queue, task_type=TaskType.AI_ANALYSIS)
+        clock.advance(seconds=1)
+        second = enqueue(local_queue, task_type=TaskType.AI_ANALYSIS)
+
+        assert [task.id for task in local_queue.claim_batch(5)] == [first]
+
+        status = local_queue.get_task_status(second)
+        assert status["status"] == TaskStatus.SCHEDULED.value
+        assert status["retry_count"] == 0
+        assert status["worker_id"] is None
+
+        clock.advance(seconds=121)
+        assert local_queue.get_next_task().id == second
+
+    def test_claim_is_capped_to_type_tokens(self, local_queue, clock):
+        local_queue.rate_limiter = self.limiter(clock, type_limits={TaskType.AI_ANALYSIS: RateLimit(1, burst=2)})
+        ids = [enqueue(local_queue, task_type=TaskType.AI_ANALYSIS) for _ in range(3)]
+
+        assert len(local_queue.claim_batch(5, [TaskType.AI_ANALYSIS])) == 2
+        assert local_queue.get_task_status(ids[2])["status"] == TaskStatus.PENDING.value
+        assert local_queue.claim_batch(5, [TaskType.AI_ANALYSIS]) == []
+
+
+class TestQueries:
+
+    def test_cancel_only_pending(self, local_queue):
+        pending_id = enqueue(local_queue)
+        claimed_id = enqueue(local_queue, priority=TaskPriority.HIGH)
+        local_queue.get_next_task()
+
+        assert local_queue.cancel_task(claimed_id) is False
+        assert local_queue.cancel_task(pending_id) is True
+        assert local_queue.get_next_task() is None
+
+    def test_cancel_scheduled_task(self, local_queue, clock):
+        task_id = enqueue(local_queue, scheduled_at=clock.now + timedelta(minutes=5))
+
+        assert local_queue.cancel_task(task_id) is True
+        clock.advance(minutes=5)
+        assert local_queue.get_next_task() is None
+
+    def test_dependencies_fan_in(self, local_queue):
+        parses = [enqueue(local_queue, payload={"document_id": f"doc_{i}"}) for i in range(3)]
+        analysis = enqueue(local_queue, task_type=TaskType.AI_ANALYSIS, depends_on=parses)
+        assert local_queue.get_task_status(analysis)["status"] == TaskStatus.BLOCKED.value
+        assert local_queue.get_queue_stats()["blocked"] == 1
+
+        claimed = local_queue.claim_batch(5)
+        assert sorted(task.id for task in claimed) == sorted(parses)
+        local_queue.complete_batch({task_id: {"parsed": task_id} for task_id in parses[:2]})
+        assert local_queue.get_next_task() is None
+
+        local_queue.complete_task(parses[2], {"parsed": parses[2]})
+        task = local_queue.get_next_task()
+        assert task.id == analysis
+        assert task.payload["parent_results"] == {task_id: {"parsed": task_id} for task_id in parses}
+
+    def test_cancelled_parent_fails_descendants(self, local_queue):
+        parent = enqueue(local_queue)
+        child = enqueue(local_queue, depends_on=[parent])
+        grandchild = enqueue(local_queue, depends_on=[child])
+
+        assert local_queue.cancel_task(parent) is True
+
+        for task_id in (child, grandchild):
+            assert local_queue.get_task_status(task_id)["status"] == TaskStatus.FAILED.value
+        with pytest.raises(ValueError):
+            enqueue(local_queue, depends_on=[parent])
+
+    def test_dedupe_key_collapses_unfinished_duplicates(self, local_queue):
+        task_id = enqueue(local_queue, dedupe_key="doc_1:abc123")
+        assert enqueue(local_queue, dedupe_key="doc_1:abc123") == task_id
+
+        local_queue.get_next_task()
+        assert enqueue(local_queue, dedupe_key="doc_1:abc123") == task_id
+
+        local_queue.complete_task(task_id)
+        assert enqueue(local_queue, dedupe_key="doc_1:abc123") != task_id
+
+    def test_deduplicated_enqueue_records_no_dependencies(self, tmp_path, clock):
+        task_queue = SQLiteTaskQueue(str(tmp_path / "queue.db"), worker_id="worker-a")
+        parent = enqueue(task_queue)
+        child = enqueue(task_queue, dedupe_key="doc_1:abc123", depends_on=[parent])
+
+        assert enqueue(task_queue, dedupe_key="doc_1:abc123", depends_on=[parent]) == child
+
+        edges = task_queue._conn.execute("SELECT parent_id, task_id FROM task_dependencies").fetchall()
+        assert [tuple(edge) for edge in edges] == [(parent, child)]
+        task_queue.close()
+
+    def test_user_tasks_newest_first(self, local_queue, clock):
+        older = enqueue(local_queue)
+        clock.advance(seconds=1)
+        newer = enqueue(local_queue)
+        enqueue(local_queue, user_id="someone_else")
+
+        tasks = local_queue.get_user_tasks("user_123")
+
+        assert [t["id"] for t in tasks] == [newer, older]
+
+    def test_user_task_pages(self, local_queue, clock):
+        ids = []
+        for _ in range(5):
+            ids.append(enqueue(local_queue))
+            clock.advance(seconds=1)
+
+        first = local_queue.get_user_tasks_page("user_123", limit=3)
+        second = local_queue.get_user_tasks_page("user_123", limit=3, cursor=first["next_cursor"])
+
+        assert [t["id"] for t in first["tasks"]] == ids[:1:-1]
+        assert [t["id"] for t in second["tasks"]] == ids[1::-1]
+        assert second["next_cursor"] is None
+
+    def test_queue_stats(self, local_queue):
+        enqueue(local_queue, task_type=TaskType.NOTIFICATION, priority=TaskPriority.HIGH)
+        done_id = enqueue(local_queue, priority=TaskPriority.URGENT)
+        local_queue.get_next_task()
+        local_queue.complete_task(done_id)
+
+        stats = local_queue.get_queue_stats()
+
+        assert stats["pending"] == 1
+        assert stats["by_type"] == {"notification": 1}
+        assert stats["by_priority"] == {"3": 1}
+        assert stats["completed_today"] == 1
+        assert stats["delayed"] == 0
+
+    def test_cleanup_removes_old_finished_tasks(self, local_queue, clock):
+        task_id = enqueue(local_queue)
+        local_queue.get_next_task()
+        local_queue.complete_task(task_id)
+        clock.advance(days=31)
+
+        local_queue.cleanup_old_tasks(days_old=30)
+
+        assert local_queue.get_task_status(task_id) is None
@@ -0,0 +1,81 @@
+"""
+Tests for notifier.py — worker wake-ups from the queue.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from backend.queue.memory_queue import InMemoryTaskQueue
+from backend.queue.notifier import FirestoreTaskNotifier, SQLiteTaskNotifier, TaskNotifier
+from backend.queue.sqlite_queue import SQLiteTaskQueue
+from backend.queue.task_manager import TaskType
+
+
+def enqueue(task_queue, **kwargs):
+    return task_queue.enqueue_task(TaskType.NOTIFICATION, "user_123", {"message": "hi"}, **kwargs)
+
+
+def change(name):
+    return SimpleNamespace(type=SimpleNamespace(name=name))
+
+
+def test_wait_times_out_without_notification():
+    notifier = TaskNotifier()
+
+    assert notifier.wait(0.01) is False
+    notifier.notify()
+    assert notifier.wait(0.01) is True
+    assert notifier.wait(0.01) is False
+
+
+def test_notify_wakes_a_blocked_waiter():
+    notifier = TaskNotifier()
+    woke = []
+    waiter = threading.Thread(target=lambda: woke.append(notifier.wait(5)))
+    waiter.start()
+
+    notifier.notify()
+    waiter.join(timeout=5)
+
+    assert woke == [True]
+
+
+def test_local_queue_notifies_on_ready_work_only():
+    task_queue = InMemoryTaskQueue()
+    task_queue.notifier.wait(0)
+
+    enqueue(task_queue, scheduled_at=datetime.now() + timedelta(hours=1))
+    assert task_queue.notifier.wait(0) is False
+
+    enqueue(task_queue)
+    assert task_queue.notifier.wait(0) is True
+
+
+def test_firestore_listener_notifies_on_added_pending_tasks(fake_db):
+    notifier = FirestoreTaskNotifier(fake_db)
+    [listener] = fake_db.listeners
+
+    listener([], [change("REMOVED")], None)
+    assert notifier.wait(0) is False
+
+    listener([], [change("REMOVED"), change("ADDED")], None)
+    assert notifier.wait(0) is True
+
+    notifier.close()
+    assert fake_db.listeners == []
+
+
+def test_sqlite_notifier_sees_commits_from_other_connections(tmp_path):
+    path = str(tmp_path / "queue.db")
+    producer = SQLiteTaskQueue(path)
+    notifier = SQLiteTaskNotifier(path, check_interval_seconds=0.01)
+    try:
+        assert notifier.wait(0.05) is False
+
+        enqueue(producer)
+
+        assert notifier.wait(5) is True
+    finally:
+        notifier.close()
+        producer.close()
@@ -0,0 +1,124 @@
+"""
+Tests for ocr_engine.py — preprocessing and the OCR worker pool.
+
+Tesseract is not needed: the engine takes its recognizer as a module-level
+function, and the ones here describe the image they were given.
+"""
+
+import io
+import time
+
+import pytest
+from PIL import Image, ImageDraw
+
+from backend.queue import ocr_engine
+from backend.queue.ocr_engine import OcrConfig, OcrEngine, estimate_skew, preprocess
+
+
+def describe_image(image, timeout, language):
+    return f"{image.mode} {image.width}x{image.height} {language}"
+
+
+def hang_on_narrow_images(image, timeout, language):
+    if image.width < 50:
+        time.sleep(60)
+    return "done"
+
+
+def make_page(width=850, height=1100, lines=30):
+    """A white page with dark bars where lines of text would be"""
+    page = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(page)
+    margin = width // 10
+    for line in range(lines):
+        top = 60 + line * (height - 120) // lines
+        draw.rectangle([margin, top, width - margin, top + 12], fill="black")
+    return page
+
+
+def png_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_preprocess_converts_to_grayscale_at_the_target_dpi():
+    page = make_page(2400, 3000)
+    page.info["dpi"] = (600, 600)
+
+    prepared = preprocess(page, target_dpi=300, deskew=False)
+
+    assert prepared.mode == "L"
+    assert prepared.size == (1200, 1500)
+
+
+def test_preprocess_bounds_images_without_a_dpi_as_a_page():
+    prepared = preprocess(make_page(3000, 6000), target_dpi=300, deskew=False)
+
+    assert max(prepared.size) == 3300
+
+
+def test_preprocess_never_upscales():
+    assert preprocess(make_page(400, 500), target_dpi=300, deskew=False).size == (400, 500)
+
+
+def test_estimate_skew_finds_the_correcting_rotation():
+    skewed = make_page().convert("L").rotate(3, expand=True, fillcolor=255)
+
+    assert estimate_skew(skewed) == pytest.approx(-3, abs=0.5)
+
+
+def test_level_pages_are_not_rotated():
+    page = make_page().convert("L")
+
+    assert estimate_skew(page) == 0
+    assert preprocess(page).size == page.size
+
+
+def test_inline_engine_recognises_encoded_images():
+    engine = OcrEngine(OcrConfig(max_workers=0, language="deu"), recognizer=describe_image)
+
+    page = engine.recognize_image(png_bytes(make_page()))
+
+    assert page.text == "L 850x1100 deu"
+    assert page.error is None
+
+
+def test_unreadable_image_is_reported_as_a_page_error():
+    engine = OcrEngine(OcrConfig(max_workers=0), recognizer=describe_image)
+
+    page = engine.recognize_image(b"not an image")
+
+    assert page.text == ""
+    assert page.error
+
+
+def test_pool_recognises_pages_in_order_and_is_kept_between_documents():
+    with OcrEngine(OcrConfig(max_workers=2), recognizer=describe_image) as engine:
+        pages = engine.recognize_pages((number, make_page(100 + number, 200)) for number in range(1, 6))
+        pool = engine._pool
+        engine.recognize_image(make_page(100, 100))
+
+        assert [page.number for page in pages] == [1, 2, 3, 4, 5]
+        assert [page.text for page in pages] == [f"L {100 + number}x200 eng" for number in range(1, 6)]
+        assert engine._pool is pool
+
+
+def test_stuck_page_fails_alone_and_the_pool_is_replaced(monkeypatch):
+    monkeypatch.setattr(ocr_engine, "WORKER_GRACE_SECONDS", 5.0)
+    config = OcrConfig(max_workers=2, page_timeout_seconds=0.5, deskew=False)
+
+    with OcrEngine(config, recognizer=hang_on_narrow_images) as engine:
+        pages = engine.recognize_pages([(1, make_page(40, 40)), (2, make_page(100, 100)), (3, make_page(100, 100))])
+
+        assert pages[0].error == "OCR worker did not finish"
+        assert [page.text for page in pages[1:]] == ["done", "done"]
+
+
+def test_rasterising_errors_are_reported_per_page():
+    engine = OcrEngine(OcrConfig(max_workers=0), recognizer=describe_image)
+
+    pages = engine.recognize_pages([(1, make_page()), (2, "rasterising failed: bad page")])
+
+    assert pages[0].error is None
+    assert pages[1].error == "rasterising failed: bad page"
@@ -0,0 +1,95 @@
+"""
+Tests for rate_limit.py — token buckets per task type and per user.
+"""
+
+import pytest
+
+from backend.queue.rate_limit import RateLimit, RateLimiter
+from backend.queue.task_manager import TaskType
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+AI = TaskType.AI_ANALYSIS
+
+
+def test_type_bucket_allows_burst_then_refills():
+    clock = Clock()
+    limiter = RateLimiter(type_limits={AI: RateLimit(1, burst=2)}, clock=clock)
+
+    assert limiter.acquire(AI, "user_a") == 0
+    assert limiter.acquire(AI, "user_b") == 0
+    assert 1 <= limiter.acquire(AI, "user_a") <= 2
+    assert limiter.available(AI) == 0
+
+    clock.now += 1
+    assert limiter.acquire(AI, "user_a") == 0
+
+
+def test_user_buckets_are_independent():
+    clock = Clock()
+    limiter = RateLimiter(user_limits={AI: RateLimit.per_minute(6)}, clock=clock)
+
+    assert limiter.acquire(AI, "user_a") == 0
+    assert 10 <= limiter.acquire(AI, "user_a") <= 20
+    assert limiter.acquire(AI, "user_b") == 0
+
+
+def test_denied_task_takes_no_tokens():
+    clock = Clock()
+    limiter = RateLimiter(
+        type_limits={AI: RateLimit(1, burst=2)},
+        user_limits={AI: RateLimit(1, burst=1)},
+        clock=clock,
+    )
+
+    assert limiter.acquire(AI, "user_a") == 0
+    assert limiter.acquire(AI, "user_a") > 0
+    # user_a's denied attempt left the type bucket's second token for user_b
+    assert limiter.acquire(AI, "user_b") == 0
+    assert limiter.acquire(AI, "user_c") > 0
+
+
+def test_unlimited_types():
+    limiter = RateLimiter(type_limits={AI: RateLimit(1)})
+
+    assert limiter.acquire(TaskType.BACKUP, "user_a") == 0
+    assert limiter.available(TaskType.BACKUP) is None
+    assert limiter.seconds_until_available(TaskType.BACKUP) == 0
+
+
+def test_seconds_until_available():
+    clock = Clock()
+    limiter = RateLimiter(type_limits={AI: RateLimit(0.5)}, clock=clock)
+
+    limiter.acquire(AI, "user_a")
+    assert limiter.seconds_until_available(AI) == pytest.approx(2)
+
+    clock.now += 1.5
+    assert limiter.seconds_until_available(AI) == pytest.approx(0.5)
+
+
+def test_idle_user_buckets_are_pruned():
+    clock = Clock()
+    limiter = RateLimiter(user_limits={AI: RateLimit(1)}, clock=clock)
+    limiter.max_user_buckets = 2
+
+    limiter.acquire(AI, "user_a")
+    limiter.acquire(AI, "user_b")
+    clock.now += 5
+    limiter.acquire(AI, "user_c")
+
+    assert len(limiter._user_buckets) == 1
+
+
+def test_invalid_limits_are_rejected():
+    with pytest.raises(ValueError):
+        RateLimit(0)
+    with pytest.raises(ValueError):
+        RateLimit(1, burst=0)
@@ -0,0 +1,59 @@
+"""
+Tests for scheduler.py — DelayedTaskScheduler.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from backend.queue.memory_queue import InMemoryTaskQueue
+from backend.queue.scheduler import DelayedTaskScheduler
+from backend.queue.task_manager import TaskStatus, TaskType
+
+
+def enqueue(task_queue, scheduled_at):
+    return task_queue.enqueue_task(
+        TaskType.NOTIFICATION, "user_123", {"message": "hi"}, scheduled_at=scheduled_at
+    )
+
+
+def test_run_once_promotes_all_due_tasks_in_batches():
+    task_queue = InMemoryTaskQueue()
+    due_at = datetime.now() + timedelta(milliseconds=20)
+    ids = [enqueue(task_queue, due_at) for _ in range(5)]
+    time.sleep(0.05)
+
+    scheduler = DelayedTaskScheduler(task_queue, batch_size=2)
+
+    assert scheduler.run_once() == 5
+    assert all(task_queue.get_task_status(i)["status"] == TaskStatus.PENDING.value for i in ids)
+
+
+def test_sleep_is_bounded_by_next_due_time():
+    task_queue = InMemoryTaskQueue()
+    scheduler = DelayedTaskScheduler(task_queue, max_sleep_seconds=30)
+
+    assert scheduler.seconds_until_next_due() == 30
+
+    enqueue(task_queue, datetime.now() + timedelta(seconds=5))
+    assert 0 < scheduler.seconds_until_next_due() <= 5
+
+    enqueue(task_queue, datetime.now() + timedelta(hours=1))
+    assert scheduler.seconds_until_next_due() <= 5
+
+
+def test_background_thread_promotes_due_task():
+    task_queue = InMemoryTaskQueue()
+    task_id = enqueue(task_queue, datetime.now() + timedelta(milliseconds=100))
+    scheduler = DelayedTaskScheduler(task_queue, max_sleep_seconds=1)
+
+    scheduler.start()
+    try:
+        deadline = datetime.now() + timedelta(seconds=3)
+        while datetime.now() < deadline:
+            if task_queue.get_task_status(task_id)["status"] == TaskStatus.PENDING.value:
+                break
+            time.sleep(0.02)
+    finally:
+        scheduler.stop(timeout=2)
+
+    assert task_queue.get_task_status(task_id)["status"] == TaskStatus.PENDING.value
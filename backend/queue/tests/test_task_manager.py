@@ -0,0 +1,800 @@
+"""
+Tests for task_manager.py — Firestore-backed TaskQueue.
+
+Firestore is replaced by the FakeFirestore fixture from conftest.py, so claims,
+leases and collection moves run against real (in-memory) state.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.queue.fair_scheduler import FairScheduler
+from backend.queue.rate_limit import RateLimit, RateLimiter
+from backend.queue.task_manager import Task, TaskPriority, TaskQueue, TaskStatus, TaskType
+
+
+@pytest.fixture
+def task_queue(fake_db):
+    return TaskQueue(fake_db, worker_id="worker-a")
+
+
+def enqueue(task_queue, **kwargs):
+    kwargs.setdefault("task_type", TaskType.DOCUMENT_PROCESSING)
+    kwargs.setdefault("user_id", "user_123")
+    kwargs.setdefault("payload", {"document_id": "doc_1"})
+    # Schedule slightly in the past so the task is immediately claimable
+    kwargs.setdefault("scheduled_at", datetime.now() - timedelta(seconds=1))
+    return task_queue.enqueue_task(**kwargs)
+
+
+def stored(fake_db, collection, task_id):
+    return fake_db.data.get(collection, {}).get(task_id)
+
+
+# ---------------------------------------------------------------------------
+# Lease-based claiming
+# ---------------------------------------------------------------------------
+
+class TestClaiming:
+
+    def test_claim_records_lease_and_worker(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+
+        task = task_queue.get_next_task()
+
+        assert task.id == task_id
+        assert task.status == TaskStatus.IN_PROGRESS
+        assert task.worker_id == "worker-a"
+        assert task.lease_expires_at > datetime.now()
+
+        processing = stored(fake_db, "task_processing", task_id)
+        assert processing["status"] == TaskStatus.IN_PROGRESS.value
+        assert processing["worker_id"] == "worker-a"
+        assert stored(fake_db, "task_queue", task_id)["status"] == TaskStatus.IN_PROGRESS.value
+
+    def test_claimed_task_is_not_handed_out_twice(self, task_queue, fake_db):
+        enqueue(task_queue)
+        other = TaskQueue(fake_db, worker_id="worker-b")
+
+        assert task_queue.get_next_task() is not None
+        assert other.get_next_task() is None
+
+    def test_highest_priority_claimed_first(self, task_queue):
+        enqueue(task_queue, priority=TaskPriority.LOW)
+        urgent_id = enqueue(task_queue, priority=TaskPriority.URGENT)
+
+        assert task_queue.get_next_task().id == urgent_id
+
+    def test_renew_lease_only_for_owner(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+        task_queue.get_next_task()
+
+        assert task_queue.renew_lease(task_id) is True
+        assert task_queue.renew_lease(task_id, worker_id="worker-b") is False
+
+
+# ---------------------------------------------------------------------------
+# Expired lease sweep
+# ---------------------------------------------------------------------------
+
+class TestExpiredLeases:
+
+    def expire(self, fake_db, task_id):
+        past = (datetime.now() - timedelta(seconds=5)).isoformat()
+        fake_db.data["task_processing"][task_id]["lease_expires_at"] = past
+
+    def test_expired_lease_returns_task_to_queue(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+        task_queue.get_next_task()
+        self.expire(fake_db, task_id)
+
+        assert task_queue.requeue_expired_leases() == 1
+
+        queued = stored(fake_db, "task_queue", task_id)
+        assert queued["status"] == TaskStatus.PENDING.value
+        assert queued["worker_id"] is None
+        assert queued["retry_count"] == 0
+        assert stored(fake_db, "task_processing", task_id) is None
+
+    def test_live_lease_is_left_alone(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+        task_queue.get_next_task()
+
+        assert task_queue.requeue_expired_leases() == 0
+        assert stored(fake_db, "task_processing", task_id) is not None
+
+    def test_sweep_runs_automatically_on_claim(self, fake_db):
+        task_queue = TaskQueue(fake_db, worker_id="worker-a", sweep_interval_seconds=0)
+        task_id = enqueue(task_queue)
+        task_queue.get_next_task()
+        self.expire(fake_db, task_id)
+
+        reclaimed = TaskQueue(fake_db, worker_id="worker-b", sweep_interval_seconds=0).get_next_task()
+
+        assert reclaimed.id == task_id
+        assert reclaimed.worker_id == "worker-b"
+
+    def test_stale_worker_cannot_complete_reclaimed_task(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+        task_queue.get_next_task()
+        self.expire(fake_db, task_id)
+        task_queue.requeue_expired_leases()
+        TaskQueue(fake_db, worker_id="worker-b").get_next_task()
+
+        task_queue.complete_task(task_id, {"ok": True}, worker_id="worker-a")
+
+        assert stored(fake_db, "task_completed", task_id) is None
+        assert stored(fake_db, "task_processing", task_id)["worker_id"] == "worker-b"
+
+    def test_earlier_claim_by_the_same_worker_cannot_settle(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+        first = task_queue.get_next_task()
+        self.expire(fake_db, task_id)
+        task_queue.requeue_expired_leases()
+        second = task_queue.get_next_task()
+
+        assert second.lease_id != first.lease_id
+        assert task_queue.renew_lease(task_id, lease_id=first.lease_id) is False
+        assert task_queue.complete_batch({task_id: {"ok": True}}, lease_ids={task_id: first.lease_id}) == []
+        assert task_queue.complete_batch({task_id: {"ok": True}}, lease_ids={task_id: second.lease_id}) == [task_id]
+
+    def test_lease_is_checked_in_the_transaction_that_settles_the_task(self, task_queue, fake_db, monkeypatch):
+        ids = [enqueue(task_queue) for _ in range(3)]
+        task_queue.claim_batch(3)
+        reads = []
+        get_all = fake_db.get_all
+
+        def recording_get_all(references, transaction=None):
+            reads.append(transaction)
+            return get_all(references, transaction=transaction)
+
+        monkeypatch.setattr(fake_db, "get_all", recording_get_all)
+        task_queue.complete_batch({ids[0]: None})
+        task_queue.fail_batch({ids[1]: "boom"})
+        task_queue.defer_batch({ids[2]: 30})
+
+        # A read outside the transaction could see a lease another worker takes before the write
+        assert len(reads) == 3
+        assert all(transaction is not None for transaction in reads)
+
+
+# ---------------------------------------------------------------------------
+# Rate-limited deferral
+# ---------------------------------------------------------------------------
+
+class TestRateLimits:
+
+    def test_throttled_task_returns_to_queue_as_scheduled(self, fake_db):
+        limiter = RateLimiter(user_limits={TaskType.AI_ANALYSIS: RateLimit.per_minute(1)})
+        task_queue = TaskQueue(fake_db, worker_id="worker-a", rate_limiter=limiter)
+        enqueue(task_queue, task_type=TaskType.AI_ANALYSIS)
+        enqueue(task_queue, task_type=TaskType.AI_ANALYSIS)
+
+        claimed = task_queue.claim_batch(5)
+
+        assert len(claimed) == 1
+        [deferred_id] = [task_id for task_id in fake_db.data["task_queue"] if task_id != claimed[0].id]
+        queued = stored(fake_db, "task_queue", deferred_id)
+        assert queued["status"] == TaskStatus.SCHEDULED.value
+        assert queued["retry_count"] == 0
+        assert datetime.fromisoformat(queued["scheduled_at"]) > datetime.now() + timedelta(seconds=50)
+        assert stored(fake_db, "task_processing", deferred_id) is None
+
+        stats = task_queue.get_queue_stats()
+        assert (stats["in_progress"], stats["delayed"]) == (1, 1)
+
+
+# ---------------------------------------------------------------------------
+# Timeout watchdog
+# ---------------------------------------------------------------------------
+
+class TestTimeouts:
+
+    def overrun(self, fake_db, task_id):
+        past = (datetime.now() - timedelta(seconds=5)).isoformat()
+        fake_db.data["task_processing"][task_id]["deadline_at"] = past
+
+    def test_claim_sets_deadline_from_timeout(self, task_queue, fake_db):
+        task_id = enqueue(task_queue, timeout_seconds=60)
+
+        task = task_queue.get_next_task()
+
+        assert task.deadline_at == task.started_at + timedelta(seconds=60)
+        assert stored(fake_db, "task_processing", task_id)["deadline_at"] == task.deadline_at.isoformat()
+
+    def test_overrun_task_is_failed_with_retry(self, task_queue, fake_db):
+        task_id = enqueue(task_queue, timeout_seconds=60)
+        task_queue.get_next_task()
+        self.overrun(fake_db, task_id)
+
+        assert task_queue.fail_timed_out_tasks() == 1
+
+        queued = stored(fake_db, "task_queue", task_id)
+        assert queued["status"] == TaskStatus.RETRY.value
+        assert queued["retry_count"] == 1
+        assert queued["deadline_at"] is None
+        assert "timed out after 60 seconds" in queued["error_message"]
+        assert stored(fake_db, "task_processing", task_id) is None
+
+    def test_task_within_deadline_is_left_alone(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+        task_queue.get_next_task()
+        # Renewing the lease does not move the deadline
+        task_queue.renew_lease(task_id)
+
+        assert task_queue.fail_timed_out_tasks() == 0
+        assert stored(fake_db, "task_processing", task_id) is not None
+
+    def test_hung_worker_cannot_complete_after_timeout(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+        task_queue.get_next_task()
+        self.overrun(fake_db, task_id)
+        task_queue.fail_timed_out_tasks()
+
+        task_queue.complete_task(task_id, {"ok": True}, worker_id="worker-a")
+
+        assert stored(fake_db, "task_completed", task_id) is None
+
+
+# ---------------------------------------------------------------------------
+# Completion and failure
+# ---------------------------------------------------------------------------
+
+class TestCompletion:
+
+    def test_complete_moves_task_to_completed(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+        task_queue.get_next_task()
+
+        task_queue.complete_task(task_id, {"pages": 2}, worker_id="worker-a")
+
+        completed = stored(fake_db, "task_completed", task_id)
+        assert completed["status"] == TaskStatus.COMPLETED.value
+        assert completed["result"] == {"pages": 2}
+        assert stored(fake_db, "task_queue", task_id) is None
+
+    def test_fail_with_retry_clears_lease(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+        task_queue.get_next_task()
+
+        task_queue.fail_task(task_id, "parse error")
+
+        queued = stored(fake_db, "task_queue", task_id)
+        assert queued["status"] == TaskStatus.RETRY.value
+        assert queued["retry_count"] == 1
+        assert queued["worker_id"] is None
+        assert queued["lease_expires_at"] is None
+
+
+# ---------------------------------------------------------------------------
+# Delayed tasks
+# ---------------------------------------------------------------------------
+
+class TestDelayedTasks:
+
+    def test_future_task_is_scheduled_not_pending(self, task_queue, fake_db):
+        due_at = datetime.now() + timedelta(minutes=5)
+        task_id = enqueue(task_queue, scheduled_at=due_at)
+
+        assert stored(fake_db, "task_queue", task_id)["status"] == TaskStatus.SCHEDULED.value
+        assert task_queue.get_next_task() is None
+        assert task_queue.next_due_at() == due_at
+
+    def test_retried_task_is_claimed_again_once_due(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+        task_queue.get_next_task()
+        task_queue.fail_task(task_id, "timeout")
+        assert task_queue.promote_due_tasks() == 0
+
+        # Backoff elapses
+        stored(fake_db, "task_queue", task_id)["scheduled_at"] = \
+            (datetime.now() - timedelta(seconds=1)).isoformat()
+
+        assert task_queue.promote_due_tasks() == 1
+        retried = task_queue.get_next_task()
+        assert retried.id == task_id
+        assert retried.retry_count == 1
+
+    def test_claim_promotes_due_tasks(self, fake_db):
+        task_queue = TaskQueue(fake_db, worker_id="worker-a", promote_interval_seconds=0)
+        task_id = enqueue(task_queue, scheduled_at=datetime.now() + timedelta(minutes=5))
+        stored(fake_db, "task_queue", task_id)["scheduled_at"] = \
+            (datetime.now() - timedelta(seconds=1)).isoformat()
+
+        assert task_queue.get_next_task().id == task_id
+
+    def test_cancel_scheduled_task(self, task_queue):
+        task_id = enqueue(task_queue, scheduled_at=datetime.now() + timedelta(minutes=5))
+
+        assert task_queue.cancel_task(task_id) is True
+        assert task_queue.next_due_at() is None
+
+
+# ---------------------------------------------------------------------------
+# Task dependencies
+# ---------------------------------------------------------------------------
+
+class TestDependencies:
+
+    def run(self, task_queue, task_id, result):
+        assert task_queue.get_next_task().id == task_id
+        task_queue.complete_task(task_id, result)
+
+    def test_child_waits_for_every_parent(self, task_queue, fake_db):
+        first = enqueue(task_queue, payload={"document_id": "w2"})
+        second = enqueue(task_queue, payload={"document_id": "1099"})
+        child = enqueue(task_queue, task_type=TaskType.AI_ANALYSIS, depends_on=[first, second])
+
+        assert stored(fake_db, "task_queue", child)["status"] == TaskStatus.BLOCKED.value
+        assert task_queue.get_queue_stats()["blocked"] == 1
+
+        self.run(task_queue, first, {"wages": 52000})
+        assert stored(fake_db, "task_queue", child)["status"] == TaskStatus.BLOCKED.value
+
+        self.run(task_queue, second, {"interest": 120})
+        task = task_queue.get_next_task()
+        assert task.id == child
+        assert task.payload["parent_results"] == {first: {"wages": 52000}, second: {"interest": 120}}
+        assert task_queue.get_queue_stats()["blocked"] == 0
+
+    def test_completed_parents_make_child_pending_at_once(self, task_queue, fake_db):
+        parent = enqueue(task_queue)
+        self.run(task_queue, parent, {"ok": True})
+
+        child = enqueue(task_queue, depends_on=[parent])
+
+        assert stored(fake_db, "task_queue", child)["status"] == TaskStatus.PENDING.value
+
+    def test_permanent_failure_cascades(self, task_queue, fake_db):
+        parent = enqueue(task_queue, max_retries=0)
+        child = enqueue(task_queue, depends_on=[parent])
+        grandchild = enqueue(task_queue, depends_on=[child])
+        task_queue.get_next_task()
+
+        task_queue.fail_task(parent, "corrupt pdf")
+
+        assert stored(fake_db, "task_failed", child)["error_message"] == f"Dependency {parent} failed"
+        assert stored(fake_db, "task_failed", grandchild)["error_message"] == f"Dependency {child} failed"
+        assert stored(fake_db, "task_queue", grandchild) is None
+
+    def test_retrying_parent_keeps_child_blocked(self, task_queue, fake_db):
+        parent = enqueue(task_queue)
+        child = enqueue(task_queue, depends_on=[parent])
+        task_queue.get_next_task()
+
+        task_queue.fail_task(parent, "timeout")
+
+        assert stored(fake_db, "task_queue", child)["status"] == TaskStatus.BLOCKED.value
+
+    def test_cancelling_blocked_child(self, task_queue, fake_db):
+        parent = enqueue(task_queue)
+        child = enqueue(task_queue, depends_on=[parent])
+
+        assert task_queue.cancel_task(child) is True
+        self.run(task_queue, parent, None)
+        assert stored(fake_db, "task_queue", child)["status"] == TaskStatus.CANCELLED.value
+
+    def test_unknown_or_failed_parent_is_rejected(self, task_queue):
+        parent = enqueue(task_queue)
+        task_queue.cancel_task(parent)
+
+        with pytest.raises(ValueError):
+            enqueue(task_queue, depends_on=["missing"])
+        with pytest.raises(ValueError):
+            enqueue(task_queue, depends_on=[parent])
+
+    def test_resolve_picks_up_missed_children(self, task_queue, fake_db, monkeypatch):
+        parent = enqueue(task_queue)
+        child = enqueue(task_queue, depends_on=[parent])
+        monkeypatch.setattr(task_queue, "_release_dependents", lambda parent_ids: None)
+        self.run(task_queue, parent, {"ok": True})
+        monkeypatch.undo()
+        assert stored(fake_db, "task_queue", child)["status"] == TaskStatus.BLOCKED.value
+
+        assert task_queue.resolve_blocked_tasks() == 1
+        assert stored(fake_db, "task_queue", child)["payload"]["parent_results"] == {parent: {"ok": True}}
+
+
+# ---------------------------------------------------------------------------
+# Dedupe keys
+# ---------------------------------------------------------------------------
+
+class TestDedupe:
+
+    def test_duplicate_returns_existing_task(self, task_queue, fake_db):
+        first = enqueue(task_queue, dedupe_key="doc_1:abc123")
+        second = enqueue(task_queue, dedupe_key="doc_1:abc123")
+
+        assert second == first
+        assert len(fake_db.data["task_queue"]) == 1
+        assert task_queue.get_queue_stats()["pending"] == 1
+
+    def test_in_flight_and_retrying_tasks_hold_the_key(self, task_queue):
+        task_id = enqueue(task_queue, dedupe_key="doc_1:abc123")
+        task_queue.get_next_task()
+        assert enqueue(task_queue, dedupe_key="doc_1:abc123") == task_id
+
+        task_queue.fail_task(task_id, "timeout")
+        assert enqueue(task_queue, dedupe_key="doc_1:abc123") == task_id
+
+    def test_key_released_when_task_finishes(self, task_queue, fake_db):
+        done_id = enqueue(task_queue, dedupe_key="done")
+        failed_id = enqueue(task_queue, dedupe_key="failed")
+        cancelled_id = enqueue(task_queue, dedupe_key="cancelled")
+        task_queue.claim_batch(2)
+        task_queue.complete_task(done_id)
+        task_queue.fail_task(failed_id, "corrupt", retry=False)
+        task_queue.cancel_task(cancelled_id)
+
+        assert fake_db.data["task_dedupe"] == {}
+        for key, old_id in (("done", done_id), ("failed", failed_id), ("cancelled", cancelled_id)):
+            assert enqueue(task_queue, dedupe_key=key) != old_id
+
+    def test_keys_with_slashes(self, task_queue):
+        first = enqueue(task_queue, dedupe_key="users/u1/doc_1:abc")
+
+        assert enqueue(task_queue, dedupe_key="users/u1/doc_1:abc") == first
+        assert enqueue(task_queue, dedupe_key="users/u1/doc_2:abc") != first
+
+
+# ---------------------------------------------------------------------------
+# User task history
+# ---------------------------------------------------------------------------
+
+class TestUserTaskPages:
+
+    @pytest.fixture
+    def history(self, task_queue):
+        """Seven tasks for user_123 spread over every collection, oldest first"""
+        ids = [enqueue(task_queue) for _ in range(7)]
+        enqueue(task_queue, user_id="someone_else")
+        task_queue.claim_batch(4)
+        task_queue.complete_batch({ids[0]: None, ids[1]: None})
+        task_queue.fail_task(ids[2], "corrupt", retry=False)
+        return ids
+
+    def test_pages_walk_every_task_once_newest_first(self, task_queue, history):
+        seen, cursor = [], None
+        while True:
+            page = task_queue.get_user_tasks_page("user_123", limit=3, cursor=cursor)
+            assert len(page["tasks"]) <= 3
+            seen.extend(task["id"] for task in page["tasks"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        assert sorted(seen) == sorted(history)
+        created = [task_queue.get_task_status(task_id)["created_at"] for task_id in seen]
+        assert created == sorted(created, reverse=True)
+
+    def test_page_reads_are_bounded_by_limit(self, task_queue, fake_db, history):
+        reads_before = fake_db.reads
+
+        task_queue.get_user_tasks_page("user_123", limit=2)
+
+        # At most limit + 1 rows from each of the three collections
+        assert fake_db.reads - reads_before <= 3 * 3
+
+    def test_status_routes_to_its_collection(self, task_queue, history):
+        completed = task_queue.get_user_tasks("user_123", status=TaskStatus.COMPLETED)
+        in_progress = task_queue.get_user_tasks("user_123", status=TaskStatus.IN_PROGRESS)
+
+        assert {t["id"] for t in completed} == set(history[:2])
+        assert {t["collection"] for t in completed} == {"task_completed"}
+        assert {t["id"] for t in in_progress} == {history[3]}
+
+    def test_invalid_cursor(self, task_queue):
+        with pytest.raises(ValueError):
+            task_queue.get_user_tasks_page("user_123", cursor="not-a-cursor")
+
+
+# ---------------------------------------------------------------------------
+# Cleanup and TTL
+# ---------------------------------------------------------------------------
+
+class TestCleanup:
+
+    def finished_docs(self, fake_db, collection, count, age_field, age):
+        when = (datetime.now() - age).isoformat()
+        store = fake_db.data.setdefault(collection, {})
+        for i in range(count):
+            store[f"{collection}_{i}"] = {"id": f"{collection}_{i}", age_field: when, "updated_at": when}
+
+    def test_drains_everything_in_bounded_batches(self, task_queue, fake_db):
+        self.finished_docs(fake_db, "task_completed", 1200, "completed_at", timedelta(days=40))
+        commits_before = fake_db.commits
+
+        deleted = task_queue.cleanup_old_tasks(days_old=30, pause_seconds=0)
+
+        assert deleted == 1200
+        assert fake_db.data["task_completed"] == {}
+        assert fake_db.commits - commits_before == 3
+
+    def test_failed_tasks_age_by_updated_at(self, task_queue, fake_db):
+        task_id = enqueue(task_queue)
+        task_queue.get_next_task()
+        task_queue.fail_task(task_id, "corrupt", retry=False)
+        old = (datetime.now() - timedelta(days=40)).isoformat()
+        stored(fake_db, "task_failed", task_id)["updated_at"] = old
+
+        assert task_queue.cleanup_old_tasks(days_old=30, pause_seconds=0) == 1
+        assert stored(fake_db, "task_failed", task_id) is None
+
+    def test_recent_tasks_are_kept(self, task_queue, fake_db):
+        self.finished_docs(fake_db, "task_completed", 3, "completed_at", timedelta(days=2))
+
+        assert task_queue.cleanup_old_tasks(days_old=30, pause_seconds=0) == 0
+        assert len(fake_db.data["task_completed"]) == 3
+
+    def test_ttl_mode_sets_expire_at(self, fake_db):
+        task_queue = TaskQueue(fake_db, worker_id="worker-a", ttl_days=30)
+        done_id, failed_id = enqueue(task_queue), enqueue(task_queue)
+        task_queue.claim_batch(2)
+        task_queue.complete_task(done_id)
+        task_queue.fail_task(failed_id, "corrupt", retry=False)
+
+        expected = datetime.now(timezone.utc) + timedelta(days=30)
+        for collection, task_id in (("task_completed", done_id), ("task_failed", failed_id)):
+            expire_at = stored(fake_db, collection, task_id)["expire_at"]
+            assert abs(expire_at - expected) < timedelta(minutes=1)
+
+
+def test_from_dict_accepts_documents_without_lease_fields():
+    now = datetime.now().isoformat()
+    task = Task.from_dict({
+        "id": "t1", "type": "notification", "status": "pending", "priority": 2,
+        "user_id": "u1", "payload": {}, "created_at": now, "updated_at": now,
+        "scheduled_at": now, "started_at": None, "completed_at": None,
+    })
+
+    assert task.lease_expires_at is None
+    assert task.worker_id is None
+
+
+def test_codec_round_trips_without_mutating_input():
+    now = datetime.now().replace(microsecond=0)
+    task = Task(
+        id="t1", type=TaskType.AI_ANALYSIS, status=TaskStatus.IN_PROGRESS,
+        priority=TaskPriority.HIGH, user_id="u1", payload={"pages": [1, 2]},
+        created_at=now, updated_at=now, lease_expires_at=now, dedupe_key="doc_1:abc",
+    )
+
+    data = task.to_dict()
+    snapshot = dict(data)
+
+    assert set(data) == set(Task.__slots__)
+    assert data["type"] == "ai_analysis"
+    assert data["lease_expires_at"] == now.isoformat()
+    assert Task.from_dict(data) == task
+    assert data == snapshot
+
+
+# ---------------------------------------------------------------------------
+# Batch claim / complete / fail
+# ---------------------------------------------------------------------------
+
+class TestBatchOperations:
+
+    def test_claim_batch_respects_limit_and_priority(self, task_queue):
+        low_ids = [enqueue(task_queue, priority=TaskPriority.LOW) for _ in range(3)]
+        high_id = enqueue(task_queue, priority=TaskPriority.HIGH)
+
+        tasks = task_queue.claim_batch(2)
+
+        assert [t.id for t in tasks] == [high_id, low_ids[0]]
+        assert all(t.status == TaskStatus.IN_PROGRESS for t in tasks)
+
+    def test_claim_batch_filters_task_types(self, task_queue):
+        enqueue(task_queue, task_type=TaskType.NOTIFICATION)
+        doc_id = enqueue(task_queue, task_type=TaskType.DOCUMENT_PROCESSING)
+
+        tasks = task_queue.claim_batch(10, [TaskType.DOCUMENT_PROCESSING])
+
+        assert [t.id for t in tasks] == [doc_id]
+
+    def test_complete_batch_uses_single_commit(self, task_queue, fake_db):
+        ids = [enqueue(task_queue) for _ in range(5)]
+        task_queue.claim_batch(5)
+        commits_before = fake_db.commits
+
+        completed = task_queue.complete_batch({task_id: {"n": i} for i, task_id in enumerate(ids)})
+
+        assert sorted(completed) == sorted(ids)
+        assert fake_db.commits == commits_before + 1
+        assert stored(fake_db, "task_completed", ids[3])["result"] == {"n": 3}
+        assert not fake_db.data["task_processing"]
+
+    def test_complete_batch_splits_at_write_limit(self, task_queue, fake_db):
+        ids = [enqueue(task_queue) for _ in range(200)]
+        task_queue.claim_batch(200)
+        commits_before = fake_db.commits
+
+        task_queue.complete_batch({task_id: None for task_id in ids})
+
+        # Up to four writes per task, 499 per transaction plus the stats shard -> 124 + 76 tasks
+        assert fake_db.commits == commits_before + 2
+        assert len(fake_db.data["task_completed"]) == 200
+
+    def test_fail_batch_retries_or_fails_per_task(self, task_queue, fake_db):
+        retry_id = enqueue(task_queue)
+        final_id = enqueue(task_queue, max_retries=0)
+        task_queue.claim_batch(2)
+
+        outcomes = task_queue.fail_batch({retry_id: "timeout", final_id: "corrupt pdf"})
+
+        assert outcomes == {retry_id: TaskStatus.RETRY, final_id: TaskStatus.FAILED}
+        assert stored(fake_db, "task_queue", retry_id)["status"] == TaskStatus.RETRY.value
+        assert stored(fake_db, "task_failed", final_id)["error_message"] == "corrupt pdf"
+        assert stored(fake_db, "task_queue", final_id) is None
+
+    def test_unknown_ids_are_skipped(self, task_queue):
+        assert task_queue.complete_batch({"missing": None}) == []
+        assert task_queue.fail_batch({"missing": "boom"}) == {}
+
+
+# ---------------------------------------------------------------------------
+# Sharded queue statistics
+# ---------------------------------------------------------------------------
+
+class TestQueueStats:
+
+    def exercise(self, task_queue):
+        """Drive tasks through every transition the counters track"""
+        enqueue(task_queue, task_type=TaskType.NOTIFICATION, priority=TaskPriority.HIGH)
+        cancelled_id = enqueue(task_queue, priority=TaskPriority.LOW)
+        done_id, retry_id, failed_id = (
+            enqueue(task_queue, priority=TaskPriority.URGENT) for _ in range(3)
+        )
+        in_flight_id = enqueue(task_queue, priority=TaskPriority.URGENT, max_retries=0)
+
+        task_queue.claim_batch(4, [TaskType.DOCUMENT_PROCESSING])
+        task_queue.complete_task(done_id, {"ok": True})
+        task_queue.fail_task(retry_id, "timeout")
+        task_queue.fail_task(failed_id, "corrupt", retry=False)
+        task_queue.cancel_task(cancelled_id)
+        return in_flight_id
+
+    def test_counters_match_full_scan(self, task_queue):
+        self.exercise(task_queue)
+
+        stats = task_queue.get_queue_stats()
+
+        # Reconciling recounts with a full scan, so it changes nothing when the counters are right
+        assert stats == task_queue.reconcile_queue_stats()
+        assert stats["pending"] == 1
+        assert stats["in_progress"] == 1
+        assert stats["completed_today"] == 1
+        assert stats["failed_today"] == 1
+        assert stats["by_type"] == {"notification": 1}
+
+    def test_per_user_counters_are_not_kept_without_fair_scheduling(self, task_queue, fake_db):
+        self.exercise(task_queue)
+
+        stats = task_queue.get_queue_stats()
+
+        assert stats["by_user"] == {}
+        assert stats["in_progress_by_user"] == {}
+        assert not fake_db.data.get("task_user_stats")
+        for shard in fake_db.data["task_stats"].values():
+            assert set(shard) <= {
+                "pending", "pending_by_type", "pending_by_priority", "in_progress", "delayed",
+                "completed_by_day", "failed_by_day"
+            }
+
+    def test_expired_lease_moves_counter_back_to_pending(self, task_queue, fake_db):
+        in_flight_id = self.exercise(task_queue)
+        past = (datetime.now() - timedelta(seconds=5)).isoformat()
+        fake_db.data["task_processing"][in_flight_id]["lease_expires_at"] = past
+
+        task_queue.requeue_expired_leases()
+
+        stats = task_queue.get_queue_stats()
+        assert stats["pending"] == 2
+        assert stats["in_progress"] == 0
+
+    def test_stats_read_cost_is_independent_of_queue_depth(self, task_queue, fake_db):
+        for _ in range(50):
+            enqueue(task_queue)
+        reads_before = fake_db.reads
+
+        assert task_queue.get_queue_stats()["pending"] == 50
+        assert fake_db.reads - reads_before == task_queue.stats_shards
+
+    def test_reconcile_corrects_drift(self, task_queue, fake_db):
+        self.exercise(task_queue)
+        fake_db.data["task_stats"]["shard_3"] = {"pending": 40, "in_progress": -7}
+
+        reconciled = task_queue.reconcile_queue_stats()
+
+        assert task_queue.get_queue_stats() == reconciled
+        assert reconciled["pending"] == 1
+
+
+# ---------------------------------------------------------------------------
+# Fair scheduling
+# ---------------------------------------------------------------------------
+
+class TestFairScheduling:
+
+    @pytest.fixture
+    def fair_queue(self, fake_db):
+        return TaskQueue(fake_db, worker_id="worker-a", fair_scheduler=FairScheduler())
+
+    def test_bulk_uploader_does_not_starve_other_users(self, fair_queue):
+        for _ in range(20):
+            enqueue(fair_queue, user_id="accountant")
+        light = [enqueue(fair_queue, user_id="taxpayer") for _ in range(2)]
+
+        claimed = fair_queue.claim_batch(4)
+
+        assert [t.user_id for t in claimed] == ["accountant", "taxpayer"] * 2
+        assert light == [t.id for t in claimed if t.user_id == "taxpayer"]
+
+    def test_rotation_continues_across_single_claims(self, fair_queue):
+        for user_id in ("a", "b", "c"):
+            for _ in range(3):
+                enqueue(fair_queue, user_id=user_id)
+
+        users = [fair_queue.get_next_task().user_id for _ in range(6)]
+
+        assert users == ["a", "b", "c", "a", "b", "c"]
+
+    def test_priority_bands_are_still_strict(self, fair_queue):
+        enqueue(fair_queue, user_id="a", priority=TaskPriority.LOW)
+        urgent = enqueue(fair_queue, user_id="b", priority=TaskPriority.URGENT)
+
+        assert fair_queue.get_next_task().id == urgent
+
+    def test_in_flight_cap_per_user(self, fake_db):
+        fair_queue = TaskQueue(
+            fake_db, worker_id="worker-a",
+            fair_scheduler=FairScheduler(max_in_flight_per_user=2)
+        )
+        for _ in range(5):
+            enqueue(fair_queue, user_id="accountant")
+        enqueue(fair_queue, user_id="taxpayer")
+
+        assert len(fair_queue.claim_batch(10)) == 3
+        assert fair_queue.claim_batch(10) == []
+        assert fair_queue.get_queue_stats()["in_progress_by_user"] == {"accountant": 2, "taxpayer": 1}
+
+    def test_user_counters_match_full_scan(self, fair_queue):
+        TestQueueStats().exercise(fair_queue)
+
+        stats = fair_queue.get_queue_stats()
+
+        assert stats == fair_queue.reconcile_queue_stats()
+        assert stats["by_user"] == {"user_123": 1}
+        assert stats["in_progress_by_user"] == {"user_123": 1}
+
+    def test_user_counters_are_deleted_once_idle(self, fair_queue, fake_db):
+        busy = enqueue(fair_queue, user_id="accountant")
+        idle = enqueue(fair_queue, user_id="taxpayer")
+        fair_queue.cancel_task(idle)
+
+        fair_queue.claim_batch(1)
+
+        assert set(fake_db.data["task_user_stats"]) == {"accountant"}
+        fair_queue.complete_task(busy)
+        assert fair_queue.get_queue_stats()["in_progress_by_user"] == {}
+        assert not fake_db.data["task_user_stats"]
+
+    def test_task_type_filter(self, fair_queue):
+        enqueue(fair_queue, user_id="a", task_type=TaskType.NOTIFICATION)
+        doc_id = enqueue(fair_queue, user_id="b")
+
+        assert [t.id for t in fair_queue.claim_batch(5, [TaskType.DOCUMENT_PROCESSING])] == [doc_id]
+
+    def test_wait_time_percentiles_per_user(self, fair_queue):
+        enqueue(fair_queue, user_id="a")
+        enqueue(fair_queue, user_id="b")
+        fair_queue.claim_batch(2)
+
+        report = fair_queue.get_wait_time_percentiles((50, 99))
+
+        assert set(report) == {"a", "b"}
+        assert report["a"]["count"] == 1
+        # Waits count from when the task became claimable, not its backdated schedule
+        assert 0 <= report["a"]["p99"] < 1
+
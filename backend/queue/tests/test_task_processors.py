@@ -0,0 +1,173 @@
+"""
+Tests for task_processors.py — document downloads and parsing.
+
+Storage is replaced by a fake bucket whose blobs write fixed bytes into the
+file object they are given, the way ``Blob.download_to_file`` streams.
+"""
+
+import io
+
+import pytest
+from PIL import Image
+
+from backend.parser.functions import pdf_text
+from backend.parser.functions.blob_io import open_blob
+from backend.queue import task_processors
+from backend.queue.ocr_engine import OcrPage
+from backend.queue.task_manager import TaskQueue, TaskType
+from backend.queue.task_processors import DocumentProcessingProcessor
+
+
+class FakeBlob:
+    def __init__(self, content):
+        self.content = content
+        self.downloads = []
+
+    def download_to_file(self, file_obj):
+        self.downloads.append(file_obj)
+        file_obj.write(self.content)
+
+
+class FakeBucket:
+    def __init__(self, content):
+        self.blobs = {}
+        self.content = content
+
+    def blob(self, path):
+        return self.blobs.setdefault(path, FakeBlob(self.content))
+
+
+def make_pdf(text, pages=1):
+    canvas = pytest.importorskip("reportlab.pdfgen.canvas")
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for number in range(1, pages + 1):
+        pdf.drawString(72, 720, f"{text} page {number}")
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def make_processor(fake_db, monkeypatch, content):
+    bucket = FakeBucket(content)
+    monkeypatch.setattr(task_processors.storage, "bucket", lambda: bucket)
+    fake_db.collection("taxDocuments").document("doc_1").set({"status": "uploaded"})
+    return DocumentProcessingProcessor(fake_db, TaskQueue(fake_db)), bucket
+
+
+def make_task(task_queue, document_type):
+    task_queue.enqueue_task(
+        TaskType.DOCUMENT_PROCESSING, "user_123",
+        {
+            "document_id": "doc_1",
+            "document_url": "gs://taxfront.appspot.com/users/user_123/w2.pdf",
+            "document_type": document_type,
+        },
+    )
+    return task_queue.claim_batch(1)[0]
+
+
+def test_pdf_is_parsed_from_the_download_stream(fake_db, monkeypatch):
+    processor, bucket = make_processor(fake_db, monkeypatch, make_pdf("Wages: $52,000.00"))
+    # Page extraction reuses the processor's reader rather than parsing the document again
+    monkeypatch.setattr(pdf_text, "PdfReader", None)
+
+    result = processor.process(make_task(processor.task_queue, "application/pdf"))
+
+    assert result["metadata"]["page_count"] == 1
+    assert result["metadata"]["failed_pages"] == []
+    assert result["metadata"]["pages"][0]["number"] == 1
+    assert result["text_length"] > 0
+    buffer = bucket.blobs["users/user_123/w2.pdf"].downloads[0]
+    assert buffer.closed
+    assert fake_db.collection("taxDocuments").document("doc_1").get().to_dict()["status"] == "processed"
+
+
+def test_pdf_pages_can_be_extracted_in_parallel(fake_db, monkeypatch):
+    processor, _ = make_processor(fake_db, monkeypatch, b"")
+    processor.PAGE_WORKERS = 2
+
+    metadata, text = processor._process_pdf(io.BytesIO(make_pdf("Interest income", pages=10)))
+
+    assert metadata["page_count"] == 10
+    assert [page["number"] for page in metadata["pages"]] == list(range(1, 11))
+    assert text.index("--- Page 2 ---\nInterest income page 2") < text.index("--- Page 10 ---")
+
+
+def test_download_buffer_is_closed_when_processing_fails(fake_db, monkeypatch):
+    processor, bucket = make_processor(fake_db, monkeypatch, b"%PDF-1.4")
+
+    def explode(stream):
+        raise RuntimeError("parser crashed")
+
+    monkeypatch.setattr(processor, "_process_pdf", explode)
+    with pytest.raises(RuntimeError):
+        processor.process(make_task(processor.task_queue, "application/pdf"))
+
+    assert bucket.blobs["users/user_123/w2.pdf"].downloads[0].closed
+    assert fake_db.collection("taxDocuments").document("doc_1").get().to_dict()["status"] == "error"
+
+
+def test_large_downloads_spill_out_of_memory():
+    with open_blob(FakeBlob(b"x" * 64), max_size=16) as stream:
+        assert stream._rolled
+        assert stream.read() == b"x" * 64
+    assert stream.closed
+
+
+def test_unsupported_types_are_not_downloaded(fake_db, monkeypatch):
+    processor, bucket = make_processor(fake_db, monkeypatch, b"PK")
+
+    processor.process(make_task(processor.task_queue, "application/zip"))
+
+    assert bucket.blobs["users/user_123/w2.pdf"].downloads == []
+
+
+class FakeOcrEngine:
+    def __init__(self):
+        self.pdf_pages = []
+
+    def recognize_image(self, image):
+        return OcrPage(1, f"OCR of {len(image)} bytes", 0.5)
+
+    def recognize_pdf(self, stream, page_numbers):
+        self.pdf_pages.extend(page_numbers)
+        return [OcrPage(number, f"OCR page {number}", 0.5) for number in page_numbers]
+
+
+def make_scanned_pdf():
+    canvas = pytest.importorskip("reportlab.pdfgen.canvas")
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    pdf.drawString(72, 720, "Cover letter")
+    pdf.showPage()
+    pdf.rect(72, 72, 400, 600, fill=1)
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def test_images_are_recognised_by_the_ocr_engine(fake_db, monkeypatch):
+    processor, _ = make_processor(fake_db, monkeypatch, b"")
+    processor._ocr_engine = FakeOcrEngine()
+    image = io.BytesIO()
+    Image.new("RGB", (40, 30), "white").save(image, format="PNG")
+    image.seek(0)
+
+    metadata, text = processor._process_image(image)
+
+    assert metadata["size"] == (40, 30)
+    assert metadata["ocr_seconds"] == 0.5
+    assert text == f"OCR of {len(image.getvalue())} bytes"
+
+
+def test_pdf_pages_without_a_text_layer_are_ocred(fake_db, monkeypatch):
+    processor, _ = make_processor(fake_db, monkeypatch, b"")
+    processor._ocr_engine = engine = FakeOcrEngine()
+
+    metadata, text = processor._process_pdf(io.BytesIO(make_scanned_pdf()))
+
+    assert engine.pdf_pages == [2]
+    assert metadata["ocr_pages"] == [2]
+    assert "Cover letter" in text
+    assert "--- Page 2 ---\nOCR page 2" in text
@@ -0,0 +1,282 @@
+"""
+Tests for worker.py — the multi-threaded worker runtime.
+
+Processors are replaced by small in-test classes registered through the
+``registry`` argument, and every type runs on the thread pool so no Firebase
+app or child process is needed.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.queue.task_manager import TaskQueue, TaskStatus, TaskType
+from backend.queue.task_processors import PROCESSOR_REGISTRY, NotificationProcessor, get_processor_class
+from backend.queue.worker import TaskWorker, WorkerConfig
+
+
+class EchoProcessor:
+    def __init__(self, db, task_queue):
+        pass
+
+    def process(self, task):
+        return {"echo": task.payload["value"]}
+
+
+class FailingProcessor(EchoProcessor):
+    def process(self, task):
+        raise RuntimeError("provider unavailable")
+
+
+class BlockingProcessor(EchoProcessor):
+    release = threading.Event()
+
+    def process(self, task):
+        self.release.wait(timeout=5)
+        return {"done": True}
+
+
+class LeaseEchoProcessor(BlockingProcessor):
+    def process(self, task):
+        self.release.wait(timeout=5)
+        return {"lease_id": task.lease_id}
+
+
+@pytest.fixture
+def task_queue(fake_db):
+    return TaskQueue(fake_db, worker_id="worker-a")
+
+
+def make_worker(task_queue, fake_db, registry, **config):
+    config.setdefault("process_task_types", ())
+    worker = TaskWorker(task_queue, fake_db, WorkerConfig(**config), registry=registry)
+    worker.start()
+    return worker
+
+
+def enqueue(task_queue, task_type=TaskType.NOTIFICATION, value=1):
+    return task_queue.enqueue_task(
+        task_type, "user_123", {"value": value},
+        scheduled_at=datetime.now() - timedelta(seconds=1),
+    )
+
+
+def test_registry_maps_task_types_to_processors():
+    assert get_processor_class(TaskType.NOTIFICATION) is NotificationProcessor
+    assert TaskType.DOCUMENT_PROCESSING in PROCESSOR_REGISTRY
+    with pytest.raises(ValueError):
+        get_processor_class(TaskType.BACKUP)
+
+
+def test_document_processing_routes_to_process_pool(task_queue, fake_db):
+    worker = TaskWorker(task_queue, fake_db, WorkerConfig(process_pool_size=2))
+
+    assert worker.uses_process_pool(TaskType.DOCUMENT_PROCESSING)
+    assert not worker.uses_process_pool(TaskType.NOTIFICATION)
+    assert worker.concurrency_limit(TaskType.DOCUMENT_PROCESSING) == 2
+
+
+def test_completed_tasks_are_recorded_in_batch(task_queue, fake_db):
+    ids = [enqueue(task_queue, value=i) for i in range(3)]
+    worker = make_worker(task_queue, fake_db, {TaskType.NOTIFICATION: EchoProcessor})
+
+    assert worker.run_once() == 3
+    worker.shutdown()
+
+    for i, task_id in enumerate(ids):
+        completed = fake_db.data["task_completed"][task_id]
+        assert completed["result"] == {"echo": i}
+
+
+def test_processor_errors_fail_the_task(task_queue, fake_db):
+    task_id = enqueue(task_queue)
+    worker = make_worker(task_queue, fake_db, {TaskType.NOTIFICATION: FailingProcessor})
+
+    worker.run_once()
+    worker.shutdown()
+
+    queued = fake_db.data["task_queue"][task_id]
+    assert queued["status"] == TaskStatus.RETRY.value
+    assert queued["error_message"] == "provider unavailable"
+
+
+def test_per_type_concurrency_limit(task_queue, fake_db):
+    BlockingProcessor.release.clear()
+    for _ in range(5):
+        enqueue(task_queue)
+    worker = make_worker(
+        task_queue, fake_db, {TaskType.NOTIFICATION: BlockingProcessor},
+        concurrency_limits={TaskType.NOTIFICATION: 2},
+    )
+
+    try:
+        assert worker.run_once() == 2
+        assert worker.run_once() == 0
+    finally:
+        BlockingProcessor.release.set()
+        worker.shutdown()
+
+    assert len(fake_db.data["task_completed"]) == 2
+
+
+def test_thread_pool_types_share_the_pool(task_queue, fake_db):
+    BlockingProcessor.release.clear()
+    for task_type in (TaskType.NOTIFICATION, TaskType.AI_ANALYSIS):
+        for _ in range(2):
+            enqueue(task_queue, task_type)
+    worker = make_worker(
+        task_queue, fake_db,
+        {TaskType.NOTIFICATION: BlockingProcessor, TaskType.AI_ANALYSIS: BlockingProcessor},
+        thread_pool_size=2,
+    )
+
+    try:
+        assert worker.run_once() == 2
+        assert worker.run_once() == 0
+    finally:
+        BlockingProcessor.release.set()
+        worker.shutdown()
+
+
+def test_results_are_kept_when_recording_fails(task_queue, fake_db, monkeypatch):
+    task_id = enqueue(task_queue)
+    worker = make_worker(task_queue, fake_db, {TaskType.NOTIFICATION: EchoProcessor})
+    worker.run_once()
+    worker._thread_pool.shutdown(wait=True)
+
+    def unavailable(*args, **kwargs):
+        raise RuntimeError("firestore unavailable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(task_queue, "complete_batch", unavailable)
+        with pytest.raises(RuntimeError):
+            worker.run_once()
+    worker.shutdown()
+
+    assert fake_db.data["task_completed"][task_id]["result"] == {"echo": 1}
+
+
+def test_run_survives_a_failed_cycle(task_queue, fake_db, monkeypatch):
+    worker = TaskWorker(
+        task_queue, fake_db,
+        WorkerConfig(process_task_types=(), poll_interval_seconds=0.01),
+        registry={TaskType.NOTIFICATION: EchoProcessor},
+    )
+    cycles = []
+
+    def run_once():
+        cycles.append(1)
+        if len(cycles) == 1:
+            raise RuntimeError("firestore unavailable")
+        worker.stop()
+        return 0
+
+    monkeypatch.setattr(worker, "run_once", run_once)
+    worker.run()
+
+    assert len(cycles) == 2
+
+
+def test_leases_are_renewed_while_draining(task_queue, fake_db, monkeypatch):
+    BlockingProcessor.release.clear()
+    task_id = enqueue(task_queue)
+    worker = make_worker(
+        task_queue, fake_db, {TaskType.NOTIFICATION: BlockingProcessor}, lease_renewal_seconds=0.01,
+    )
+    renewed = []
+    renew_lease = task_queue.renew_lease
+    monkeypatch.setattr(
+        task_queue, "renew_lease", lambda task_id, **kwargs: renewed.append(task_id) or renew_lease(task_id, **kwargs)
+    )
+
+    worker.run_once()
+    threading.Timer(0.2, BlockingProcessor.release.set).start()
+    worker.shutdown()
+
+    assert renewed and set(renewed) == {task_id}
+    assert task_id in fake_db.data["task_completed"]
+
+
+def test_only_the_latest_claim_of_a_task_is_recorded(task_queue, fake_db):
+    BlockingProcessor.release.clear()
+    task_id = enqueue(task_queue)
+    worker = make_worker(task_queue, fake_db, {TaskType.NOTIFICATION: LeaseEchoProcessor})
+
+    try:
+        assert worker.run_once() == 1
+        # The lease runs out while the first attempt is still running and this worker claims the task again
+        past = (datetime.now() - timedelta(seconds=5)).isoformat()
+        fake_db.data["task_processing"][task_id]["lease_expires_at"] = past
+        task_queue.requeue_expired_leases()
+        assert worker.run_once() == 1
+        second_lease_id = fake_db.data["task_processing"][task_id]["lease_id"]
+    finally:
+        BlockingProcessor.release.set()
+        worker.shutdown()
+
+    assert fake_db.data["task_completed"][task_id]["result"] == {"lease_id": second_lease_id}
+
+
+def test_stop_drains_in_flight_tasks(task_queue, fake_db):
+    BlockingProcessor.release.clear()
+    task_id = enqueue(task_queue)
+    worker = TaskWorker(
+        task_queue, fake_db,
+        WorkerConfig(process_task_types=(), poll_interval_seconds=0.01),
+        registry={TaskType.NOTIFICATION: BlockingProcessor},
+    )
+    runner = threading.Thread(target=worker.run)
+    runner.start()
+
+    deadline = time.monotonic() + 5
+    while task_id not in fake_db.data.get("task_processing", {}) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    worker.stop()
+    BlockingProcessor.release.set()
+    runner.join(timeout=5)
+
+    assert not runner.is_alive()
+    assert task_id in fake_db.data["task_completed"]
+
+
+def test_idle_worker_wakes_on_notification(task_queue, fake_db):
+    worker = TaskWorker(
+        task_queue, fake_db,
+        WorkerConfig(process_task_types=(), poll_interval_seconds=30),
+        registry={TaskType.NOTIFICATION: EchoProcessor},
+    )
+    runner = threading.Thread(target=worker.run)
+    runner.start()
+
+    try:
+        time.sleep(0.05)
+        task_id = enqueue(task_queue)
+
+        deadline = time.monotonic() + 5
+        while task_id not in fake_db.data.get("task_completed", {}) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert task_id in fake_db.data["task_completed"]
+    finally:
+        worker.stop()
+        runner.join(timeout=5)
+
+    assert not runner.is_alive()
+    assert worker.get_claim_latency_percentiles()[TaskType.NOTIFICATION.value]["count"] == 1
+
+
+def test_idle_wait_is_bounded_by_next_due_time(task_queue, fake_db):
+    worker = TaskWorker(
+        task_queue, fake_db,
+        WorkerConfig(process_task_types=(), poll_interval_seconds=1, max_poll_interval_seconds=4),
+        registry={TaskType.NOTIFICATION: EchoProcessor},
+    )
+
+    assert worker._idle_timeout(4) == 4
+
+    task_queue.enqueue_task(
+        TaskType.NOTIFICATION, "user_123", {"value": 1},
+        scheduled_at=datetime.now() + timedelta(seconds=2),
+    )
+    assert 1 <= worker._idle_timeout(4) <= 2
@@ -0,0 +1,421 @@
+"""
+Worker runtime for the TaxFront task queue
+Claims tasks from a TaskQueue and dispatches them to their processors concurrently
+"""
+
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Type
+import logging
+
+from firebase_admin import firestore
+
+from .fair_scheduler import WaitTimeTracker
+from .notifier import FirestoreTaskNotifier
+from .scheduler import DelayedTaskScheduler
+from .task_manager import BaseTaskQueue, Task, TaskQueue, TaskType
+from .task_processors import PROCESSOR_REGISTRY, BaseTaskProcessor
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class WorkerConfig:
+    """Worker runtime configuration"""
+    # Pool for I/O-bound processors (notifications, AI analysis, form generation)
+    thread_pool_size: int = 8
+    # Pool for CPU-bound processors (PDF parsing and OCR)
+    process_pool_size: int = field(default_factory=lambda: os.cpu_count() or 1)
+    process_task_types: Tuple[TaskType, ...] = (TaskType.DOCUMENT_PROCESSING,)
+    # Maximum tasks of a type in flight at once; unlisted types are bounded by their pool size
+    concurrency_limits: Dict[TaskType, int] = field(default_factory=dict)
+    batch_size: int = 10
+    # An idle worker waits on the queue's notifier; without a notification it
+    # polls again after this long, doubling up to max_poll_interval_seconds
+    poll_interval_seconds: float = 1.0
+    max_poll_interval_seconds: float = 30.0
+    lease_renewal_seconds: float = 30.0
+    drain_timeout_seconds: float = 300.0
+
+class TaskWorker:
+    """Claims tasks and runs them on a thread pool or a process pool by task type"""
+
+    def __init__(
+        self,
+        task_queue: BaseTaskQueue,
+        db: firestore.Client,
+        config: Optional[WorkerConfig] = None,
+        registry: Optional[Dict[TaskType, Type[BaseTaskProcessor]]] = None
+    ):
+        self.task_queue = task_queue
+        self.db = db
+        self.config = config or WorkerConfig()
+        self.registry = registry if registry is not None else PROCESSOR_REGISTRY
+
+        self._processors: Dict[TaskType, BaseTaskProcessor] = {}
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._inflight: Dict[Future, Task] = {}
+        self._inflight_by_type: Dict[TaskType, int] = {}
+        # Keyed by Task.lease_id: a task whose lease expired may be claimed
+        # again by this worker while the first attempt is still running
+        self._lease_renewed_at: Dict[str, Tuple[Task, float]] = {}
+        self._results: Dict[str, Tuple[Task, Optional[Dict[str, Any]]]] = {}
+        self._errors: Dict[str, Tuple[Task, str]] = {}
+        self._next_type = 0
+        # Queue wait (claimable → claimed) of tasks this worker claimed, keyed by task type
+        self.claim_latency = WaitTimeTracker()
+
+    @property
+    def task_types(self) -> List[TaskType]:
+        """Task types this worker can dispatch"""
+        return list(self.registry)
+
+    def uses_process_pool(self, task_type: TaskType) -> bool:
+        return task_type in self.config.process_task_types and self.config.process_pool_size > 0
+
+    def concurrency_limit(self, task_type: TaskType) -> int:
+        if self.uses_process_pool(task_type):
+            pool_size = self.config.process_pool_size
+        else:
+            pool_size = self.config.thread_pool_size
+        return min(self.config.concurrency_limits.get(task_type, pool_size), pool_size)
+
+    def start(self):
+        """Create the executor pools"""
+
+        self._stopping.clear()
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.config.thread_pool_size,
+                thread_name_prefix='task-worker'
+            )
+
+        process_types = [t for t in self.task_types if self.uses_process_pool(t)]
+        if process_types and self._process_pool is None:
+            # Spawn rather than fork: gRPC channels held by the Firebase clients are not fork-safe
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.config.process_pool_size,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_process_worker,
+                initargs=(self.registry,)
+            )
+
+        logger.info(
+            f"Worker {self.task_queue.worker_id} started "
+            f"({self.config.thread_pool_size} threads, {self.config.process_pool_size} processes)"
+        )
+
+    def run(self):
+        """Claim and dispatch tasks until ``stop`` is called, then drain"""
+
+        self.start()
+        poll_interval = self.config.poll_interval_seconds
+        try:
+            while not self._stopping.is_set():
+                try:
+                    dispatched = self.run_once()
+                except Exception as e:
+                    # A Firestore outage must not kill the worker and orphan its in-flight tasks
+                    logger.exception(f"Claim cycle failed, retrying in {poll_interval:.1f}s: {e}")
+                    self._stopping.wait(poll_interval)
+                    poll_interval = min(poll_interval * 2, self.config.max_poll_interval_seconds)
+                    continue
+                if dispatched:
+                    poll_interval = self.config.poll_interval_seconds
+                    continue
+                if self.task_queue.notifier.wait(self._idle_timeout(poll_interval)):
+                    poll_interval = self.config.poll_interval_seconds
+                else:
+                    poll_interval = min(poll_interval * 2, self.config.max_poll_interval_seconds)
+        finally:
+            self.shutdown()
+
+    def run_once(self) -> int:
+        """Run one claim/dispatch cycle and return the number of tasks dispatched"""
+
+        self._flush_results()
+        self._renew_leases()
+
+        dispatched = 0
+        task_types = self.task_types
+
+        # Rotate the starting type so one busy type does not always claim first
+        for offset in range(len(task_types)):
+            task_type = task_types[(self._next_type + offset) % len(task_types)]
+            capacity = min(self._capacity(task_type), self._pool_capacity(task_type), self.config.batch_size)
+            if capacity <= 0:
+                continue
+
+            for task in self.task_queue.claim_batch(capacity, [task_type]):
+                self.claim_latency.record(task.type.value, task.queue_wait_seconds())
+                self._dispatch(task)
+                dispatched += 1
+
+        self._next_type = (self._next_type + 1) % max(len(task_types), 1)
+        return dispatched
+
+    def stop(self):
+        """Stop claiming new tasks; in-flight tasks are drained by ``run``"""
+        self._stopping.set()
+        self.task_queue.notifier.notify()
+
+    def get_claim_latency_percentiles(self, percentiles=(50, 90, 99)) -> Dict[str, Dict[str, float]]:
+        """Queue wait-time percentiles in seconds for tasks this worker claimed, keyed by task type"""
+        return self.claim_latency.percentiles(percentiles)
+
+    def shutdown(self):
+        """Wait for in-flight tasks, record their results and close the pools"""
+
+        with self._lock:
+            pending = list(self._inflight)
+
+        if pending:
+            logger.info(f"Draining {len(pending)} in-flight tasks")
+            # Keep renewing leases while draining, or tasks that outlive their
+            # lease are requeued and run twice
+            drain_deadline = time.monotonic() + self.config.drain_timeout_seconds
+            while pending:
+                remaining = drain_deadline - time.monotonic()
+                if remaining <= 0:
+                    # Their leases will expire and the tasks return to the queue
+                    logger.warning(f"{len(pending)} tasks still running after drain timeout")
+                    break
+                _, not_done = wait(pending, timeout=min(remaining, self.config.lease_renewal_seconds))
+                pending = list(not_done)
+                self._drain_cycle()
+
+        try:
+            self._flush_results()
+        except Exception as e:
+            # Their leases will expire and the tasks return to the queue
+            logger.exception(f"Recording the last results failed: {e}")
+
+        for task_type, latency in self.get_claim_latency_percentiles().items():
+            logger.info(
+                f"Claim latency for {task_type}: p50 {latency['p50']:.3f}s, p90 {latency['p90']:.3f}s, "
+                f"p99 {latency['p99']:.3f}s over {latency['count']} tasks"
+            )
+
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+        logger.info(f"Worker {self.task_queue.worker_id} stopped")
+
+    def install_signal_handlers(self):
+        """Drain gracefully on SIGTERM (Cloud Run / Kubernetes shutdown) and SIGINT"""
+
+        def handle(signum, frame):
+            logger.info(f"Received signal {signum}, draining")
+            self.stop()
+
+        signal.signal(signal.SIGTERM, handle)
+        signal.signal(signal.SIGINT, handle)
+
+    def _idle_timeout(self, poll_interval: float) -> float:
+        """How long an idle worker may wait before it must claim, renew leases or promote"""
+
+        timeout = poll_interval
+        with self._lock:
+            if self._inflight:
+                timeout = min(timeout, self.config.lease_renewal_seconds)
+
+        # Promotion of delayed tasks happens during claims, so wake up for the next due time
+        try:
+            due_at = self.task_queue.next_due_at()
+        except Exception as e:
+            logger.warning(f"Reading the next due time failed: {e}")
+            due_at = None
+        if due_at is not None:
+            until_due = (due_at - datetime.now()).total_seconds()
+            timeout = min(timeout, max(until_due, self.config.poll_interval_seconds))
+
+        # Rate-limited types left work queued, so wake up when their buckets refill
+        rate_limiter = self.task_queue.rate_limiter
+        if rate_limiter is not None:
+            refills = [rate_limiter.seconds_until_available(t) for t in self.task_types]
+            refills = [seconds for seconds in refills if seconds > 0]
+            if refills:
+                timeout = min(timeout, max(min(refills), self.config.poll_interval_seconds))
+        return timeout
+
+    def _capacity(self, task_type: TaskType) -> int:
+        with self._lock:
+            return self.concurrency_limit(task_type) - self._inflight_by_type.get(task_type, 0)
+
+    def _pool_capacity(self, task_type: TaskType) -> int:
+        """Free workers in the pool ``task_type`` runs on, shared by every type on that pool"""
+
+        uses_process_pool = self.uses_process_pool(task_type)
+        if uses_process_pool:
+            pool_size = self.config.process_pool_size
+        else:
+            pool_size = self.config.thread_pool_size
+        with self._lock:
+            in_pool = sum(
+                count for inflight_type, count in self._inflight_by_type.items()
+                if self.uses_process_pool(inflight_type) == uses_process_pool
+            )
+        return pool_size - in_pool
+
+    def _dispatch(self, task: Task):
+        if self.uses_process_pool(task.type):
+            future = self._process_pool.submit(_process_in_child, task)
+        else:
+            future = self._thread_pool.submit(self._process_in_thread, task)
+
+        with self._lock:
+            self._inflight[future] = task
+            self._inflight_by_type[task.type] = self._inflight_by_type.get(task.type, 0) + 1
+            self._lease_renewed_at[task.lease_id] = (task, time.monotonic())
+
+        future.add_done_callback(self._on_done)
+
+    def _process_in_thread(self, task: Task) -> Dict[str, Any]:
+        return self._get_processor(task.type).process(task)
+
+    def _get_processor(self, task_type: TaskType) -> BaseTaskProcessor:
+        with self._lock:
+            if task_type not in self._processors:
+                self._processors[task_type] = self.registry[task_type](self.db, self.task_queue)
+            return self._processors[task_type]
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            task = self._inflight.pop(future)
+            self._inflight_by_type[task.type] -= 1
+            self._lease_renewed_at.pop(task.lease_id, None)
+
+            error = future.exception()
+            if error is None:
+                self._results[task.lease_id] = (task, future.result())
+            else:
+                logger.error(f"Task {task.id} of type {task.type.value} failed: {error}")
+                self._errors[task.lease_id] = (task, str(error))
+
+        # Wake the claim loop to record the outcome and use the freed capacity
+        self.task_queue.notifier.notify()
+
+    def _flush_results(self):
+        """Record finished tasks with one batched write per outcome"""
+
+        with self._lock:
+            results, self._results = self._results, {}
+            errors, self._errors = self._errors, {}
+
+        worker_id = self.task_queue.worker_id
+        try:
+            if results:
+                outcomes, lease_ids = _by_task_id(results.values())
+                self.task_queue.complete_batch(outcomes, worker_id=worker_id, lease_ids=lease_ids)
+                results = {}
+            if errors:
+                outcomes, lease_ids = _by_task_id(errors.values())
+                self.task_queue.fail_batch(outcomes, worker_id=worker_id, lease_ids=lease_ids)
+                errors = {}
+        except Exception:
+            # Keep the unrecorded outcomes for the next flush; tasks finished since are kept too
+            with self._lock:
+                self._results = {**results, **self._results}
+                self._errors = {**errors, **self._errors}
+            raise
+
+    def _drain_cycle(self):
+        """Record finished tasks and renew the leases of running ones, logging rather than raising"""
+
+        try:
+            self._flush_results()
+            self._renew_leases()
+        except Exception as e:
+            logger.exception(f"Recording results while draining failed: {e}")
+
+    def _renew_leases(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                task for task, renewed_at in self._lease_renewed_at.values()
+                if now - renewed_at >= self.config.lease_renewal_seconds
+            ]
+            for task in due:
+                self._lease_renewed_at[task.lease_id] = (task, now)
+
+        for task in due:
+            if not self.task_queue.renew_lease(task.id, lease_id=task.lease_id):
+                logger.warning(f"Lost the lease on task {task.id}; its result will be discarded")
+
+def _by_task_id(outcomes) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Split (task, outcome) pairs into outcomes and lease ids keyed by task id.
+
+    Two claims of one task can both finish before a flush; only the newer
+    claim can still hold the lease, so the older outcome is dropped here.
+    """
+    latest: Dict[str, Tuple[Task, Any]] = {}
+    for task, outcome in outcomes:
+        current = latest.get(task.id)
+        if current is not None:
+            logger.warning(f"Discarding the result of an earlier claim of task {task.id}")
+            if current[0].started_at > task.started_at:
+                continue
+        latest[task.id] = (task, outcome)
+    return (
+        {task_id: outcome for task_id, (_, outcome) in latest.items()},
+        {task_id: task.lease_id for task_id, (task, _) in latest.items()}
+    )
+
+# Per-process state for the CPU-bound pool
+_child_db = None
+_child_registry: Dict[TaskType, Type[BaseTaskProcessor]] = {}
+_child_processors: Dict[TaskType, BaseTaskProcessor] = {}
+
+def _init_process_worker(registry: Dict[TaskType, Type[BaseTaskProcessor]]):
+    """Initialise Firebase clients once per pool process"""
+    global _child_db, _child_registry
+    _init_firebase()
+    _child_db = firestore.client()
+    _child_registry = registry
+
+def _process_in_child(task: Task) -> Dict[str, Any]:
+    processor = _child_processors.get(task.type)
+    if processor is None:
+        processor = _child_registry[task.type](_child_db, TaskQueue(_child_db))
+        _child_processors[task.type] = processor
+    return processor.process(task)
+
+def _init_firebase():
+    """Initialize Firebase Admin if not already done"""
+    import firebase_admin
+    from firebase_admin import credentials
+
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app(credentials.ApplicationDefault(), {
+            'storageBucket': os.getenv('FIREBASE_STORAGE_BUCKET', 'taxfront.appspot.com')
+        })
+
+if __name__ == "__main__":
+    _init_firebase()
+    db = firestore.client()
+    task_queue = TaskQueue(db, notifier=FirestoreTaskNotifier(db))
+    worker = TaskWorker(task_queue, db)
+    # Claims promote due tasks too, but a worker whose pools are full stops claiming
+    scheduler = DelayedTaskScheduler(task_queue)
+    worker.install_signal_handlers()
+    scheduler.start()
+    try:
+        worker.run()
+    finally:
+        scheduler.stop()
+        task_queue.notifier.close()